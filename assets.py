@@ -0,0 +1,56 @@
+"""Fingerprinted static files.
+
+Templates link CSS and JS through `asset_url('css/app.css')`, which adds the
+file's content digest: /static/css/app.css?v=3f2a1c9e0b7d. A browser that
+has seen a URL never needs to ask for it again, so a request whose `v`
+matches the file on disk gets a one-year immutable Cache-Control. A deploy
+that changes a file changes its digest, and so its URL and the page ETags
+(page_cache.BUILD covers the static folder). Requests without `v`, or with
+a stale one, fall back to revalidation, so an old page never pins new
+content under its old URL.
+
+Digests are memoized per (file, mtime), so editing a file during development
+is picked up without a restart.
+"""
+import hashlib
+import os
+
+from flask import current_app, request, url_for
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_digests = {}
+
+
+def digest(filename):
+    """Short content hash of a file under the static folder."""
+    path = os.path.join(current_app.static_folder, filename)
+    key = (path, os.stat(path).st_mtime_ns)
+    value = _digests.get(key)
+    if value is None:
+        with open(path, 'rb') as fh:
+            value = _digests[key] = hashlib.sha256(fh.read()).hexdigest()[:12]
+    return value
+
+
+def asset_url(filename):
+    return url_for('static', filename=filename, v=digest(filename))
+
+
+def init_app(app):
+    app.add_template_global(asset_url)
+
+    @app.after_request
+    def cache_static(response):
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        version = request.args.get('v')
+        try:
+            current = version and digest(request.view_args['filename'])
+        except OSError:
+            current = None
+        if version and version == current:
+            response.headers['Cache-Control'] = IMMUTABLE
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,152 @@
+"""Measure hierarchy lookup latency with and without the model indexes.
+
+Builds a throwaway SQLite database shaped like a large LearnBoard library
+(1M tasks by default), times the lookups the routes and the CSV importer run,
+then creates the indexes declared in models.py and times them again.
+
+    python benchmarks/bench_indexes.py
+    python benchmarks/bench_indexes.py --sheets 100 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from models import db  # noqa: E402
+
+LOOKUPS = {
+    'new_task max(task_order)': ('SELECT max(task_order) FROM tasks WHERE box_id = ?', 'box'),
+    'import task match': ('SELECT id FROM tasks WHERE box_id = ? AND task_order = ?', 'box_task'),
+    'new_box max(box_number)': ('SELECT max(box_number) FROM boxes WHERE section_id = ?', 'section'),
+    'import box match': ('SELECT id FROM boxes WHERE section_id = ? AND box_number = ?', 'section_box'),
+    'sheet sections': ('SELECT id FROM sections WHERE sheet_id = ? ORDER BY section_order', 'sheet'),
+    'new_sheet max(order)': ('SELECT max("order") FROM sheets WHERE chapter_id = ?', 'chapter'),
+    'sheet tree tasks': ('SELECT tasks.id FROM tasks JOIN boxes ON tasks.box_id = boxes.id '
+                         'JOIN sections ON boxes.section_id = sections.id WHERE sections.sheet_id = ?',
+                         'sheet'),
+}
+
+
+def build(path, args):
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    index_names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+    for name in index_names:
+        conn.execute(f'DROP INDEX "{name}"')
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+
+    chapters = max(1, args.sheets // 10)
+    conn.execute("INSERT INTO categories (id, name) VALUES (1, 'Bench')")
+    conn.execute("INSERT INTO books (id, name, category_id) VALUES (1, 'Bench', 1)")
+    conn.executemany('INSERT INTO chapters (id, name, book_id, "order") VALUES (?, ?, 1, ?)',
+                     ((c, f'Chapter {c}', c) for c in range(1, chapters + 1)))
+    conn.executemany('INSERT INTO sheets (id, name, chapter_id, "order") VALUES (?, ?, ?, ?)',
+                     ((s, f'Sheet {s}', (s - 1) % chapters + 1, s) for s in range(1, args.sheets + 1)))
+    sections = args.sheets * args.sections
+    conn.executemany('INSERT INTO sections (id, level_name, section_order, sheet_id) VALUES (?, ?, ?, ?)',
+                     ((i, f'Level {(i - 1) % args.sections + 1}', (i - 1) % args.sections + 1,
+                       (i - 1) // args.sections + 1) for i in range(1, sections + 1)))
+    boxes = sections * args.boxes
+    conn.executemany('INSERT INTO boxes (id, box_number, box_title, section_id) VALUES (?, ?, ?, ?)',
+                     ((i, (i - 1) % args.boxes + 1, f'Box {i}', (i - 1) // args.boxes + 1)
+                      for i in range(1, boxes + 1)))
+    tasks = boxes * args.tasks
+    conn.executemany('INSERT INTO tasks (id, task_order, task_text, box_id) VALUES (?, ?, ?, ?)',
+                     ((i, (i - 1) % args.tasks + 1, f'Task {i}', (i - 1) // args.tasks + 1)
+                      for i in range(1, tasks + 1)))
+    conn.commit()
+    sizes = {'sheets': args.sheets, 'chapters': chapters, 'sections': sections, 'boxes': boxes, 'tasks': tasks}
+    return conn, index_names, sizes
+
+
+def params_for(kind, sizes, args, rng):
+    if kind == 'box':
+        return (rng.randint(1, sizes['boxes']),)
+    if kind == 'box_task':
+        return (rng.randint(1, sizes['boxes']), rng.randint(1, args.tasks))
+    if kind == 'section':
+        return (rng.randint(1, sizes['sections']),)
+    if kind == 'section_box':
+        return (rng.randint(1, sizes['sections']), rng.randint(1, args.boxes))
+    if kind == 'sheet':
+        return (rng.randint(1, sizes['sheets']),)
+    return (rng.randint(1, sizes['chapters']),)
+
+
+def time_lookups(conn, sizes, args):
+    results = {}
+    for name, (sql, kind) in LOOKUPS.items():
+        rng = random.Random(name)
+        samples = []
+        for _ in range(args.repeat):
+            params = params_for(kind, sizes, args, rng)
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            samples.append((time.perf_counter() - started) * 1e6)
+        samples.sort()
+        results[name] = {
+            'median_us': round(statistics.median(samples), 1),
+            'p95_us': round(samples[int(len(samples) * 0.95) - 1], 1),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sheets', type=int, default=1000)
+    parser.add_argument('--sections', type=int, default=5, help='sections per sheet')
+    parser.add_argument('--boxes', type=int, default=20, help='boxes per section')
+    parser.add_argument('--tasks', type=int, default=10, help='tasks per box')
+    parser.add_argument('--repeat', type=int, default=50, help='samples per lookup')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        conn, index_names, sizes = build(path, args)
+        print(f"Built {sizes['tasks']:,} tasks in {time.perf_counter() - started:.1f}s")
+
+        before = time_lookups(conn, sizes, args)
+
+        started = time.perf_counter()
+        engine = create_engine(f'sqlite:///{path}')
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in index_names:
+                    index.create(engine)
+        engine.dispose()
+        index_build = time.perf_counter() - started
+        conn.execute('ANALYZE')
+        after = time_lookups(conn, sizes, args)
+        conn.close()
+
+    print(f'Index build: {index_build:.1f}s\n')
+    print(f"{'lookup':<28}{'no index (median/p95 us)':>28}{'indexed (median/p95 us)':>28}{'speedup':>10}")
+    for name in LOOKUPS:
+        b, a = before[name], after[name]
+        speedup = b['median_us'] / a['median_us'] if a['median_us'] else float('inf')
+        print(f"{name:<28}{b['median_us']:>16,.1f} /{b['p95_us']:>10,.1f}"
+              f"{a['median_us']:>16,.1f} /{a['p95_us']:>10,.1f}{speedup:>9.0f}x")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({'sizes': sizes, 'index_build_s': round(index_build, 2),
+                       'without_indexes': before, 'with_indexes': after}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
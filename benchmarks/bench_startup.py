@@ -0,0 +1,156 @@
+"""Measure cold-start time: importing the app, building it, first response.
+
+Every sample runs in a fresh interpreter against a generated library, the
+way a container or a new gunicorn worker starts. The in-process run reports
+the median of:
+
+    import_ms          import app (plus everything it imports)
+    create_app_ms      create_app()
+    first_request_ms   the first GET / through the test client
+
+The gunicorn run starts the server with gunicorn.conf.py and reports the
+time until GET / first answers 200, and until every worker has answered.
+
+--root points at another checkout, e.g. a `git worktree` of an older commit,
+to compare against it. Trees from before the application factory build the
+app (and check the schema) while being imported, so for them import_ms
+covers both and create_app_ms is 0.
+
+    python benchmarks/bench_startup.py --size small --samples 10
+    python benchmarks/bench_startup.py --root ../learnboard-old --gunicorn-workers 4
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import datagen  # noqa: E402
+from bench_toggle_workers import free_port  # noqa: E402
+
+SAMPLE = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+app = module.create_app() if hasattr(module, 'create_app') else module.app
+created = time.perf_counter()
+status = app.test_client().get('/').status_code
+answered = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (answered - created) * 1000, 'status': status}}))
+'''
+
+
+def has_factory(root):
+    with open(os.path.join(root, 'app.py')) as f:
+        return 'def create_app(' in f.read()
+
+
+def init_db(root, env):
+    """Run the deploy-time schema step once, outside the measured starts."""
+    if has_factory(root):
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                       env=env, cwd=root, check=True, capture_output=True)
+
+
+def in_process(root, env, samples):
+    results = []
+    for _ in range(samples):
+        out = subprocess.run([sys.executable, '-c', SAMPLE.format(root=root)],
+                             env=env, cwd=root, check=True, capture_output=True, text=True).stdout
+        result = json.loads(out.splitlines()[-1])
+        if result.pop('status') != 200:
+            raise RuntimeError('GET / failed')
+        results.append(result)
+    return {key: statistics.median(result[key] for result in results) for key in results[0]}
+
+
+def answered(port):
+    """GET / on a fresh connection; True on a 200, False while the server is not up yet."""
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        conn.request('GET', '/')
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+    except OSError:
+        return False
+    return response.status == 200
+
+
+def gunicorn(root, env, workers, timeout=60):
+    """Seconds from spawning gunicorn until its first 200, and until `workers` forked workers are up."""
+    port = free_port()
+    target = [] if has_factory(root) else ['app:app']
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'info', '--access-logfile', '-', '--access-logformat', '%(p)s'] + target,
+        env=env, cwd=root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    try:
+        first = None
+        pids = set()
+        while time.perf_counter() - started < timeout:
+            if answered(port):
+                first = time.perf_counter() - started
+                break
+            time.sleep(0.01)
+        if first is None:
+            raise RuntimeError(f'gunicorn did not answer on port {port}')
+        # Each access log line names the worker that served it; new connections spread over the workers
+        all_up = None
+        while time.perf_counter() - started < timeout:
+            answered(port)
+            line = proc.stdout.readline().strip()
+            if line:
+                pids.add(line)
+            if len(pids) >= workers:
+                all_up = time.perf_counter() - started
+                break
+        return first, all_up
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default=ROOT, help='checkout to start (default: this one)')
+    parser.add_argument('--size', choices=sorted(datagen.PRESETS), default='small')
+    parser.add_argument('--samples', type=int, default=7, help='fresh interpreters per in-process run')
+    parser.add_argument('--gunicorn-workers', type=int, default=0, help='also time a gunicorn start (0: skip)')
+    args = parser.parse_args()
+    root = os.path.abspath(args.root)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        datagen.generate(path, datagen.PRESETS[args.size])
+        env = dict(os.environ, LEARNBOARD_DATABASE_URI=f'sqlite:///{path}')
+        init_db(root, env)
+        # Warm the bytecode and OS caches so every sample measures the same thing
+        in_process(root, env, 1)
+
+        result = in_process(root, env, args.samples)
+        print(f"{'import ms':>10}{'create_app ms':>15}{'first request ms':>18}{'total ms':>10}")
+        print(f"{result['import_ms']:>10.1f}{result['create_app_ms']:>15.1f}"
+              f"{result['first_request_ms']:>18.1f}{sum(result.values()):>10.1f}")
+
+        if args.gunicorn_workers:
+            first, all_up = gunicorn(root, env, args.gunicorn_workers)
+            all_up = f'{all_up:.2f}s' if all_up is not None else 'timed out'
+            print(f'\ngunicorn, {args.gunicorn_workers} worker(s): first response after {first:.2f}s, '
+                  f'all workers serving after {all_up}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Load-test POST /api/task/<id>/toggle against gunicorn with 1..N workers.
+
+Seeds a throwaway SQLite database with one imported sheet, then for each
+worker count starts gunicorn on it and hammers the toggle endpoint from
+concurrent keep-alive clients for a fixed time, reporting throughput,
+latency percentiles and failed requests ("database is locked" shows up as
+HTTP 500). `--legacy` repeats every run with the pre-tuning SQLite settings
+(rollback journal, synchronous=FULL, no busy timeout) for comparison.
+
+    python benchmarks/bench_toggle_workers.py --workers 1 2 4 8
+"""
+import argparse
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+LEGACY_SQLITE = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_BUSY_TIMEOUT': '0',
+}
+
+
+def seed(env, tasks):
+    """Create one sheet with `tasks` tasks through the app itself; return the task ids."""
+    script = f'''
+import sys
+sys.path.insert(0, {ROOT!r})
+from app import create_app, init_db
+from models import db, Category, Book, Chapter, Sheet, Task
+import importer
+app = create_app()
+with app.app_context():
+    init_db()
+    book = Book(name='Bench', category=Category(name='Bench'))
+    sheet = Sheet(name='Bench', chapter=Chapter(name='Bench', book=book))
+    db.session.add(sheet)
+    db.session.commit()
+    rows = [dict(level=f'Nivel {{n // 250 + 1}}', section_order=str(n // 250 + 1),
+                 box_number=str(n % 250 // 10 + 1), box_title='Box', task_order=str(n % 10 + 1),
+                 task_text=f'Task {{n}}') for n in range({tasks})]
+    importer.CsvImporter(sheet.id).run(rows)
+    db.session.commit()
+    print(' '.join(str(t.id) for t in Task.query.all()))
+'''
+    out = subprocess.run([sys.executable, '-c', script], env=env, cwd=ROOT,
+                         check=True, capture_output=True, text=True).stdout
+    return [int(x) for x in out.split()]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'gunicorn did not start on port {port}')
+
+
+def hammer(port, task_ids, clients, duration):
+    latencies, failures = [], []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(seed_):
+        rng = random.Random(seed_)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local_lat, local_fail = [], 0
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                conn.request('POST', f'/api/task/{rng.choice(task_ids)}/toggle')
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                ok = False
+            if ok:
+                local_lat.append(time.perf_counter() - started)
+            else:
+                local_fail += 1
+        conn.close()
+        with lock:
+            latencies.extend(local_lat)
+            failures.append(local_fail)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 if latencies else 0.0
+    return {
+        'ok': len(latencies),
+        'failed': sum(failures),
+        'rps': len(latencies) / duration,
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+    }
+
+
+def run(workers, env, task_ids, args):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning'],
+        env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(port)
+        hammer(port, task_ids, args.clients, 1)  # warm up every worker
+        return hammer(port, task_ids, args.clients, args.duration)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=16, help='concurrent HTTP clients')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+    parser.add_argument('--tasks', type=int, default=1000, help='tasks in the seeded sheet')
+    parser.add_argument('--legacy', action='store_true', help='also run with the old SQLite settings')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, LEARNBOARD_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        task_ids = seed(env, args.tasks)
+        configs = [('tuned', env)]
+        if args.legacy:
+            configs.append(('legacy', dict(env, **LEGACY_SQLITE)))
+
+        print(f"{'config':<8}{'workers':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'failed':>8}")
+        for name, config_env in configs:
+            for workers in args.workers:
+                result = run(workers, config_env, task_ids, args)
+                print(f"{name:<8}{workers:>8}{result['rps']:>10.0f}{result['p50_ms']:>9.1f}"
+                      f"{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}{result['failed']:>8}")
+
+
+if __name__ == '__main__':
+    main()
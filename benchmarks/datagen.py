@@ -0,0 +1,239 @@
+"""Generate synthetic LearnBoard libraries of any size.
+
+Builds Category -> Book -> Chapter -> Sheet -> Section -> Box -> Task trees,
+plus notes per section and a share of tasks completed by the default learner. The shape is a fan-out
+per level. Rows go in through batched executemany INSERTs with precomputed
+ids and progress counters, so millions of tasks take seconds rather than
+going through the ORM. Task texts come from a small command vocabulary, so
+full-text search has realistic terms to match.
+
+    python benchmarks/datagen.py library.db --size large
+    python benchmarks/datagen.py library.db --books 3 --sheets 20 --tasks 12 --completed 0.5
+
+The same Generator can add subtrees to a live app database through
+db.session (see benchmarks/suite.py), since it only needs an `executemany`.
+Run `flask init-db` against a generated file once to build the search index
+and the sheet snapshots.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from models import db  # noqa: E402
+import learners  # noqa: E402
+
+LEVELS = ['categories', 'books', 'chapters', 'sheets', 'sections', 'boxes', 'tasks', 'notes']
+# Insert order: parents before children, so foreign keys hold at every flush
+TABLES = ['learners', 'categories', 'books', 'chapters', 'sheets', 'sections', 'boxes', 'tasks', 'sheet_progress',
+          'notes']
+
+# Children per parent at every level ('categories' is the number of roots)
+PRESETS = {
+    'small': {'categories': 1, 'books': 1, 'chapters': 2, 'sheets': 5,
+              'sections': 5, 'boxes': 10, 'tasks': 5, 'notes': 1},
+    'medium': {'categories': 1, 'books': 2, 'chapters': 5, 'sheets': 10,
+               'sections': 5, 'boxes': 20, 'tasks': 10, 'notes': 1},
+    'large': {'categories': 2, 'books': 5, 'chapters': 10, 'sheets': 10,
+              'sections': 5, 'boxes': 20, 'tasks': 10, 'notes': 2},
+}
+
+LEVEL_NAMES = ['Nivel Básico', 'Nivel Intermedio', 'Nivel Avanzado', 'Nivel Experto', 'Reto Final']
+COMMANDS = ['ssh', 'scp', 'rsync', 'grep', 'awk', 'sed', 'find', 'chmod', 'chown', 'tar', 'curl',
+            'systemctl', 'journalctl', 'iptables', 'ip', 'ss', 'lsof', 'ps', 'kill', 'crontab',
+            'useradd', 'passwd', 'mount', 'df', 'du', 'git', 'docker', 'openssl', 'ssh-keygen', 'dig']
+VERBS = ['Ejecute', 'Revise', 'Configure', 'Compruebe', 'Liste', 'Copie', 'Elimine', 'Filtre']
+TARGETS = ['el servidor', 'los logs', 'el archivo de configuración', 'los permisos', 'el usuario',
+           'la red', 'el servicio', 'el directorio home', 'las llaves', 'el firewall']
+CREATED_AT = '2026-01-01 00:00:00.000000'
+
+
+def shape_total(shape, level):
+    """Number of rows a full generate() creates at `level`."""
+    total = 1
+    for name in LEVELS[:LEVELS.index(level) + 1]:
+        if name != 'notes':
+            total *= shape[name]
+    if level == 'notes':
+        total = shape_total(shape, 'sections') * shape['notes']
+    return total
+
+
+class BulkWriter:
+    """Buffer rows per table and write them with executemany, parents first."""
+
+    def __init__(self, executemany, batch=20000):
+        self.executemany = executemany
+        self.batch = batch
+        self.rows = {table: [] for table in TABLES}
+        self.pending = 0
+        self.written = {table: 0 for table in TABLES}
+
+    def add(self, table, row):
+        self.rows[table].append(row)
+        self.pending += 1
+        if self.pending >= self.batch:
+            self.flush()
+
+    def flush(self):
+        for table in TABLES:
+            rows = self.rows[table]
+            if not rows:
+                continue
+            columns = list(rows[0])
+            names = ', '.join('"' + column + '"' for column in columns)
+            params = ', '.join(':' + column for column in columns)
+            sql = f'INSERT INTO {table} ({names}) VALUES ({params})'
+            self.executemany(sql, rows)
+            self.written[table] += len(rows)
+            self.rows[table] = []
+        self.pending = 0
+
+
+class Generator:
+    """Emit rows for subtrees of the given shape, numbering ids from `first_ids`."""
+
+    def __init__(self, writer, shape, first_ids=None, seed=0, completed=0.3, learner_id=1):
+        self.writer = writer
+        self.learner_id = learner_id
+        self.shape = shape
+        self.rng = random.Random(seed)
+        self.completed = completed
+        self.next_ids = {table: 1 for table in TABLES}
+        self.next_ids.update(first_ids or {})
+
+    def _id(self, table):
+        id_ = self.next_ids[table]
+        self.next_ids[table] += 1
+        return id_
+
+    def _task_text(self):
+        rng = self.rng
+        return (f'{rng.choice(VERBS)} {rng.choice(TARGETS)} con {rng.choice(COMMANDS)} '
+                f'-{rng.choice("abcdefhlnrv")} #{rng.randrange(10000)}')
+
+    def category(self):
+        id_ = self._id('categories')
+        self.writer.add('categories', {'id': id_, 'name': f'Categoría {id_}', 'description': '',
+                                       'created_at': CREATED_AT})
+        for _ in range(self.shape['books']):
+            self.book(id_)
+        return id_
+
+    def book(self, category_id):
+        id_ = self._id('books')
+        self.writer.add('books', {'id': id_, 'name': f'Libro {id_}', 'description': '',
+                                  'category_id': category_id, 'created_at': CREATED_AT})
+        for number in range(1, self.shape['chapters'] + 1):
+            self.chapter(id_, number)
+        return id_
+
+    def chapter(self, book_id, order=1):
+        id_ = self._id('chapters')
+        self.writer.add('chapters', {'id': id_, 'name': f'Capítulo {id_}', 'description': '',
+                                     'book_id': book_id, 'order': order, 'created_at': CREATED_AT})
+        for number in range(1, self.shape['sheets'] + 1):
+            self.sheet(id_, number)
+        return id_
+
+    def sheet(self, chapter_id, order=1):
+        id_ = self._id('sheets')
+        per_section = self.shape['boxes'] * self.shape['tasks']
+        flags = [[self.rng.random() < self.completed for _ in range(per_section)]
+                 for _ in range(self.shape['sections'])]
+        total = per_section * len(flags)
+        self.writer.add('sheets', {'id': id_, 'name': f'Hoja {id_}', 'chapter_id': chapter_id,
+                                   'order': order, 'created_at': CREATED_AT,
+                                   'total_tasks': total, 'next_bit': total})
+        for number, section_flags in enumerate(flags, start=1):
+            self.section(id_, number, (number - 1) * per_section, section_flags)
+        # Tasks are numbered in generation order, so bit n is the n-th flag
+        bits = sum(1 << bit for bit, done in enumerate(flag for row in flags for flag in row) if done)
+        if bits:
+            self.writer.add('sheet_progress', {'learner_id': self.learner_id, 'sheet_id': id_,
+                                               'bits': bits.to_bytes((bits.bit_length() + 7) // 8, 'little'),
+                                               'completed': bits.bit_count(), 'updated_at': CREATED_AT})
+        return id_
+
+    def section(self, sheet_id, order, first_bit, flags):
+        id_ = self._id('sections')
+        self.writer.add('sections', {'id': id_, 'level_name': LEVEL_NAMES[(order - 1) % len(LEVEL_NAMES)],
+                                     'section_order': order, 'sheet_id': sheet_id, 'total_tasks': len(flags)})
+        bit = first_bit
+        for number in range(1, self.shape['boxes'] + 1):
+            box_id = self._id('boxes')
+            self.writer.add('boxes', {'id': box_id, 'box_number': number, 'box_title': f'Box {number}',
+                                      'section_id': id_})
+            for task_order in range(1, self.shape['tasks'] + 1):
+                task_id = self._id('tasks')
+                self.writer.add('tasks', {'id': task_id, 'task_order': task_order,
+                                          'task_text': self._task_text(), 'box_id': box_id, 'bit_index': bit})
+                bit += 1
+        for _ in range(self.shape['notes']):
+            note_id = self._id('notes')
+            content = f'## Nota {note_id}\n\nUse `{self.rng.choice(COMMANDS)}` con cuidado.'
+            self.writer.add('notes', {'id': note_id, 'content_markdown': content, 'section_id': id_,
+                                      'created_at': CREATED_AT, 'updated_at': CREATED_AT})
+        return id_
+
+
+def first_ids(scalar):
+    """Next free id per table, given a function that runs a scalar query."""
+    return {table: (scalar(f'SELECT coalesce(max(id), 0) + 1 FROM {table}'))
+            for table in TABLES if table != 'sheet_progress'}
+
+
+def generate(path, shape, seed=0, completed=0.3):
+    """Create `path` with the app schema and fill it. Returns rows written per table."""
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    writer = BulkWriter(conn.executemany)
+    generator = Generator(writer, shape, first_ids(lambda sql: conn.execute(sql).fetchone()[0]),
+                          seed=seed, completed=completed)
+    writer.add('learners', {'id': generator._id('learners'), 'name': learners.DEFAULT_NAME,
+                            'created_at': CREATED_AT})
+    for _ in range(shape['categories']):
+        generator.category()
+    writer.flush()
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return writer.written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='SQLite file to create (must not exist)')
+    parser.add_argument('--size', choices=sorted(PRESETS), default='medium')
+    for level in LEVELS:
+        parser.add_argument(f'--{level}', type=int, help=f'override {level} per parent')
+    parser.add_argument('--completed', type=float, default=0.3, help='share of completed tasks')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        parser.error(f'{args.path} already exists')
+    shape = dict(PRESETS[args.size])
+    shape.update({level: getattr(args, level) for level in LEVELS if getattr(args, level) is not None})
+    if shape['boxes'] > 25:
+        parser.error('sheets hold at most 25 boxes per section')
+
+    print(f"Generating {shape_total(shape, 'tasks'):,} tasks in {shape_total(shape, 'sheets'):,} sheets...")
+    started = time.perf_counter()
+    written = generate(args.path, shape, seed=args.seed, completed=args.completed)
+    print(f'Done in {time.perf_counter() - started:.1f}s: '
+          + ', '.join(f'{count:,} {table}' for table, count in written.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Repeatable request benchmarks against a synthetic library.
+
+Generates a library with benchmarks/datagen.py (or copies --db), starts the
+app on it and drives the Flask test client through the hot paths:
+
+    index              GET /, page caches cleared first (full render)
+    view_sheet         GET /sheet/<id>, page caches cleared first
+    view_sheet_cached  GET /sheet/<id> served from the rendered-page cache
+    view_sheet_304     conditional GET /sheet/<id> with a matching ETag
+    toggle_task        POST /api/task/<id>/toggle on random tasks
+    import_csv         POST /sheet/<id>/import of --import-rows rows into a new sheet
+    delete_sheet       POST /sheet/<id>/delete of a freshly generated sheet
+    delete_chapter     ... chapter
+    delete_book        ... book
+
+For every scenario it reports latency percentiles, SQL statements per request,
+and the tracemalloc peak and body size on the wire (the client asks for
+gzip/brotli like a browser) of one extra, separately measured request. Results
+can be saved as a JSON baseline and later runs compared against it. The
+comparison fails (exit status 1) when a scenario's median slows down by more
+than --tolerance or when it runs more SQL statements than the baseline.
+Query counts do not depend on the machine, so they are the safest CI gate.
+
+    python benchmarks/suite.py --size small --save baseline.json
+    python benchmarks/suite.py --size small --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import datagen  # noqa: E402
+
+# Subtrees generated for every delete sample
+DELETE_SHAPE = {'categories': 1, 'books': 1, 'chapters': 2, 'sheets': 5,
+                'sections': 5, 'boxes': 20, 'tasks': 10, 'notes': 1}
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Bench:
+    def __init__(self, args):
+        # The app reads its database from the environment when it is created
+        from sqlalchemy import event, text
+        from app import create_app, init_db
+        from models import db
+        import compression
+        import page_cache
+        app = create_app()
+        self.app, self.db, self.text, self.page_cache = app, db, text, page_cache
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.client = app.test_client()
+        # Ask for compressed bodies like a browser does, so wire_kib is what a browser downloads
+        self.client.environ_base['HTTP_ACCEPT_ENCODING'] = 'gzip, br'
+        self.caches = (page_cache.cache, compression.cache)
+        self.queries = 0
+        with app.app_context():
+            init_db()
+            event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def scalar(self, sql):
+        with self.app.app_context():
+            return self.db.session.execute(self.text(sql)).scalar()
+
+    def generate(self, level, parent_id):
+        """Add a DELETE_SHAPE subtree under `parent_id` and return the id of its top row."""
+        with self.app.app_context():
+            session = self.db.session
+            writer = datagen.BulkWriter(lambda sql, rows: session.execute(self.text(sql), rows))
+            generator = datagen.Generator(
+                writer, DELETE_SHAPE, datagen.first_ids(lambda sql: session.execute(self.text(sql)).scalar()),
+                seed=self.rng.random())
+            id_ = {'book': generator.book, 'chapter': generator.chapter, 'sheet': generator.sheet}[level](parent_id)
+            writer.flush()
+            session.commit()
+            return id_
+
+    def new_sheet(self):
+        chapter_id = self.scalar('SELECT min(id) FROM chapters')
+        with self.app.app_context():
+            from models import Sheet
+            sheet = Sheet(name='Bench import', chapter_id=chapter_id, order=0)
+            self.db.session.add(sheet)
+            self.db.session.commit()
+            return sheet.id
+
+    def measure(self, request, setup=lambda: None, repeat=None):
+        latencies, query_counts = [], []
+        for _ in range(repeat or self.args.repeat):
+            arg = setup()
+            self.queries = 0
+            started = time.perf_counter()
+            response = request(arg)
+            latencies.append((time.perf_counter() - started) * 1000)
+            query_counts.append(self.queries)
+            if response.status_code >= 400:
+                raise RuntimeError(f'HTTP {response.status_code}')
+
+        arg = setup()
+        tracemalloc.start()
+        response = request(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            'samples': len(latencies),
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'max_ms': round(max(latencies), 3),
+            'queries_median': statistics.median(query_counts),
+            'queries_max': max(query_counts),
+            'peak_kib': round(peak / 1024, 1),
+            'wire_kib': round(len(response.get_data()) / 1024, 1),
+        }
+
+    def run(self):
+        client, heavy = self.client, self.args.repeat_heavy
+        sheet_id = self.scalar('SELECT min(id) FROM sheets')
+        task_ids = self._task_ids(sheet_id)
+        def clear():
+            for cache in self.caches:
+                cache.clear()
+        csv_text = self._csv(self.args.import_rows)
+        etag = client.get(f'/sheet/{sheet_id}').headers.get('ETag')
+
+        return {
+            'index': self.measure(lambda _: client.get('/'), clear),
+            'view_sheet': self.measure(lambda _: client.get(f'/sheet/{sheet_id}'), clear),
+            'view_sheet_cached': self.measure(lambda _: client.get(f'/sheet/{sheet_id}')),
+            'view_sheet_304': self.measure(
+                lambda _: client.get(f'/sheet/{sheet_id}', headers={'If-None-Match': etag})),
+            'toggle_task': self.measure(lambda task_id: client.post(f'/api/task/{task_id}/toggle'),
+                                        lambda: self.rng.choice(task_ids)),
+            'import_csv': self.measure(
+                lambda id_: client.post(f'/sheet/{id_}/import', data={'csv_text': csv_text}),
+                self.new_sheet, heavy),
+            'delete_sheet': self.measure(
+                lambda id_: client.post(f'/sheet/{id_}/delete'),
+                lambda: self.generate('sheet', self.scalar('SELECT min(id) FROM chapters')), heavy),
+            'delete_chapter': self.measure(
+                lambda id_: client.post(f'/chapter/{id_}/delete'),
+                lambda: self.generate('chapter', self.scalar('SELECT min(id) FROM books')), heavy),
+            'delete_book': self.measure(
+                lambda id_: client.post(f'/book/{id_}/delete'),
+                lambda: self.generate('book', self.scalar('SELECT min(id) FROM categories')), heavy),
+        }
+
+    def _task_ids(self, sheet_id):
+        with self.app.app_context():
+            return self.db.session.execute(self.text(
+                'SELECT tasks.id FROM tasks JOIN boxes ON tasks.box_id = boxes.id '
+                'JOIN sections ON boxes.section_id = sections.id WHERE sections.sheet_id = :id'
+            ), {'id': sheet_id}).scalars().all()
+
+    def _csv(self, rows):
+        lines = ['level,section_order,box_number,box_title,task_order,task_text']
+        for n in range(rows):
+            section, box, task = n // 250 + 1, n % 250 // 10 + 1, n % 10 + 1
+            lines.append(f'Nivel {section},{section},{box},Box {box},{task},Tarea de prueba {n}')
+        return '\n'.join(lines)
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against a baseline; return the scenarios that regressed."""
+    regressions = []
+    print(f"\n{'scenario':<20}{'p50 base':>10}{'p50 now':>10}{'change':>9}{'queries':>12}")
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        change = now['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        slower = change > tolerance and now['p50_ms'] - base['p50_ms'] > 1.0
+        more_queries = now['queries_max'] > base['queries_max']
+        flag = '  <-- regression' if slower or more_queries else ''
+        print(f"{name:<20}{base['p50_ms']:>10.2f}{now['p50_ms']:>10.2f}{change:>+9.0%}"
+              f"{base['queries_max']:>6} ->{now['queries_max']:>3}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=sorted(datagen.PRESETS), default='small')
+    parser.add_argument('--db', help='benchmark a copy of this SQLite file instead of generating one')
+    parser.add_argument('--repeat', type=int, default=30, help='samples per read/toggle scenario')
+    parser.add_argument('--repeat-heavy', type=int, default=5, help='samples per import/delete scenario')
+    parser.add_argument('--import-rows', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='compare against a JSON file written by --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed median slowdown (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        if args.db:
+            shutil.copyfile(args.db, path)
+            dataset = {'db': os.path.basename(args.db)}
+        else:
+            datagen.generate(path, datagen.PRESETS[args.size], seed=args.seed)
+            dataset = {'size': args.size, 'shape': datagen.PRESETS[args.size]}
+        with sqlite3.connect(path) as conn:
+            dataset['tasks'] = conn.execute('SELECT count(*) FROM tasks').fetchone()[0]
+        os.environ['LEARNBOARD_DATABASE_URI'] = f'sqlite:///{path}'
+        bench = Bench(args)
+        print(f"Library with {dataset['tasks']:,} tasks ready in {time.perf_counter() - started:.1f}s")
+        results = bench.run()
+
+    print(f"\n{'scenario':<20}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}{'wire KiB':>10}")
+    for name, result in results.items():
+        print(f"{name:<20}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+              f"{result['queries_max']:>9}{result['peak_kib']:>10.0f}{result['wire_kib']:>10.1f}")
+
+    report = {
+        'meta': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                 'platform': platform.platform(), 'repeat': args.repeat,
+                 'repeat_heavy': args.repeat_heavy, 'import_rows': args.import_rows},
+        'dataset': dataset,
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Engine configuration: database URI, connection pool and SQLite pragmas.
+
+Everything is read from the environment so the same image can run a single
+dev server or several gunicorn workers:
+
+    LEARNBOARD_DATABASE_URI  SQLAlchemy URI (default sqlite:///learnboard.db,
+                             relative to the instance folder)
+    DB_POOL_SIZE             connections kept per worker process (default 5)
+    DB_MAX_OVERFLOW          extra connections allowed under bursts (default 10)
+    DB_POOL_TIMEOUT          seconds to wait for a free connection (default 30)
+                             (the DB_POOL_* settings are ignored for in-memory SQLite)
+    SQLITE_JOURNAL_MODE      default WAL, so readers never block behind writers
+    SQLITE_SYNCHRONOUS       default NORMAL (durable with WAL, far fewer fsyncs)
+    SQLITE_BUSY_TIMEOUT      milliseconds to wait on a locked database (default 5000)
+    SQLITE_MMAP_SIZE         bytes of the file to memory-map (default 256 MiB)
+    SQLITE_CACHE_SIZE        page cache in KiB per connection (default 65536)
+"""
+import os
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_URI = 'sqlite:///learnboard.db'
+READ_ONLY_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def database_uri():
+    return os.environ.get('LEARNBOARD_DATABASE_URI', DEFAULT_URI)
+
+
+def is_memory_sqlite(uri):
+    url = make_url(uri)
+    return (url.get_backend_name() == 'sqlite'
+            and (url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'))
+
+
+def engine_options(uri):
+    """Engine options for `uri`. Pool sizing only applies to pooled engines.
+
+    In-memory SQLite runs on a StaticPool (one shared connection), which
+    takes no pool_size, max_overflow or pool_timeout.
+    """
+    if is_memory_sqlite(uri):
+        return {}
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+    }
+
+
+def sqlite_pragmas():
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT', 5000),
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        # Negative values are KiB rather than pages
+        'cache_size': -_env_int('SQLITE_CACHE_SIZE', 64 * 1024),
+        'temp_store': 'MEMORY',
+    }
+
+
+def _wants_write_lock():
+    # Outside a request (CLI commands, background work) we are almost always writing
+    return not has_request_context() or request.method not in READ_ONLY_METHODS
+
+
+def install_sqlite_tuning(engine):
+    """Apply pragmas on every new connection and pick the transaction mode per request.
+
+    pysqlite's implicit deferred BEGIN upgrades a read lock to a write lock
+    halfway through a request, which fails straight away with "database is
+    locked" when another worker wrote in between; busy_timeout cannot help
+    there. So we take control of BEGIN: write requests start with BEGIN
+    IMMEDIATE and queue on busy_timeout, reads use a plain BEGIN and run
+    concurrently against the WAL snapshot.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        conn.exec_driver_sql('BEGIN IMMEDIATE' if _wants_write_lock() else 'BEGIN')
@@ -0,0 +1,66 @@
+"""Set-based deletes of whole subtrees.
+
+Deleting a container through the ORM cascade loads every descendant Book,
+Chapter, Sheet, Section, Box, Task and Note into the session,
+then issues one DELETE per object. Here each table is cleared instead with
+one `DELETE ... WHERE parent_id IN (SELECT ...)`, children first, so removing
+a book costs a handful of statements however many tasks it holds. Progress
+bitsets, live events and snapshots go with their sheets, and their queued or
+running background imports are marked failed in the same transaction, which
+tells the import thread to stop (see jobs.py).
+
+Nothing is loaded into the session. Callers must not use objects from the
+deleted subtree afterwards, and must run `page_cache.touch` and the search
+unindexing beforehand, while the rows still exist. Deleting a section or box
+leaves its sheet in place, so the caller also clears the deleted tasks' bits
+with `progress.clear_bits`.
+
+The relationships in models.py keep their ORM cascade without
+passive_deletes. The foreign keys carry no ON DELETE CASCADE and SQLite
+runs with foreign key enforcement off, so a passive ORM delete would
+leave the children behind as orphans instead of handing them to the
+database. Containers are only ever deleted through here.
+"""
+from datetime import datetime
+
+from sqlalchemy import delete, select, update
+
+from models import (db, Category, Book, Chapter, Sheet, Section, Box, Task, Note, SheetProgress, SheetEvent,
+                    SheetSnapshot, ImportJob)
+
+LEVELS = ['category', 'book', 'chapter', 'sheet', 'section', 'box', 'task']
+MODELS = {'category': Category, 'book': Book, 'chapter': Chapter, 'sheet': Sheet,
+          'section': Section, 'box': Box, 'task': Task}
+PARENT_KEYS = {'book': Book.category_id, 'chapter': Chapter.book_id, 'sheet': Sheet.chapter_id,
+               'section': Section.sheet_id, 'box': Box.section_id, 'task': Task.box_id}
+
+
+def delete_subtree(scope, id_):
+    """Delete one category, book, chapter, sheet, section or box and everything below it."""
+    if scope not in MODELS or scope == 'task':
+        raise ValueError(f'Unknown scope {scope!r}')
+    levels = LEVELS[LEVELS.index(scope):]
+
+    # Subqueries selecting the ids at every level of the subtree
+    ids = {scope: select(MODELS[scope].id).where(MODELS[scope].id == id_)}
+    for parent, level in zip(levels, levels[1:]):
+        ids[level] = select(MODELS[level].id).where(PARENT_KEYS[level].in_(ids[parent]))
+
+    statements = []
+    if 'sheet' in ids:
+        statements.append(delete(SheetProgress).where(SheetProgress.sheet_id.in_(ids['sheet'])))
+        statements.append(delete(SheetEvent).where(SheetEvent.sheet_id.in_(ids['sheet'])))
+        statements.append(delete(SheetSnapshot).where(SheetSnapshot.sheet_id.in_(ids['sheet'])))
+        statements.append(
+            update(ImportJob)
+            .where(ImportJob.sheet_id.in_(ids['sheet']), ImportJob.status.in_(('queued', 'running')))
+            .values(status='failed', error='Sheet deleted', finished_at=datetime.utcnow())
+        )
+    if 'section' in ids:
+        statements.append(delete(Note).where(Note.section_id.in_(ids['section'])))
+    for parent, level in reversed(list(zip(levels, levels[1:]))):
+        statements.append(delete(MODELS[level]).where(PARENT_KEYS[level].in_(ids[parent])))
+    statements.append(delete(MODELS[scope]).where(MODELS[scope].id == id_))
+
+    for statement in statements:
+        db.session.execute(statement.execution_options(synchronize_session=False))
@@ -0,0 +1,160 @@
+"""Live sheet updates over Server-Sent Events.
+
+Routes that change a sheet call `publish` before committing, which adds a
+row to sheet_events in the same transaction. The event exists exactly when
+the change does. Each open sheet page keeps an EventSource on
+/sheet/<id>/events, and `stream` sends it the rows newer than the last one it
+saw. There are three kinds:
+
+- 'progress': tasks were ticked or unticked. Carries the task ids, their new
+  state and the learner's fresh section/sheet progress. It only goes to
+  streams of that learner.
+- 'patch': an inline edit, in the same shape as the inline form responses.
+- 'layout': tasks or boxes were reordered or moved.
+
+The table is the broker, so this works across gunicorn workers without an
+outside service. A stream re-reads it when its own process commits an event,
+which it learns through a condition variable, or at the latest after
+SSE_POLL_SECONDS for events committed by other workers. Every read is one
+index seek on (sheet_id, id), and the session is closed between reads so an
+idle stream holds no pooled connection and no old WAL snapshot.
+
+A stream holds a worker thread while it is open. Each process serves at
+most SSE_MAX_STREAMS (default 4) at once, so open tabs can never take every
+thread from ordinary requests; gunicorn.conf.py adds that many threads on
+top of the request threads. Past the cap the route answers 503, and the
+page retries a little later, resuming from the last event it saw. A stream
+also ends after SSE_STREAM_SECONDS (default 60), so slots keep turning over.
+The browser reconnects on its own and sends Last-Event-ID, and the stream
+resumes after that id. Every stream opens by sending the id it starts from,
+so that header is set even before the first event arrives. The sheet page
+itself carries the last event id it was rendered with (?after=), so nothing
+published between the render and the first connect is missed either. Events
+older than SSE_RETENTION_SECONDS are
+pruned as new ones come in. A client that reconnects after its events were
+pruned is told to reload.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, select
+
+from models import db, SheetEvent
+
+POLL_SECONDS = float(os.environ.get('SSE_POLL_SECONDS', 1.0))
+STREAM_SECONDS = float(os.environ.get('SSE_STREAM_SECONDS', 60))
+MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 4))
+# Only a failed write reveals a closed tab, so this also bounds how long it keeps its slot
+HEARTBEAT_SECONDS = 5
+RETRY_MS = 2000
+# How long a page waits before asking again after a 503 (plus jitter)
+RETRY_BUSY_SECONDS = 20
+RETENTION = timedelta(seconds=int(os.environ.get('SSE_RETENTION_SECONDS', 600)))
+# Prune old events once every this many publishes
+PRUNE_EVERY = 200
+
+_changed = threading.Condition()
+_generation = 0
+_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+
+def open_slot():
+    """Reserve one of this process's stream slots; False when all MAX_STREAMS are taken."""
+    return _slots.acquire(blocking=False)
+
+
+def close_slot():
+    _slots.release()
+
+
+def publish(sheet_id, kind, data, learner_id=None):
+    """Queue an event for a sheet's streams. Delivered once the caller commits."""
+    event_id = db.session.execute(
+        insert(SheetEvent)
+        .values(sheet_id=sheet_id, learner_id=learner_id, kind=kind,
+                payload=json.dumps(data), created_at=datetime.utcnow())
+        .returning(SheetEvent.id)
+    ).scalar_one()
+    if event_id % PRUNE_EVERY == 0:
+        db.session.execute(delete(SheetEvent).where(SheetEvent.created_at < datetime.utcnow() - RETENTION))
+    db.session.info['sheet_events'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake(session):
+    global _generation
+    if session.info.pop('sheet_events', False):
+        with _changed:
+            _generation += 1
+            _changed.notify_all()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget(session):
+    session.info.pop('sheet_events', None)
+
+
+def _wait(seen, timeout):
+    """Sleep until another local commit publishes, or `timeout` passes."""
+    with _changed:
+        if _generation == seen:
+            _changed.wait(timeout)
+
+
+def last_id(sheet_id):
+    return db.session.execute(
+        select(func.coalesce(func.max(SheetEvent.id), 0)).where(SheetEvent.sheet_id == sheet_id)
+    ).scalar()
+
+
+def _pruned_since(after_id):
+    """True when events after `after_id` may already have been pruned."""
+    oldest = db.session.execute(select(func.min(SheetEvent.id))).scalar()
+    return oldest is not None and after_id < oldest - 1
+
+
+def _fetch(sheet_id, learner_id, after_id):
+    return db.session.execute(
+        select(SheetEvent.id, SheetEvent.kind, SheetEvent.payload)
+        .where(SheetEvent.sheet_id == sheet_id, SheetEvent.id > after_id,
+               SheetEvent.learner_id.is_(None) | (SheetEvent.learner_id == learner_id))
+        .order_by(SheetEvent.id)
+    ).all()
+
+
+def _format(event_id, kind, payload):
+    return f'id: {event_id}\nevent: {kind}\ndata: {payload}\n\n'
+
+
+def stream(sheet_id, learner_id, after_id=None):
+    """Yield SSE text for a sheet's events after `after_id` (default: from now on)."""
+    latest = last_id(sheet_id)
+    # A client already at the sheet's latest event has missed nothing, even if
+    # that event has since been pruned
+    reload = after_id is not None and after_id < latest and _pruned_since(after_id)
+    if after_id is None or reload:
+        after_id = latest
+    db.session.close()
+    yield f'retry: {RETRY_MS}\nid: {after_id}\n\n'
+    if reload:
+        yield _format(after_id, 'reload', '{}')
+
+    deadline = time.monotonic() + STREAM_SECONDS
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        seen = _generation
+        rows = _fetch(sheet_id, learner_id, after_id)
+        db.session.close()
+        for event_id, kind, payload in rows:
+            yield _format(event_id, kind, payload)
+            after_id = event_id
+        if rows:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            # A comment line keeps proxies from closing an idle connection
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+        _wait(seen, POLL_SECONDS)
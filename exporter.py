@@ -0,0 +1,138 @@
+"""Streaming CSV export in the import format.
+
+Rows come out as `level,section_order,box_number,box_title,task_order,task_text`,
+so a sheet export can be fed straight back into import_csv. Chapter and book
+exports prefix every row with the sheet (and chapter) it belongs to; optional
+columns add one learner's completion state and the section notes. Notes are emitted as
+rows of their own with empty box/task fields, which the importer skips.
+
+Everything is read with one ordered query that is fetched in batches while the
+CSV is written, so memory stays flat no matter how large the export is.
+"""
+import csv
+import io
+
+from sqlalchemy import literal, select, union_all
+
+from models import db, Chapter, Sheet, Section, Box, Task, Note, SheetProgress
+import progress
+
+BASE_FIELDS = ['level', 'section_order', 'box_number', 'box_title', 'task_order', 'task_text']
+SCOPE_FIELDS = {
+    'sheet': [],
+    'chapter': ['sheet_order', 'sheet'],
+    'book': ['chapter_order', 'chapter', 'sheet_order', 'sheet'],
+}
+BATCH_ROWS = 500
+
+
+def fieldnames(scope, include_progress=False, include_notes=False):
+    fields = SCOPE_FIELDS[scope] + BASE_FIELDS
+    if include_progress:
+        fields.append('completed')
+    if include_notes:
+        fields.append('note')
+    return fields
+
+
+def _scope_filter(scope, id_):
+    if scope == 'sheet':
+        return Sheet.id == id_
+    if scope == 'chapter':
+        return Sheet.chapter_id == id_
+    if scope == 'book':
+        return Chapter.book_id == id_
+    raise ValueError(f'Unknown scope {scope!r}')
+
+
+def _statement(scope, id_, include_notes):
+    """One SELECT over tasks (and notes) of the scope, in display order."""
+    prefix = [Chapter.order.label('chapter_order'), Chapter.id.label('chapter_id'),
+              Chapter.name.label('chapter'), Sheet.order.label('sheet_order'),
+              Sheet.id.label('sheet_id'), Sheet.name.label('sheet'),
+              Section.section_order, Section.id.label('section_id'), Section.level_name]
+    tasks = (
+        select(*prefix, literal(0).label('kind'),
+               Box.box_number, Box.box_title, Task.task_order, Task.task_text,
+               Task.bit_index, literal(None).label('note'), Task.id.label('item_id'))
+        .select_from(Task)
+        .join(Box, Task.box_id == Box.id)
+        .join(Section, Box.section_id == Section.id)
+        .join(Sheet, Section.sheet_id == Sheet.id)
+        .join(Chapter, Sheet.chapter_id == Chapter.id)
+        .where(_scope_filter(scope, id_))
+    )
+    stmt = tasks
+    if include_notes:
+        notes = (
+            select(*prefix, literal(1).label('kind'),
+                   literal(None), literal(None), literal(None), literal(None),
+                   literal(None), Note.content_markdown, Note.id)
+            .select_from(Note)
+            .join(Section, Note.section_id == Section.id)
+            .join(Sheet, Section.sheet_id == Sheet.id)
+            .join(Chapter, Sheet.chapter_id == Chapter.id)
+            .where(_scope_filter(scope, id_))
+        )
+        stmt = union_all(tasks, notes)
+    columns = stmt.selected_columns
+    return stmt.order_by(
+        columns.chapter_order, columns.chapter_id, columns.sheet_order, columns.sheet_id,
+        columns.section_order, columns.section_id, columns.kind,
+        columns.box_number, columns.task_order, columns.item_id,
+    )
+
+
+def _learner_bits(scope, id_, learner_id):
+    """Map sheet id -> the learner's bitset (as an int) for every sheet in the scope."""
+    rows = db.session.execute(
+        select(SheetProgress.sheet_id, SheetProgress.bits)
+        .join(Sheet, SheetProgress.sheet_id == Sheet.id)
+        .join(Chapter, Sheet.chapter_id == Chapter.id)
+        .where(SheetProgress.learner_id == learner_id, _scope_filter(scope, id_))
+    )
+    return {sheet_id: progress.to_int(bits) for sheet_id, bits in rows}
+
+
+def _csv_row(row, scope, bits, include_notes):
+    values = []
+    if scope == 'book':
+        values += [row.chapter_order, row.chapter]
+    if scope in ('book', 'chapter'):
+        values += [row.sheet_order, row.sheet]
+    if row.kind == 0:
+        values += [row.level_name, row.section_order, row.box_number, row.box_title,
+                   row.task_order, row.task_text]
+    else:
+        values += [row.level_name, row.section_order, '', '', '', '']
+    if bits is not None:
+        if row.kind:
+            values.append('')
+        else:
+            # A task without a bit_index has never been ticked
+            values.append(0 if row.bit_index is None else bits.get(row.sheet_id, 0) >> row.bit_index & 1)
+    if include_notes:
+        values.append(row.note or '')
+    return values
+
+
+def stream_csv(scope, id_, include_progress=False, include_notes=False, learner_id=None):
+    """Yield the export as CSV text chunks of about BATCH_ROWS rows each.
+
+    With `include_progress`, the completed column shows `learner_id`'s progress.
+    """
+    bits = _learner_bits(scope, id_, learner_id) if include_progress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fieldnames(scope, include_progress, include_notes))
+    result = db.session.execute(
+        _statement(scope, id_, include_notes),
+        execution_options={'yield_per': BATCH_ROWS},
+    )
+    for batch in result.partitions():
+        writer.writerows(_csv_row(row, scope, bits, include_notes) for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
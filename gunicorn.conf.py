@@ -0,0 +1,54 @@
+"""Gunicorn settings for the container image.
+
+gunicorn reads this file from the working directory on its own, so the
+Dockerfile runs plain `gunicorn`. Every value can be overridden from the
+environment:
+
+    GUNICORN_BIND       address to listen on (default 0.0.0.0:5000)
+    WEB_CONCURRENCY     worker processes (default: CPU count, at most 4)
+    GUNICORN_THREADS    threads per worker (default 8 + SSE_MAX_STREAMS)
+    SSE_MAX_STREAMS     live-update streams one worker holds open (default 4)
+    GUNICORN_TIMEOUT    seconds before a silent worker is restarted (default 30)
+    GUNICORN_MAX_REQUESTS  recycle a worker after this many requests (default 0, never)
+
+The app is built once in the master (preload_app) and the workers are
+forked from it. They share the imported code, copy-on-write, and start
+serving without importing anything again. The master also compiles every
+template before forking, so no worker compiles them on its first requests.
+create_app() opens no database connection, so no connection is inherited
+across the fork. Run `flask init-db` before starting the server.
+
+SQLite takes one writer at a time, so more processes mostly add memory.
+Threads cost less, which is why the worker class is gthread with a handful
+of processes. Every open sheet tab holds a thread for its Server-Sent
+Events stream (events.py). A worker accepts at most SSE_MAX_STREAMS of them
+and answers 503 past that, so the default thread count is that stream
+budget plus 8 threads for ordinary requests, which streams can never take.
+With 4 workers that is 16 open tabs streaming at once; the others retry
+every 20 seconds or so. Raise SSE_MAX_STREAMS for more, and the threads
+follow.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+preload_app = True
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+sse_streams = int(os.environ.get('SSE_MAX_STREAMS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 8 + sse_streams))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# A rolling restart waits this long for open requests; SSE streams just reconnect
+graceful_timeout = 10
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    """Compile the templates in the master, once, for all workers to inherit."""
+    if preload_app:
+        app = server.app.wsgi()
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
@@ -0,0 +1,76 @@
+"""Stored import previews.
+
+A dry-run import (import_csv with `dry_run`) computes an importer.ImportPlan
+and shows it. The plan has to outlive that request, so `save` writes it under
+instance/imports/ (next to the background job uploads) as <token>.plan and
+returns the random token. The preview page posts the token back to apply
+exactly that plan, and `discard` deletes it once applied. Plans the user
+never confirmed are pruned after MAX_AGE, whenever a new one is saved.
+
+Tokens are 32 hex characters and anything else is rejected before a path is
+built, so a token can never name a file outside the directory.
+"""
+import os
+import re
+import time
+import uuid
+
+from flask import current_app
+
+from importer import ImportPlan
+
+MAX_AGE = int(os.environ.get('IMPORT_PLAN_MAX_AGE', 3600))
+TOKEN = re.compile(r'[0-9a-f]{32}')
+
+
+def _path(token):
+    if not TOKEN.fullmatch(token or ''):
+        return None
+    return os.path.join(current_app.config['IMPORT_JOBS_DIR'], f'{token}.plan')
+
+
+def save(plan):
+    """Store a plan and return its token."""
+    directory = current_app.config['IMPORT_JOBS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    prune(directory)
+    token = uuid.uuid4().hex
+    with open(_path(token), 'wb') as handle:
+        handle.write(plan.dumps())
+    return token
+
+
+def load(token):
+    """Return the stored plan for a token, or None if it is unknown or expired."""
+    path = _path(token)
+    if path is None:
+        return None
+    try:
+        if time.time() - os.path.getmtime(path) > MAX_AGE:
+            return None
+        with open(path, 'rb') as handle:
+            return ImportPlan.loads(handle.read())
+    except OSError:
+        return None
+
+
+def discard(token):
+    path = _path(token)
+    if path is not None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def prune(directory):
+    cutoff = time.time() - MAX_AGE
+    for name in os.listdir(directory):
+        if not name.endswith('.plan'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
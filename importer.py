@@ -0,0 +1,437 @@
+"""Set-based CSV import engine.
+
+The CSV format is `level,section_order,box_number,box_title,task_order,task_text`.
+Rows are merged into a sheet exactly as before: sections match on
+(level, section_order), boxes on box_number within their section and tasks on
+task_order within their box; matching boxes and tasks get their title/text
+overwritten, everything else is created. Boxes numbered above 25 are skipped.
+
+Instead of looking every row up individually, the importer prefetches the
+sheet's existing sections, boxes and tasks with one query each and writes new
+rows with executemany INSERTs and changed rows with bulk UPDATEs by primary
+key, re-reading the keys of freshly inserted rows with one more query. New
+tasks get consecutive progress bit indexes reserved with a single UPDATE.
+
+Comparing and writing are separate steps. `CsvImporter.plan` diffs the rows
+against those maps and returns an ImportPlan listing the sections, boxes and
+tasks to insert, the boxes and tasks whose title/text would change, how many
+are unchanged and which rows were dropped by the box limit, all without
+writing. That is the dry-run preview. `apply_plan` later writes exactly that
+plan, unless the sheet changed in between, which a fingerprint of the maps
+detects. A normal import runs both steps back to back.
+"""
+import csv
+import hashlib
+import io
+import json
+import time
+import zlib
+
+from sqlalchemy import insert, select, update
+
+from models import db, Section, Box, Task
+import progress
+
+MAX_BOXES = 25
+# Row numbers of over-limit rows kept for the preview; the count is always exact
+MAX_OVER_LIMIT_ROWS = 100
+
+
+class StalePlanError(Exception):
+    """The sheet no longer matches the state an ImportPlan was computed from."""
+
+
+def open_csv_stream(file_storage):
+    """Wrap an uploaded file so csv.DictReader can read it without buffering it whole."""
+    return io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+
+
+def open_reader(csv_file=None, csv_text=''):
+    """Return a csv.DictReader over an upload or pasted text, or None if neither was given."""
+    if csv_file and csv_file.filename:
+        return csv.DictReader(open_csv_stream(csv_file))
+    if csv_text:
+        return csv.DictReader(io.StringIO(csv_text))
+    return None
+
+
+def parse_row(row):
+    """Normalize one DictReader row, or return None when it should be ignored.
+
+    Rows without a level, task text or box number are ignored before any
+    number is parsed; the note rows of an export (see exporter.py) are such
+    rows, so an export with notes imports back cleanly.
+    """
+    level = (row.get('level') or '').strip()
+    task_text = (row.get('task_text') or '').strip()
+    box_number = (row.get('box_number', '1') or '').strip()
+    if not level or not task_text or not box_number:
+        return None
+    section_order = int(row.get('section_order', 1))
+    box_title = (row.get('box_title') or '').strip()
+    task_order = int(row.get('task_order', 1))
+    return level, section_order, int(box_number), box_title, task_order, task_text
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.skipped = 0
+        self.over_limit = 0
+        self.sections_created = 0
+        self.boxes_created = 0
+        self.boxes_updated = 0
+        self.tasks_created = 0
+        self.tasks_updated = 0
+        self.timings = {}
+        self._started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._started
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'skipped': self.skipped,
+            'over_limit': self.over_limit,
+            'sections_created': self.sections_created,
+            'boxes_created': self.boxes_created,
+            'boxes_updated': self.boxes_updated,
+            'tasks_created': self.tasks_created,
+            'tasks_updated': self.tasks_updated,
+            'elapsed': round(self.elapsed, 4),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+            'timings': {phase: round(seconds, 4) for phase, seconds in self.timings.items()},
+        }
+
+    def summary(self):
+        phases = ', '.join(f'{phase}={seconds * 1000:.0f}ms' for phase, seconds in self.timings.items())
+        return f'{self.rows} rows in {self.elapsed:.2f}s ({self.rows_per_sec:.0f} rows/s; {phases})'
+
+
+def fingerprint(existing):
+    """Digest of the (section, box, task) maps a plan is computed against."""
+    section_ids, boxes, tasks = existing
+    digest = hashlib.sha1()
+    for mapping in (section_ids, boxes, tasks):
+        digest.update(repr(list(mapping.items())).encode())
+    return digest.hexdigest()
+
+
+class ImportPlan:
+    """What merging a batch of rows into a sheet would change.
+
+    Sections, boxes and tasks to create are named by their CSV keys, since
+    they have no ids yet; boxes and tasks to change carry their id and both
+    the current and the new title/text. `dumps`/`loads` round-trip the plan
+    so a preview can be applied by a later request.
+    """
+
+    def __init__(self, sheet_id, fingerprint=None):
+        self.sheet_id = sheet_id
+        self.fingerprint = fingerprint
+        self.rows = 0
+        self.skipped = 0
+        self.over_limit = 0
+        self.over_limit_rows = []
+        self.new_sections = []    # (level, section_order)
+        self.new_boxes = []       # (level, section_order, box_number, title)
+        self.changed_boxes = []   # (id, level, section_order, box_number, old title, new title)
+        self.unchanged_boxes = 0
+        self.new_tasks = []       # (level, section_order, box_number, task_order, text)
+        self.changed_tasks = []   # (id, level, section_order, box_number, task_order, old text, new text)
+        self.unchanged_tasks = 0
+
+    @property
+    def has_changes(self):
+        return bool(self.new_sections or self.new_boxes or self.changed_boxes
+                    or self.new_tasks or self.changed_tasks)
+
+    def as_dict(self, sample=50):
+        """Counts plus the first `sample` entries of every list."""
+        return {
+            'sheet_id': self.sheet_id,
+            'rows': self.rows,
+            'skipped': self.skipped,
+            'over_limit': self.over_limit,
+            'over_limit_rows': self.over_limit_rows[:sample],
+            'sections': {'new': len(self.new_sections)},
+            'boxes': {'new': len(self.new_boxes), 'changed': len(self.changed_boxes),
+                      'unchanged': self.unchanged_boxes},
+            'tasks': {'new': len(self.new_tasks), 'changed': len(self.changed_tasks),
+                      'unchanged': self.unchanged_tasks},
+            'new_sections': [{'level': level, 'section_order': order}
+                             for level, order in self.new_sections[:sample]],
+            'new_boxes': [{'level': level, 'section_order': order, 'box_number': number, 'box_title': title}
+                          for level, order, number, title in self.new_boxes[:sample]],
+            'changed_boxes': [{'id': id_, 'level': level, 'section_order': order, 'box_number': number,
+                               'old': old, 'new': new}
+                              for id_, level, order, number, old, new in self.changed_boxes[:sample]],
+            'new_tasks': [{'level': level, 'section_order': order, 'box_number': number,
+                           'task_order': task_order, 'task_text': text}
+                          for level, order, number, task_order, text in self.new_tasks[:sample]],
+            'changed_tasks': [{'id': id_, 'level': level, 'section_order': order, 'box_number': number,
+                               'task_order': task_order, 'old': old, 'new': new}
+                              for id_, level, order, number, task_order, old, new in self.changed_tasks[:sample]],
+        }
+
+    def dumps(self):
+        return zlib.compress(json.dumps(vars(self), separators=(',', ':')).encode())
+
+    @classmethod
+    def loads(cls, data):
+        plan = cls(None)
+        vars(plan).update(json.loads(zlib.decompress(data)))
+        # JSON turns the key tuples into lists
+        plan.new_sections = [tuple(key) for key in plan.new_sections]
+        return plan
+
+
+class CsvImporter:
+    """Merge CSV rows into one sheet.
+
+    `feed` accumulates parsed rows; `apply` writes everything fed so far and
+    resets the buffer, so large files can be applied in chunks. `plan`
+    consumes the buffer the same way but only reports what `apply` would do.
+    The caller owns the transaction and commits.
+
+    When `errors` is a list, rows with malformed numbers are recorded there
+    and skipped instead of aborting the import.
+    """
+
+    def __init__(self, sheet_id, errors=None):
+        self.sheet_id = sheet_id
+        self.stats = ImportStats()
+        self.errors = errors
+        # (level, section_order) -> {box_number: title}, first row wins for the whole import
+        self._box_titles = {}
+        self._pending = {}
+        self.over_limit_rows = []
+
+    def feed(self, rows):
+        started = time.perf_counter()
+        for row in rows:
+            self.stats.rows += 1
+            try:
+                parsed = parse_row(row)
+            except ValueError as exc:
+                if self.errors is None:
+                    raise
+                self.errors.append({'row': self.stats.rows, 'error': str(exc)})
+                self.stats.skipped += 1
+                continue
+            if parsed is None:
+                self.stats.skipped += 1
+                continue
+            level, section_order, box_number, box_title, task_order, task_text = parsed
+            # The section is created even when all its rows are over the box limit
+            key = (level, section_order)
+            titles = self._box_titles.setdefault(key, {})
+            boxes = self._pending.setdefault(key, {})
+            if box_number > MAX_BOXES:
+                self.stats.skipped += 1
+                self.stats.over_limit += 1
+                if len(self.over_limit_rows) < MAX_OVER_LIMIT_ROWS:
+                    self.over_limit_rows.append(self.stats.rows)
+                continue
+            titles.setdefault(box_number, box_title)
+            # Later rows for the same task overwrite earlier ones
+            boxes.setdefault(box_number, {})[task_order] = task_text
+        self.stats.add_time('parse', time.perf_counter() - started)
+
+    def skip(self, rows):
+        """Count rows applied by an earlier run without applying them again.
+
+        Their box titles are still remembered, so the first-row-wins rule
+        holds when an interrupted import is resumed part way through.
+        """
+        for row in rows:
+            self.stats.rows += 1
+            try:
+                parsed = parse_row(row)
+            except ValueError:
+                continue
+            if parsed is None or parsed[2] > MAX_BOXES:
+                continue
+            level, section_order, box_number, box_title = parsed[:4]
+            self._box_titles.setdefault((level, section_order), {}).setdefault(box_number, box_title)
+
+
+    def run(self, reader):
+        """Feed every row of `reader` and apply it in one go."""
+        self.feed(reader)
+        self.apply()
+        self.stats.finish()
+        return self.stats
+
+    def plan(self):
+        """Compare everything fed so far with the sheet and return an ImportPlan, writing nothing.
+
+        The buffer is consumed as by `apply`; pass the plan to `apply_plan`
+        to write it later.
+        """
+        started = time.perf_counter()
+        pending, self._pending = self._pending, {}
+        existing = self._existing()
+        plan = self._plan(pending, existing)
+        plan.fingerprint = fingerprint(existing)
+        self.stats.add_time('plan', time.perf_counter() - started)
+        self.stats.finish()
+        return plan
+
+    def apply(self):
+        if not self._pending:
+            return
+        started = time.perf_counter()
+        pending, self._pending = self._pending, {}
+        existing = self._existing()
+        plan = self._plan(pending, existing)
+        self.stats.add_time('plan', time.perf_counter() - started)
+        self._execute(plan, existing)
+        self._rebuild_counters()
+
+    def apply_plan(self, plan):
+        """Write a plan computed earlier by `plan`.
+
+        Raises StalePlanError, writing nothing, when the sheet's sections,
+        boxes or tasks changed since the plan was computed: its inserts and
+        updates would no longer be what the preview showed.
+        """
+        if plan.sheet_id != self.sheet_id:
+            raise StalePlanError('the plan belongs to another sheet')
+        existing = self._existing()
+        if fingerprint(existing) != plan.fingerprint:
+            raise StalePlanError('the sheet changed after the preview')
+        self.stats.rows += plan.rows
+        self.stats.skipped += plan.skipped + plan.over_limit
+        self._execute(plan, existing)
+        self._rebuild_counters()
+        self.stats.finish()
+        return self.stats
+
+    def _rebuild_counters(self):
+        started = time.perf_counter()
+        progress.rebuild(self.sheet_id)
+        self.stats.add_time('counters', time.perf_counter() - started)
+
+    def _existing(self):
+        return self._section_ids(), self._box_ids(), self._task_ids()
+
+    def _plan(self, pending, existing):
+        section_ids, boxes, tasks = existing
+        plan = ImportPlan(self.sheet_id)
+        plan.rows = self.stats.rows
+        plan.over_limit = self.stats.over_limit
+        plan.over_limit_rows = list(self.over_limit_rows)
+        plan.skipped = self.stats.skipped - plan.over_limit
+        for key, numbers in pending.items():
+            level, order = key
+            section_id = section_ids.get(key)
+            if section_id is None:
+                plan.new_sections.append(key)
+            for number, task_rows in numbers.items():
+                title = self._box_titles[key][number]
+                box = boxes.get((section_id, number)) if section_id is not None else None
+                if box is None:
+                    plan.new_boxes.append((level, order, number, title))
+                elif box[1] != title:
+                    plan.changed_boxes.append((box[0], level, order, number, box[1], title))
+                else:
+                    plan.unchanged_boxes += 1
+                for task_order, text in task_rows.items():
+                    task = tasks.get((box[0], task_order)) if box is not None else None
+                    if task is None:
+                        plan.new_tasks.append((level, order, number, task_order, text))
+                    elif task[1] != text:
+                        plan.changed_tasks.append((task[0], level, order, number, task_order, task[1], text))
+                    else:
+                        plan.unchanged_tasks += 1
+        return plan
+
+    def _execute(self, plan, existing):
+        """Write `plan` against the `existing` maps it was computed from."""
+        section_ids, boxes, _ = existing
+        started = time.perf_counter()
+        if plan.new_sections:
+            db.session.execute(
+                insert(Section),
+                [{'level_name': level, 'section_order': order, 'sheet_id': self.sheet_id}
+                 for level, order in plan.new_sections],
+            )
+            section_ids = self._section_ids()
+            self.stats.sections_created += len(plan.new_sections)
+        self.stats.add_time('sections', time.perf_counter() - started)
+
+        started = time.perf_counter()
+        if plan.new_boxes:
+            db.session.execute(insert(Box), [
+                {'section_id': section_ids[(level, order)], 'box_number': number, 'box_title': title}
+                for level, order, number, title in plan.new_boxes
+            ])
+            boxes = self._box_ids()
+            self.stats.boxes_created += len(plan.new_boxes)
+        if plan.changed_boxes:
+            db.session.execute(update(Box), [{'id': row[0], 'box_title': row[-1]} for row in plan.changed_boxes])
+            self.stats.boxes_updated += len(plan.changed_boxes)
+        self.stats.add_time('boxes', time.perf_counter() - started)
+
+        started = time.perf_counter()
+        if plan.new_tasks:
+            first_bit = progress.allocate_bits(self.sheet_id, len(plan.new_tasks))
+            db.session.execute(insert(Task), [
+                {'box_id': boxes[(section_ids[(level, order)], number)][0], 'task_order': task_order,
+                 'task_text': text, 'bit_index': bit}
+                for bit, (level, order, number, task_order, text) in enumerate(plan.new_tasks, start=first_bit)
+            ])
+            self.stats.tasks_created += len(plan.new_tasks)
+        if plan.changed_tasks:
+            db.session.execute(update(Task), [{'id': row[0], 'task_text': row[-1]} for row in plan.changed_tasks])
+            self.stats.tasks_updated += len(plan.changed_tasks)
+        self.stats.add_time('tasks', time.perf_counter() - started)
+
+    def _section_ids(self):
+        """Map (level, section_order) -> id of the sheet's sections, oldest first."""
+        section_ids = {}
+        rows = db.session.execute(
+            select(Section.id, Section.level_name, Section.section_order)
+            .where(Section.sheet_id == self.sheet_id)
+            .order_by(Section.id)
+        )
+        for id_, level, order in rows:
+            section_ids.setdefault((level, order), id_)
+        return section_ids
+
+    def _box_ids(self):
+        """Map (section_id, box_number) -> (id, title) of the sheet's boxes, oldest first."""
+        boxes = {}
+        rows = db.session.execute(
+            select(Box.id, Box.section_id, Box.box_number, Box.box_title)
+            .join(Section, Box.section_id == Section.id)
+            .where(Section.sheet_id == self.sheet_id)
+            .order_by(Box.id)
+        )
+        for id_, section_id, number, title in rows:
+            boxes.setdefault((section_id, number), (id_, title))
+        return boxes
+
+    def _task_ids(self):
+        """Map (box_id, task_order) -> (id, text) of the sheet's tasks, oldest first."""
+        tasks = {}
+        rows = db.session.execute(
+            select(Task.id, Task.box_id, Task.task_order, Task.task_text)
+            .join(Box, Task.box_id == Box.id)
+            .join(Section, Box.section_id == Section.id)
+            .where(Section.sheet_id == self.sheet_id)
+            .order_by(Task.id)
+        )
+        for id_, box_id, order, text in rows:
+            tasks.setdefault((box_id, order), (id_, text))
+        return tasks
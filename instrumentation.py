@@ -0,0 +1,228 @@
+"""Opt-in request instrumentation and Prometheus metrics.
+
+Enabled with LEARNBOARD_METRICS=1. When on, every request records:
+- wall time, as a latency histogram per endpoint and method;
+- how many SQL statements it ran and how long they took, through SQLAlchemy
+  cursor events;
+- how long Jinja spent rendering, through Flask's template signals.
+
+Requests slower than SLOW_REQUEST_MS (500 by default, 0 disables) are logged
+with the statements they ran. An N+1 shows up there as a long list of
+near-identical SELECTs. Every response gets a Server-Timing header, so
+browser dev tools show the db/render/app split too. `render` produces the
+Prometheus text format served at /metrics, including the in-process LRU
+cache stats.
+
+Metrics live in process memory, so each gunicorn worker reports its own;
+Prometheus sums them when it scrapes every worker. Streaming responses are
+timed up to the moment the generator is handed to the server.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+# Statements kept per request for the slow log; counting goes on past this
+MAX_LOGGED_QUERIES = 200
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Yield (le, cumulative count) pairs, ending with +Inf."""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), total
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.statements = []
+        self._render_started = []
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.query_counts = {}
+        self.db_seconds = {}
+        self.responses = {}
+        self.slow = {}
+        self.templates = {}
+
+    def record(self, endpoint, method, status, stats, elapsed, slow):
+        key = (endpoint, method)
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.query_counts.setdefault(key, Histogram(QUERY_BUCKETS)).observe(stats.queries)
+            self.db_seconds[key] = self.db_seconds.get(key, 0.0) + stats.db_seconds
+            status_key = (endpoint, method, str(status))
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+            if slow:
+                self.slow[key] = self.slow.get(key, 0) + 1
+
+    def record_render(self, template, seconds):
+        with self._lock:
+            count, total = self.templates.get(template, (0, 0.0))
+            self.templates[template] = (count + 1, total + seconds)
+
+
+registry = Registry()
+
+
+def enabled(app):
+    return app.config.get('METRICS_ENABLED', False)
+
+
+def init_app(app, engine):
+    """Hook the request, SQL and template timers into the app when metrics are enabled."""
+    app.config.setdefault('METRICS_ENABLED', os.environ.get('LEARNBOARD_METRICS', '').lower() in ('1', 'true', 'yes'))
+    app.config.setdefault('SLOW_REQUEST_MS', int(os.environ.get('SLOW_REQUEST_MS', 500)))
+    if not enabled(app):
+        return
+
+    @app.before_request
+    def start_timer():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def finish_timer(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+        threshold = app.config['SLOW_REQUEST_MS']
+        slow = threshold > 0 and elapsed * 1000 >= threshold
+        registry.record(endpoint, request.method, response.status_code, stats, elapsed, slow)
+        if slow:
+            _log_slow(stats, elapsed)
+        response.headers['Server-Timing'] = (
+            f'db;desc="{stats.queries} queries";dur={stats.db_seconds * 1000:.1f}, '
+            f'render;dur={stats.render_seconds * 1000:.1f}, app;dur={elapsed * 1000:.1f}'
+        )
+        return response
+
+    # The start time lives on the statement's execution context, so a statement that
+    # raises (and never reaches after_cursor_execute) leaves nothing behind
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        stats = g.get('request_stats') if has_request_context() else None
+        if stats is None or started is None:
+            return
+        seconds = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_seconds += seconds
+        if len(stats.statements) < MAX_LOGGED_QUERIES:
+            stats.statements.append((seconds, statement))
+
+    @before_render_template.connect_via(app)
+    def before_render(sender, template, context, **extra):
+        stats = g.get('request_stats')
+        if stats is not None:
+            stats._render_started.append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def after_render(sender, template, context, **extra):
+        stats = g.get('request_stats')
+        if stats is None or not stats._render_started:
+            return
+        seconds = time.perf_counter() - stats._render_started.pop()
+        stats.render_seconds += seconds
+        registry.record_render(template.name or 'string', seconds)
+
+
+def _log_slow(stats, elapsed):
+    lines = [f'  {seconds * 1000:8.2f}ms  {" ".join(statement.split())}'
+             for seconds, statement in stats.statements]
+    if stats.queries > len(stats.statements):
+        lines.append(f'  ... {stats.queries - len(stats.statements)} more')
+    logger.warning('Slow request %s %s: %.0fms, %d queries (%.0fms DB), render %.0fms\n%s',
+                   request.method, request.full_path.rstrip('?'), elapsed * 1000, stats.queries,
+                   stats.db_seconds * 1000, stats.render_seconds * 1000, '\n'.join(lines))
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _histogram_lines(name, histograms):
+    for (endpoint, method), histogram in sorted(histograms.items()):
+        for le, count in histogram.cumulative():
+            yield f'{name}_bucket{_labels(endpoint=endpoint, method=method, le=le)} {count}'
+        yield f'{name}_sum{_labels(endpoint=endpoint, method=method)} {histogram.sum}'
+        yield f'{name}_count{_labels(endpoint=endpoint, method=method)} {histogram.count}'
+
+
+def render(caches=None):
+    """Prometheus text exposition of the request metrics plus `caches` ({name: LRUCache})."""
+    lines = []
+    with registry._lock:
+        lines += ['# HELP learnboard_http_requests_total Responses by endpoint, method and status.',
+                  '# TYPE learnboard_http_requests_total counter']
+        lines += [f'learnboard_http_requests_total{_labels(endpoint=e, method=m, status=s)} {count}'
+                  for (e, m, s), count in sorted(registry.responses.items())]
+        lines += ['# HELP learnboard_http_request_duration_seconds Request wall time.',
+                  '# TYPE learnboard_http_request_duration_seconds histogram']
+        lines += _histogram_lines('learnboard_http_request_duration_seconds', registry.latency)
+        lines += ['# HELP learnboard_http_request_queries SQL statements per request.',
+                  '# TYPE learnboard_http_request_queries histogram']
+        lines += _histogram_lines('learnboard_http_request_queries', registry.query_counts)
+        lines += ['# HELP learnboard_http_request_db_seconds_total Time spent in SQL statements.',
+                  '# TYPE learnboard_http_request_db_seconds_total counter']
+        lines += [f'learnboard_http_request_db_seconds_total{_labels(endpoint=e, method=m)} {seconds}'
+                  for (e, m), seconds in sorted(registry.db_seconds.items())]
+        lines += ['# HELP learnboard_slow_requests_total Requests over SLOW_REQUEST_MS.',
+                  '# TYPE learnboard_slow_requests_total counter']
+        lines += [f'learnboard_slow_requests_total{_labels(endpoint=e, method=m)} {count}'
+                  for (e, m), count in sorted(registry.slow.items())]
+        lines += ['# HELP learnboard_template_render_seconds Jinja render time per template.',
+                  '# TYPE learnboard_template_render_seconds summary']
+        for template, (count, total) in sorted(registry.templates.items()):
+            lines.append(f'learnboard_template_render_seconds_sum{_labels(template=template)} {total}')
+            lines.append(f'learnboard_template_render_seconds_count{_labels(template=template)} {count}')
+
+    cache_metrics = [
+        ('hits', 'counter', 'learnboard_cache_hits_total', 'Cache lookups that hit.'),
+        ('misses', 'counter', 'learnboard_cache_misses_total', 'Cache lookups that missed.'),
+        ('evictions', 'counter', 'learnboard_cache_evictions_total', 'Entries evicted to stay in bounds.'),
+        ('size', 'gauge', 'learnboard_cache_entries', 'Entries currently cached.'),
+        ('weight', 'gauge', 'learnboard_cache_weight', 'Current weight (bytes for weighed caches).'),
+    ]
+    stats = {name: cache.stats() for name, cache in (caches or {}).items()}
+    for key, kind, metric, help_text in cache_metrics:
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+        lines += [f'{metric}{_labels(cache=name)} {values[key]}' for name, values in sorted(stats.items())]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,198 @@
+"""Background CSV imports.
+
+Instead of importing inside the request, import_csv can hand the upload to
+`submit`. It stores the file under instance/imports/, records an ImportJob row
+and returns right away. A small thread pool then applies the rows CHUNK_ROWS
+at a time, committing after every chunk, so progress shows up at /jobs/<id>
+and other writers get the database lock in between.
+
+The job table is the source of truth, so jobs outlive the process that
+accepted them. On its first request every process resumes queued jobs and
+running jobs whose heartbeat went stale. A resumed job continues after the
+last committed chunk. Jobs are claimed with a conditional UPDATE, so two
+workers never run the same one. Re-applying a chunk is harmless because
+the import is a merge.
+
+Deleting a sheet marks its pending jobs failed (deletes.py). A running job
+re-reads its status at the start of every chunk's transaction and stops if
+it is no longer running. Background work opens its transactions with BEGIN
+IMMEDIATE (database.py), so no delete can commit between that check and the
+chunk's commit.
+"""
+import csv
+import itertools
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from models import db, ImportJob, Sheet
+import importer
+import page_cache
+import search
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = int(os.environ.get('IMPORT_CHUNK_ROWS', 5000))
+WORKERS = int(os.environ.get('IMPORT_WORKERS', 2))
+# A running job whose heartbeat is older than this is presumed dead and resumed
+STALE_AFTER = timedelta(seconds=int(os.environ.get('IMPORT_STALE_AFTER', 300)))
+MAX_ERRORS = 100
+
+_app = None
+_executor = None
+_resumed = False
+_lock = threading.RLock()
+
+
+def init_app(app):
+    global _app
+    _app = app
+    app.config.setdefault('IMPORT_JOBS_DIR', os.path.join(app.instance_path, 'imports'))
+
+    @app.before_request
+    def resume_once():
+        global _resumed
+        if not _resumed:
+            with _lock:
+                if not _resumed:
+                    _resumed = True
+                    resume()
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='import-job')
+        return _executor
+
+
+def submit(sheet_id, csv_file=None, csv_text=''):
+    """Store the upload, queue a job for it and start it. Returns the job, or None without input."""
+    directory = _app.config['IMPORT_JOBS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{uuid.uuid4().hex}.csv')
+    if csv_file and csv_file.filename:
+        csv_file.save(path)
+        filename = csv_file.filename
+    elif csv_text:
+        with open(path, 'w', encoding='utf-8', newline='') as handle:
+            handle.write(csv_text)
+        filename = ''
+    else:
+        return None
+    job = ImportJob(sheet_id=sheet_id, path=path, filename=filename)
+    db.session.add(job)
+    db.session.commit()
+    _pool().submit(_run, job.id)
+    return job
+
+
+def resume():
+    """Start every queued job and every running job whose worker stopped heartbeating."""
+    stale = datetime.utcnow() - STALE_AFTER
+    job_ids = db.session.execute(
+        select(ImportJob.id)
+        .where(or_(ImportJob.status == 'queued',
+                   and_(ImportJob.status == 'running', ImportJob.heartbeat_at < stale)))
+        .order_by(ImportJob.id)
+    ).scalars().all()
+    for job_id in job_ids:
+        _pool().submit(_run, job_id)
+    return job_ids
+
+
+def _claim(job_id):
+    """Atomically mark a job as ours. Returns False when another worker has it or it is finished."""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job_id,
+               or_(ImportJob.status == 'queued',
+                   and_(ImportJob.status == 'running', ImportJob.heartbeat_at < now - STALE_AFTER)))
+        .values(status='running', heartbeat_at=now, attempts=ImportJob.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _run(job_id):
+    with _app.app_context():
+        try:
+            if _claim(job_id):
+                _import(db.session.get(ImportJob, job_id))
+        except Exception as exc:
+            logger.exception('Import job %s failed', job_id)
+            db.session.rollback()
+            db.session.execute(
+                update(ImportJob).where(ImportJob.id == job_id)
+                .values(status='failed', error=str(exc), finished_at=datetime.utcnow())
+            )
+            db.session.commit()
+
+
+def _cancelled(job):
+    """True when the job stopped running behind our back, i.e. its sheet was deleted. Cleans up then."""
+    status = db.session.execute(select(ImportJob.status).where(ImportJob.id == job.id)).scalar()
+    if status == 'running':
+        return False
+    db.session.rollback()
+    logger.info('Import job %s stopped: %s', job.id, job.error or status)
+    _remove_upload(job.path)
+    return True
+
+
+def _remove_upload(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _import(job):
+    if db.session.get(Sheet, job.sheet_id) is None:
+        raise LookupError(f'Sheet {job.sheet_id} no longer exists')
+    job.started_at = job.started_at or datetime.utcnow()
+    errors = json.loads(job.errors or '[]')
+    skipped_before = job.rows_skipped
+    csv_importer = importer.CsvImporter(job.sheet_id, errors=errors)
+
+    with open(job.path, encoding='utf-8-sig', newline='') as handle:
+        reader = csv.DictReader(handle)
+        if job.rows_processed:
+            csv_importer.skip(itertools.islice(reader, job.rows_processed))
+        while True:
+            chunk = list(itertools.islice(reader, CHUNK_ROWS))
+            if not chunk:
+                break
+            if _cancelled(job):
+                return
+            csv_importer.feed(chunk)
+            csv_importer.apply()
+            job.rows_processed = csv_importer.stats.rows
+            job.rows_skipped = skipped_before + csv_importer.stats.skipped
+            del errors[MAX_ERRORS:]
+            job.errors = json.dumps(errors)
+            job.heartbeat_at = datetime.utcnow()
+            page_cache.touch('sheet', job.sheet_id)
+            snapshots.mark([job.sheet_id])
+            db.session.commit()
+
+    if _cancelled(job):
+        return
+    search.reindex_sheet(job.sheet_id)
+    page_cache.touch('sheet', job.sheet_id)
+    job.status = 'done'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    csv_importer.stats.finish()
+    logger.info('Import job %s into sheet %s: %s', job.id, job.sheet_id, csv_importer.stats.summary())
+    _remove_upload(job.path)
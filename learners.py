@@ -0,0 +1,43 @@
+"""Who is ticking the checkboxes.
+
+LearnBoard has no accounts. A learner is a named progress profile, and the
+current one is remembered in the session cookie. Requests without one act as
+the default learner, which also owns all progress recorded before learners
+existed (see migrations.py).
+"""
+from flask import has_request_context, session
+from sqlalchemy import select
+
+from models import db, Learner
+
+DEFAULT_NAME = 'Predeterminado'
+
+_default_id = None
+
+
+def ensure_default():
+    """Create the default learner if missing and return its id."""
+    global _default_id
+    learner_id = db.session.execute(select(Learner.id).where(Learner.name == DEFAULT_NAME)).scalar()
+    if learner_id is None:
+        learner = Learner(name=DEFAULT_NAME)
+        db.session.add(learner)
+        db.session.flush()
+        learner_id = learner.id
+    _default_id = learner_id
+    return learner_id
+
+
+def default_id():
+    return _default_id if _default_id is not None else ensure_default()
+
+
+def current_id():
+    """The learner whose progress this request reads and writes."""
+    if has_request_context() and 'learner_id' in session:
+        return session['learner_id']
+    return default_id()
+
+
+def switch(learner_id):
+    session['learner_id'] = learner_id
@@ -0,0 +1,87 @@
+"""Small thread-safe LRU cache shared by the in-process caches."""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe bounded mapping with hit/miss counters.
+
+    Bounded by entry count and, when `maxweight` is given, by the summed
+    `weigh(value)` of all entries (e.g. bytes of cached HTML).
+    """
+
+    def __init__(self, maxsize, maxweight=None, weigh=None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self._weigh = weigh or (lambda value: 0)
+        self._data = OrderedDict()
+        self._weights = {}
+        self._lock = threading.Lock()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        weight = self._weigh(value)
+        if self.maxweight is not None and weight > self.maxweight:
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = value
+            self._weights[key] = weight
+            self.weight += weight
+            while len(self._data) > self.maxsize or (
+                    self.maxweight is not None and self.weight > self.maxweight):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        if key in self._data:
+            del self._data[key]
+            self.weight -= self._weights.pop(key)
+
+    def pop(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def pop_where(self, predicate):
+        """Remove every entry whose key satisfies `predicate`."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weights.clear()
+            self.weight = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'weight': self.weight,
+                'maxweight': self.maxweight,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
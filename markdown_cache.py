@@ -0,0 +1,53 @@
+"""Rendered-markdown cache for notes.
+
+Note.content_html stores the rendered HTML next to the markdown source and is
+refreshed whenever a note is written. On top of it sits a bounded in-process
+LRU keyed by note id and stamped with updated_at, so repeated sheet renders
+skip both the markdown conversion and the per-note column decode.
+"""
+import os
+import threading
+
+from lru import LRUCache
+
+EXTENSIONS = ['fenced_code', 'tables']
+
+_local = threading.local()
+
+
+def render(text):
+    """Render markdown with a reusable per-thread Markdown instance."""
+    if not text:
+        return ''
+    md = getattr(_local, 'md', None)
+    if md is None:
+        # Imported on first use: most requests are served from content_html or the LRU
+        import markdown
+        md = _local.md = markdown.Markdown(extensions=EXTENSIONS)
+    try:
+        return md.convert(text)
+    finally:
+        md.reset()
+
+
+cache = LRUCache(int(os.environ.get('NOTE_HTML_CACHE_SIZE', 2048)))
+
+
+def note_html(note):
+    """Return the rendered HTML for a note, from the LRU, the stored column or markdown."""
+    stamp = note.updated_at
+    cached = cache.get(note.id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    html = note.content_html
+    if html is None:
+        html = render(note.content_markdown)
+    cache.put(note.id, (stamp, html))
+    return html
+
+
+def refresh(note):
+    """Re-render a note after its markdown changed and drop its cached copy."""
+    note.content_html = render(note.content_markdown)
+    if note.id is not None:
+        cache.pop(note.id)
@@ -0,0 +1,174 @@
+"""In-place schema upgrades for existing learnboard.db files.
+
+db.create_all() creates missing tables but never alters existing ones, so
+databases created by older versions would miss newer columns and indexes.
+`upgrade` runs right after create_all() and is idempotent: it adds any column
+declared in models.py that the database lacks, runs the backfill registered
+for it, creates any missing index, builds the full-text search table and
+stores missing or outdated sheet snapshots.
+
+Databases from before per-learner progress keep their task_progress table
+and completed_tasks columns, unused; the backfill for Task.bit_index copies
+the completed flags into bitsets owned by the default learner.
+"""
+import logging
+
+from sqlalchemy import insert, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Note, SheetProgress
+import learners
+import markdown_cache
+import progress
+import search
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+
+def _rebuild_progress():
+    progress.rebuild()
+
+
+def _render_note_html():
+    rows = db.session.execute(select(Note.id, Note.content_markdown, Note.updated_at)).all()
+    if rows:
+        # updated_at is passed through so the backfill does not count as an edit
+        db.session.execute(update(Note), [
+            {'id': id_, 'content_html': markdown_cache.render(content), 'updated_at': updated_at}
+            for id_, content, updated_at in rows
+        ])
+
+
+def _migrate_progress_bitsets():
+    """Number every sheet's tasks from 0 and move legacy progress into bitsets."""
+    db.session.execute(text(
+        'UPDATE tasks SET bit_index = numbered.bit FROM ('
+        '  SELECT tasks.id AS id, row_number() OVER ('
+        '    PARTITION BY sections.sheet_id ORDER BY tasks.id) - 1 AS bit'
+        '  FROM tasks JOIN boxes ON tasks.box_id = boxes.id'
+        '  JOIN sections ON boxes.section_id = sections.id'
+        ') AS numbered WHERE tasks.id = numbered.id'
+    ))
+    db.session.execute(text(
+        'UPDATE sheets SET next_bit = ('
+        '  SELECT count(*) FROM tasks JOIN boxes ON tasks.box_id = boxes.id'
+        '  JOIN sections ON boxes.section_id = sections.id'
+        '  WHERE sections.sheet_id = sheets.id)'
+    ))
+    if 'task_progress' not in inspect(db.session.connection()).get_table_names():
+        return
+    rows = db.session.execute(text(
+        'SELECT sections.sheet_id, tasks.bit_index FROM task_progress'
+        ' JOIN tasks ON task_progress.task_id = tasks.id'
+        ' JOIN boxes ON tasks.box_id = boxes.id'
+        ' JOIN sections ON boxes.section_id = sections.id'
+        ' WHERE task_progress.completed'
+    ))
+    bits = {}
+    for sheet_id, bit in rows:
+        bits[sheet_id] = bits.get(sheet_id, 0) | 1 << bit
+    if bits:
+        learner_id = learners.default_id()
+        db.session.execute(insert(SheetProgress), [
+            {'learner_id': learner_id, 'sheet_id': sheet_id,
+             'bits': progress.to_bytes(value), 'completed': value.bit_count()}
+            for sheet_id, value in bits.items()
+        ])
+
+
+# (table, column) -> callable run once after that column has been added
+BACKFILLS = {
+    ('sections', 'total_tasks'): _rebuild_progress,
+    ('sheets', 'total_tasks'): _rebuild_progress,
+    ('notes', 'content_html'): _render_note_html,
+    ('tasks', 'bit_index'): _migrate_progress_bitsets,
+    ('sheets', 'next_bit'): _migrate_progress_bitsets,
+}
+
+
+def _column_ddl(column, dialect):
+    ddl = f'{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}'
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    return ddl
+
+
+def add_missing_columns():
+    """Add columns present in the models but missing from the database."""
+    engine = db.engine
+    added = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                conn.execute(text(
+                    f'ALTER TABLE {engine.dialect.identifier_preparer.quote(table.name)} '
+                    f'ADD COLUMN {_column_ddl(column, engine.dialect)}'
+                ))
+                added.append((table.name, column.name))
+    return added
+
+
+def add_missing_indexes():
+    """Create indexes declared in the models but missing from the database.
+
+    A unique index that cannot be built because the existing data already
+    holds duplicates is created as a plain index instead, so lookups still
+    get faster; the duplicates are logged for manual cleanup.
+    """
+    engine = db.engine
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        missing = [
+            (table, index)
+            for table in db.metadata.sorted_tables if table.name in existing_tables
+            for index in sorted(table.indexes, key=lambda i: i.name)
+            if index.name not in {i['name'] for i in inspector.get_indexes(table.name)}
+        ]
+        conn.rollback()
+        created = []
+        for table, index in missing:
+            try:
+                with conn.begin():
+                    index.create(conn)
+            except IntegrityError:
+                logger.warning('Duplicate keys in %s%s; creating %s as a non-unique index',
+                               table.name, tuple(c.name for c in index.columns), index.name)
+                columns = ', '.join(quote(c.name) for c in index.columns)
+                with conn.begin():
+                    conn.execute(text(f'CREATE INDEX {quote(index.name)} ON {quote(table.name)} ({columns})'))
+            created.append((table.name, index.name))
+    return created
+
+
+def upgrade():
+    """Bring an existing database up to the current models. Returns the steps applied."""
+    added = add_missing_columns()
+    learners.ensure_default()
+    backfills = []
+    for key in added:
+        backfill = BACKFILLS.get(key)
+        if backfill and backfill not in backfills:
+            backfills.append(backfill)
+    for backfill in backfills:
+        backfill()
+    db.session.commit()
+    created = add_missing_indexes()
+    if search.ensure_schema():
+        search.rebuild()
+        created.append(('search_index', 'fts5'))
+    if snapshots.store_missing():
+        created.append(('sheet_snapshots', 'rebuild'))
+    db.session.commit()
+    return added + created
@@ -5,6 +5,9 @@ db = SQLAlchemy()
 
 class Category(db.Model):
     __tablename__ = 'categories'
+    __table_args__ = (
+        db.Index('ix_categories_name', 'name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, default='')
@@ -13,6 +16,9 @@ class Category(db.Model):
 
 class Book(db.Model):
     __tablename__ = 'books'
+    __table_args__ = (
+        db.Index('ix_books_category_name', 'category_id', 'name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, default='')
@@ -22,6 +28,9 @@ class Book(db.Model):
 
 class Chapter(db.Model):
     __tablename__ = 'chapters'
+    __table_args__ = (
+        db.Index('ix_chapters_book_order', 'book_id', 'order'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, default='')
@@ -32,49 +41,149 @@ class Chapter(db.Model):
 
 class Sheet(db.Model):
     __tablename__ = 'sheets'
+    __table_args__ = (
+        db.Index('ix_sheets_chapter_order', 'chapter_id', 'order'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapters.id'), nullable=False)
     order = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    sections = db.relationship('Section', backref='sheet', lazy=True, cascade='all, delete-orphan')
+    # Denormalized task count, maintained by progress.py
+    total_tasks = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Next free Task.bit_index in this sheet; indexes are never reused
+    next_bit = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    sections = db.relationship('Section', backref='sheet', lazy=True, cascade='all, delete-orphan',
+                               order_by='Section.section_order')
 
 class Section(db.Model):
     __tablename__ = 'sections'
+    __table_args__ = (
+        db.Index('ix_sections_sheet_order', 'sheet_id', 'section_order'),
+        db.Index('uq_sections_sheet_level_order', 'sheet_id', 'level_name', 'section_order', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     level_name = db.Column(db.String(100), nullable=False)
     section_order = db.Column(db.Integer, default=1)
     sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id'), nullable=False)
-    boxes = db.relationship('Box', backref='section', lazy=True, cascade='all, delete-orphan')
-    notes = db.relationship('Note', backref='section', lazy=True, cascade='all, delete-orphan')
+    # Denormalized task count, maintained by progress.py
+    total_tasks = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    boxes = db.relationship('Box', backref='section', lazy=True, cascade='all, delete-orphan',
+                            order_by='Box.box_number')
+    notes = db.relationship('Note', backref='section', lazy=True, cascade='all, delete-orphan',
+                            order_by='Note.id')
 
 class Box(db.Model):
     __tablename__ = 'boxes'
+    __table_args__ = (
+        db.Index('uq_boxes_section_number', 'section_id', 'box_number', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     box_number = db.Column(db.Integer, default=1)
     box_title = db.Column(db.String(200), nullable=False)
     section_id = db.Column(db.Integer, db.ForeignKey('sections.id'), nullable=False)
-    tasks = db.relationship('Task', backref='box', lazy=True, cascade='all, delete-orphan')
+    tasks = db.relationship('Task', backref='box', lazy=True, cascade='all, delete-orphan',
+                            order_by='Task.task_order')
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('uq_tasks_box_order', 'box_id', 'task_order', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     task_order = db.Column(db.Integer, default=1)
     task_text = db.Column(db.Text, nullable=False)
     box_id = db.Column(db.Integer, db.ForeignKey('boxes.id'), nullable=False)
-    progress = db.relationship('TaskProgress', backref='task', uselist=False, cascade='all, delete-orphan')
+    # Position of this task's bit in every learner's SheetProgress.bits, unique within the sheet
+    bit_index = db.Column(db.Integer)
 
 class Note(db.Model):
     __tablename__ = 'notes'
+    __table_args__ = (
+        db.Index('ix_notes_section_id', 'section_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     content_markdown = db.Column(db.Text, default='')
+    # Rendered content_markdown, refreshed by markdown_cache.refresh()
+    content_html = db.Column(db.Text)
     section_id = db.Column(db.Integer, db.ForeignKey('sections.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-class TaskProgress(db.Model):
-    __tablename__ = 'task_progress'
+class Learner(db.Model):
+    """A named progress profile; see learners.py."""
+    __tablename__ = 'learners'
     id = db.Column(db.Integer, primary_key=True)
-    task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False, unique=True)
-    completed = db.Column(db.Boolean, default=False)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SheetProgress(db.Model):
+    """One learner's completed tasks in one sheet, as a bitset; see progress.py."""
+    __tablename__ = 'sheet_progress'
+    __table_args__ = (
+        db.Index('ix_sheet_progress_sheet_id', 'sheet_id'),
+    )
+    learner_id = db.Column(db.Integer, db.ForeignKey('learners.id'), primary_key=True)
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id'), primary_key=True)
+    # Little-endian bitset: bit n (byte n // 8, bit n % 8) is the task with bit_index n
+    bits = db.Column(db.LargeBinary, nullable=False, default=b'')
+    # Popcount of bits, so listings can SUM completed tasks in SQL
+    completed = db.Column(db.Integer, nullable=False, default=0)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SheetSnapshot(db.Model):
+    """A sheet's precomputed read model; see snapshots.py."""
+    __tablename__ = 'sheet_snapshots'
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id'), primary_key=True)
+    # snapshots.FORMAT the row was built with
+    format = db.Column(db.Integer, nullable=False)
+    # zlib-compressed JSON
+    data = db.Column(db.LargeBinary, nullable=False)
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SheetEvent(db.Model):
+    """A change to a sheet, queued for its live event streams; see events.py."""
+    __tablename__ = 'sheet_events'
+    __table_args__ = (
+        db.Index('ix_sheet_events_sheet_id_id', 'sheet_id', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id'), nullable=False)
+    # Progress events only go to streams of this learner; NULL goes to everyone
+    learner_id = db.Column(db.Integer, db.ForeignKey('learners.id'))
+    # 'progress', 'patch' or 'layout'
+    kind = db.Column(db.String(20), nullable=False)
+    # JSON body sent as the event data
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ImportJob(db.Model):
+    """A CSV import run in the background; see jobs.py."""
+    __tablename__ = 'import_jobs'
+    __table_args__ = (
+        db.Index('ix_import_jobs_status', 'status'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    sheet_id = db.Column(db.Integer, db.ForeignKey('sheets.id'), nullable=False)
+    # queued -> running -> done | failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    filename = db.Column(db.String(255), default='')
+    path = db.Column(db.String(500), nullable=False)
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    rows_skipped = db.Column(db.Integer, nullable=False, default=0)
+    # JSON list of {'row', 'error'} for rows that could not be parsed
+    errors = db.Column(db.Text, default='[]')
+    # Why the job failed, when it did
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class CacheVersion(db.Model):
+    """Version stamp per cache scope and key; see page_cache.py."""
+    __tablename__ = 'cache_versions'
+    scope = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
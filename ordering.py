@@ -0,0 +1,103 @@
+"""Child positions and bulk reordering.
+
+Every container keeps its children in a position column: chapters in a book
+(Chapter.order), sheets in a chapter (Sheet.order), sections in a sheet
+(Section.section_order), boxes in a section (Box.box_number) and tasks in a
+box (Task.task_order). `reorder` and `move` rewrite the positions of whole
+containers to 1..n with one bulk UPDATE by primary key and one set-based
+UPDATE, whatever the number of children.
+
+Sections, boxes and tasks have unique indexes that include their position,
+and SQLite checks those row by row, so a single UPDATE that swaps two
+positions would collide halfway. The write therefore goes in two phases.
+First every row gets its new parent and the negated new position, which
+cannot clash with any live position. Then one UPDATE flips the signs back.
+"""
+from sqlalchemy import select, update
+
+from models import db, Book, Chapter, Sheet, Section, Box, Task
+from importer import MAX_BOXES
+
+# container -> (child model, parent key attribute, position attribute)
+CONTAINERS = {
+    'book': (Chapter, 'book_id', 'order'),
+    'chapter': (Sheet, 'chapter_id', 'order'),
+    'sheet': (Section, 'sheet_id', 'section_order'),
+    'section': (Box, 'section_id', 'box_number'),
+    'box': (Task, 'box_id', 'task_order'),
+}
+PARENT_MODELS = {'book': Book, 'chapter': Chapter, 'sheet': Sheet, 'section': Section, 'box': Box}
+
+
+class OrderingError(ValueError):
+    """A reorder or move request that does not fit the current data."""
+
+
+def children(container, parent_ids):
+    """Map each parent id -> its child ids in display order, in one query."""
+    model, parent_attr, position_attr = CONTAINERS[container]
+    parent = getattr(model, parent_attr)
+    layout = {parent_id: [] for parent_id in parent_ids}
+    rows = db.session.execute(
+        select(model.id, parent)
+        .where(parent.in_(list(parent_ids)))
+        .order_by(parent, getattr(model, position_attr), model.id)
+    )
+    for id_, parent_id in rows:
+        layout[parent_id].append(id_)
+    return layout
+
+
+def write_positions(container, layout):
+    """Store `layout` ({parent id: [child ids]}) as parents and gap-free positions."""
+    model, parent_attr, position_attr = CONTAINERS[container]
+    rows = [{'id': child_id, parent_attr: parent_id, position_attr: -position}
+            for parent_id, child_ids in layout.items()
+            for position, child_id in enumerate(child_ids, start=1)]
+    if not rows:
+        return
+    db.session.execute(update(model), rows)
+    position = getattr(model, position_attr)
+    db.session.execute(
+        update(model)
+        .where(getattr(model, parent_attr).in_(list(layout)), position < 0)
+        .values({position: -position})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reorder(container, parent_id, ids):
+    """Put a container's children in the order given; `ids` must list every child exactly once."""
+    current = children(container, [parent_id])[parent_id]
+    if len(ids) != len(set(ids)) or set(ids) != set(current):
+        raise OrderingError('La lista debe contener exactamente los elementos actuales, sin repetir')
+    write_positions(container, {parent_id: list(ids)})
+
+
+def move(container, ids, target_id, position=None):
+    """Move children into `target_id` at 1-based `position` (default: the end).
+
+    Both the source and target containers are renumbered. Returns
+    {child id: previous parent id}. Moving boxes respects MAX_BOXES per section.
+    """
+    model, parent_attr, _ = CONTAINERS[container]
+    if len(ids) != len(set(ids)):
+        raise OrderingError('La lista contiene elementos repetidos')
+    sources = dict(db.session.execute(
+        select(model.id, getattr(model, parent_attr)).where(model.id.in_(ids))
+    ).all())
+    missing = set(ids) - set(sources)
+    if missing:
+        raise OrderingError(f'Elementos no encontrados: {sorted(missing)}')
+
+    layout = children(container, set(sources.values()) | {target_id})
+    moving = set(ids)
+    for parent_id in layout:
+        layout[parent_id] = [id_ for id_ in layout[parent_id] if id_ not in moving]
+    target = layout[target_id]
+    index = len(target) if position is None else min(max(position - 1, 0), len(target))
+    target[index:index] = ids
+    if container == 'section' and len(target) > MAX_BOXES:
+        raise OrderingError(f'Límite de {MAX_BOXES} boxes por sección')
+    write_positions(container, layout)
+    return sources
@@ -0,0 +1,195 @@
+"""Version-stamped HTTP caching for the read pages.
+
+Every page is identified by a scope and id: ('root', 0) for the dashboard and
+category list, ('book', id), ('chapter', id) and ('sheet', id). Write routes
+bump version rows in cache_versions through `touch`. A node has three kinds
+of version, because its pages and its relatives' pages show different parts
+of it:
+
+    (scope, id)          its own page: everything the page renders besides
+                         aggregates and the ancestors' names
+    (scope + '.stats', id)  progress and counts summed over its sheets,
+                         shown on its page ('chapter', 'book' only)
+    (scope + '.name', id)   its name, shown in its descendants' breadcrumbs
+
+A page's ETag covers only what it renders: its own two versions and the
+names of its ancestors. The dashboard also shows every book's progress, so
+its ETag adds the sum of all 'book.stats' versions (they only ever grow).
+`touch('sheet', id)`, for anything inside a sheet including a progress
+toggle, bumps that sheet and the stats of its chapter and book; other
+sheets, the names and the root keep their ETags. Creating, renaming or
+deleting a node passes `listing=True`, which also bumps its name and its
+parent's page, where it is listed.
+
+A conditional GET costs two small queries and no rendering. Rendered HTML
+is also kept in a byte-bounded in-process LRU, evicted on every bump of a
+page's own or stats version; entries carry their ETag, so a worker that missed
+another worker's bump still never serves stale HTML.
+
+Pages show the current learner's progress, so the learner id is part of both
+the ETag and the cache key, and a bump evicts every learner's copy.
+"""
+import hashlib
+import os
+from functools import wraps
+
+from flask import abort, make_response, request, session
+from sqlalchemy import and_, func, or_, select, update
+
+from lru import LRUCache
+from models import db, CacheVersion, Book, Chapter, Sheet
+import learners
+
+ROOT = ('root', 0)
+# Scopes whose pages show aggregates of their sheets
+STATS_SCOPES = ('chapter', 'book')
+
+cache = LRUCache(
+    int(os.environ.get('PAGE_CACHE_SIZE', 512)),
+    maxweight=int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    weigh=lambda entry: len(entry[1]),
+)
+
+
+def _build_digest():
+    """Fingerprint of the templates and static files, so a deploy that changes markup changes every ETag."""
+    digest = hashlib.sha1()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for folder in ('templates', 'static'):
+        for dirpath, dirnames, filenames in sorted(os.walk(os.path.join(root, folder))):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                with open(path, 'rb') as fh:
+                    digest.update(os.path.relpath(path, root).encode() + fh.read())
+    return digest.hexdigest()[:12]
+
+
+BUILD = os.environ.get('LEARNBOARD_BUILD') or _build_digest()
+
+
+def chain(scope, id_):
+    """Return the (scope, id) keys from a page up to the root, or None if it does not exist."""
+    if scope == 'root':
+        return [ROOT]
+    if scope == 'sheet':
+        row = db.session.execute(
+            select(Sheet.chapter_id, Chapter.book_id)
+            .join(Chapter, Sheet.chapter_id == Chapter.id)
+            .where(Sheet.id == id_)
+        ).first()
+        return row and [('sheet', id_), ('chapter', row.chapter_id), ('book', row.book_id), ROOT]
+    if scope == 'chapter':
+        book_id = db.session.execute(select(Chapter.book_id).where(Chapter.id == id_)).scalar()
+        return book_id and [('chapter', id_), ('book', book_id), ROOT]
+    if scope == 'book':
+        exists = db.session.execute(select(Book.id).where(Book.id == id_)).scalar()
+        return exists and [('book', id_), ROOT]
+    raise ValueError(f'Unknown cache scope {scope!r}')
+
+
+def _match(keys):
+    return or_(*(and_(CacheVersion.scope == scope, CacheVersion.key == key) for scope, key in keys))
+
+
+def bump(keys):
+    """Increment the version of every key, creating rows on first use, and evict their pages."""
+    keys = list(dict.fromkeys(keys))
+    result = db.session.execute(
+        update(CacheVersion)
+        .where(_match(keys))
+        .values(version=CacheVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount < len(keys):
+        existing = set(db.session.execute(
+            select(CacheVersion.scope, CacheVersion.key).where(_match(keys))
+        ).tuples())
+        db.session.add_all(CacheVersion(scope=scope, key=key, version=1)
+                           for scope, key in keys if (scope, key) not in existing)
+    # A stats bump changes the node's own page; a name bump only its descendants', whose entries carry their ETag
+    pages = {(scope.split('.')[0], key) for scope, key in keys if not scope.endswith('.name')}
+    cache.pop_where(lambda cache_key: cache_key[:2] in pages)
+
+
+def touch(scope, id_, listing=False):
+    """Bump a page and the stats of its ancestors; with `listing`, also its name and its parent's page.
+
+    Call before deleting, while the chain still resolves.
+    """
+    keys = chain(scope, id_)
+    if not keys:
+        bump([ROOT])
+        return
+    bumped = [keys[0]] + [(f'{s}.stats', k) for s, k in keys if s in STATS_SCOPES]
+    if listing and len(keys) > 1:
+        bumped += [(f'{scope}.name', id_), keys[1]]
+    bump(bumped)
+
+
+def page_keys(keys):
+    """The versions a page's ETag covers, from its chain."""
+    (scope, id_), ancestors = keys[0], keys[1:]
+    own = [(scope, id_)] + ([(f'{scope}.stats', id_)] if scope in STATS_SCOPES else [])
+    return own + [(f'{s}.name', k) for s, k in ancestors if s != 'root']
+
+
+def etag_for(scope, id_, stats=None):
+    """ETag of a page, or None if it does not exist. `stats` names a scope whose every stats version counts."""
+    keys = chain(scope, id_)
+    if not keys:
+        return None
+    keys = page_keys(keys)
+    versions = dict(
+        ((scope_, key), version) for scope_, key, version in db.session.execute(
+            select(CacheVersion.scope, CacheVersion.key, CacheVersion.version).where(_match(keys))
+        )
+    )
+    stamp = ';'.join(f'{s}:{k}:{versions.get((s, k), 0)}' for s, k in keys)
+    if stats:
+        total = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(CacheVersion.version), 0))
+            .where(CacheVersion.scope == f'{stats}.stats')
+        ).one()
+        stamp += f';{stats}.stats:{total[0]}:{total[1]}'
+    learner = learners.current_id()
+    return hashlib.sha1(f'{BUILD};{request.endpoint};{learner};{stamp}'.encode()).hexdigest()
+
+
+def cached_page(scope, stats=None):
+    """Serve a GET view with a strong ETag, 304s and the rendered-page cache.
+
+    The view must return the rendered HTML string. `scope` names the page
+    kind; the view's `id` argument is its key ('root' pages take none).
+    `stats` is for pages that show the aggregates of every node of a scope
+    (see etag_for).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # A pending flash message is one-off output, and a query string selects a
+            # later listing page (?after=...): render fresh and never cache either
+            if session.get('_flashes') or request.args:
+                return view(**kwargs)
+            id_ = kwargs.get('id', 0)
+            etag = etag_for(scope, id_, stats)
+            if etag is None:
+                abort(404)
+            cache_key = (scope, id_, request.endpoint, learners.current_id())
+            response = make_response()
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            # Weak comparison: compression.py sends the same ETag weakened
+            if request.if_none_match.contains_weak(etag):
+                return response.make_conditional(request)
+
+            entry = cache.get(cache_key)
+            if entry is not None and entry[0] == etag:
+                html = entry[1]
+            else:
+                html = view(**kwargs).encode()
+                cache.put(cache_key, (etag, html))
+            response.set_data(html)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
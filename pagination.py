@@ -0,0 +1,87 @@
+"""Keyset (seek) pagination for the listing pages.
+
+OFFSET pagination makes SQLite walk and throw away every skipped row, so a
+later page costs more than an early one. A keyset page continues strictly
+after the sort key of the last row already shown instead:
+
+    WHERE (name, id) > (:name, :id) ORDER BY name, id LIMIT :n
+
+An index on the sort columns answers that with one seek, wherever the page
+is. The id tiebreak makes the order total, so rows with equal names are
+never skipped or repeated between pages. Nullable sort columns (the
+chapter and sheet `order`) sort and compare as coalesce(order, 0): a tuple
+comparison against NULL is never true, so rows after a NULL would be lost.
+
+The position travels in the URL as an opaque cursor, which is the last row's
+sort key encoded as URL-safe base64 JSON.
+"""
+import base64
+import binascii
+import json
+import os
+
+from flask import abort
+from sqlalchemy import func, tuple_
+
+from models import db
+
+PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 24))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip('=')
+
+
+def _sort_key(column):
+    return func.coalesce(column, 0) if column.nullable else column
+
+
+def _fits(value, column):
+    expected = column.type.python_type
+    # json.loads turns true into a bool, which is also an int
+    return isinstance(value, expected) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor, columns):
+    """Sort key for `columns` from a cursor; aborts with 400 when it was not made by encode_cursor.
+
+    Only a list holding one value of each column's type is accepted, so
+    nothing else is ever bound into the keyset comparison.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(400)
+    if (not isinstance(values, list) or len(values) != len(columns)
+            or not all(_fits(value, column) for value, column in zip(values, columns))):
+        abort(400)
+    return values
+
+
+def after(statement, columns, cursor):
+    """Restrict `statement` to the rows sorting after `cursor` (None means the start)."""
+    keys = [_sort_key(column) for column in columns]
+    statement = statement.order_by(*keys)
+    if cursor is None:
+        return statement
+    values = decode_cursor(cursor, columns)
+    return statement.where(tuple_(*keys) > tuple_(*values))
+
+
+def page(statement, columns, cursor=None, size=PAGE_SIZE):
+    """Run one page of an entity `statement` ordered by `columns`.
+
+    Returns (items, next_cursor). next_cursor is None on the last page. One
+    extra row is fetched to tell whether another page exists.
+    """
+    items = db.session.execute(after(statement, columns, cursor).limit(size + 1)).scalars().all()
+    return items[:size], next_cursor(items, columns, size)
+
+
+def next_cursor(items, columns, size):
+    """Cursor after the `size`-th item, or None when `items` holds no more than `size`."""
+    if len(items) <= size:
+        return None
+    last = items[size - 1]
+    values = (getattr(last, column.key) for column in columns)
+    return encode_cursor(0 if value is None else value for value in values)
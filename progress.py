@@ -0,0 +1,406 @@
+"""Per-learner task progress, stored as bitsets, and the task total counters.
+
+Every task has a bit_index, unique within its sheet. `allocate_bits` hands
+these out from Sheet.next_bit, and indexes are never reused. A learner's
+progress in a sheet is one sheet_progress row: a little-endian bitset where
+bit n is set when the task with bit_index n is done, plus the bitset's
+popcount. Toggling a task rewrites that one small blob, and reading a sheet's
+progress reads one row instead of a row per task.
+
+A sheet's completed count is the stored popcount. A section's is the popcount
+of the bitset masked to the bit indexes of the section's tasks, so moving
+tasks between sections of a sheet needs no progress writes at all.
+
+Task totals do not depend on the learner. They stay as denormalized counters
+(Section.total_tasks, Sheet.total_tasks), adjusted in the same transaction by
+the routes that add, move or remove tasks. Removing tasks must clear their
+bits in every learner's bitset (`clear_bits`), so popcounts never count
+deleted tasks. `rebuild` recomputes the totals and popcounts and drops stray
+bits. `find_mismatches` reports any drift.
+"""
+from datetime import datetime
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Sheet, Section, Box, Task, SheetProgress
+
+
+def percent(completed, total):
+    return round((completed / total * 100) if total > 0 else 0)
+
+
+def progress_dict(completed, total):
+    return {'total': total, 'completed': completed, 'percent': percent(completed, total)}
+
+
+# ---- bitsets ----
+
+def to_int(bits):
+    return int.from_bytes(bits or b'', 'little')
+
+
+def to_bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+def mask(bit_indexes):
+    value = 0
+    for bit in bit_indexes:
+        value |= 1 << bit
+    return value
+
+
+def allocate_bits(sheet_id, count):
+    """Reserve `count` consecutive bit indexes in a sheet and return the first."""
+    end = db.session.execute(
+        update(Sheet)
+        .where(Sheet.id == sheet_id)
+        .values(next_bit=Sheet.next_bit + count)
+        .returning(Sheet.next_bit)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+    return end - count
+
+
+def assign_missing_bits(task_ids):
+    """Give the tasks among `task_ids` that have no bit_index one from their sheet.
+
+    Every write path allocates bits, so only rows written around the app lack
+    one. Returns the ids of the sheets whose tasks got bits, whose snapshots
+    the caller must mark.
+    """
+    rows = db.session.execute(
+        select(Task.id, Section.sheet_id)
+        .join(Box, Task.box_id == Box.id)
+        .join(Section, Box.section_id == Section.id)
+        .where(Task.id.in_(list(task_ids)), Task.bit_index.is_(None))
+        .order_by(Task.id)
+    ).all()
+    by_sheet = {}
+    for task_id, sheet_id in rows:
+        by_sheet.setdefault(sheet_id, []).append(task_id)
+    for sheet_id, ids in by_sheet.items():
+        first = allocate_bits(sheet_id, len(ids))
+        db.session.execute(update(Task), [{'id': id_, 'bit_index': first + n} for n, id_ in enumerate(ids)])
+    return set(by_sheet)
+
+
+def load_bits(learner_id, sheet_ids):
+    """Map each sheet id -> the learner's bitset as an int (0 when nothing is done)."""
+    bits = {sheet_id: 0 for sheet_id in sheet_ids}
+    if bits:
+        rows = db.session.execute(
+            select(SheetProgress.sheet_id, SheetProgress.bits)
+            .where(SheetProgress.learner_id == learner_id, SheetProgress.sheet_id.in_(list(bits)))
+        )
+        bits.update((sheet_id, to_int(value)) for sheet_id, value in rows)
+    return bits
+
+
+def save_bits(learner_id, sheet_id, value):
+    """Store a learner's bitset for a sheet with one upsert."""
+    row = {'learner_id': learner_id, 'sheet_id': sheet_id, 'bits': to_bytes(value),
+           'completed': value.bit_count(), 'updated_at': datetime.utcnow()}
+    stmt = sqlite_insert(SheetProgress).values(row)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[SheetProgress.learner_id, SheetProgress.sheet_id],
+        set_={key: stmt.excluded[key] for key in ('bits', 'completed', 'updated_at')},
+    ))
+
+
+def clear_bits(sheet_id, bit_indexes):
+    """Clear bits in every learner's bitset of a sheet, before their tasks are deleted."""
+    cleared = ~mask(bit for bit in bit_indexes if bit is not None)
+    if cleared == -1:
+        return
+    rows = db.session.execute(
+        select(SheetProgress.learner_id, SheetProgress.bits).where(SheetProgress.sheet_id == sheet_id)
+    ).all()
+    changed = []
+    for learner_id, bits in rows:
+        value = to_int(bits)
+        if value & cleared != value:
+            value &= cleared
+            changed.append({'learner_id': learner_id, 'sheet_id': sheet_id,
+                            'bits': to_bytes(value), 'completed': value.bit_count()})
+    if changed:
+        db.session.execute(update(SheetProgress), changed)
+
+
+# ---- task totals ----
+
+def task_location(task_id):
+    """Return (task_id, section_id, sheet_id, bit_index) for a task, or None."""
+    return db.session.execute(
+        select(Task.id, Box.section_id, Section.sheet_id, Task.bit_index)
+        .join(Box, Task.box_id == Box.id)
+        .join(Section, Box.section_id == Section.id)
+        .where(Task.id == task_id)
+    ).first()
+
+
+def adjust(section_id, sheet_id, total):
+    """Apply a delta to the task totals of one section and its sheet."""
+    adjust_section(section_id, total)
+    adjust_sheet(sheet_id, total)
+
+
+def adjust_section(section_id, total):
+    """Apply a delta to the task total of a section only."""
+    if not total:
+        return
+    db.session.execute(
+        update(Section)
+        .where(Section.id == section_id)
+        .values(total_tasks=Section.total_tasks + total)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def adjust_sheet(sheet_id, total):
+    """Apply a delta to the task total of a sheet only."""
+    if not total:
+        return
+    db.session.execute(
+        update(Sheet)
+        .where(Sheet.id == sheet_id)
+        .values(total_tasks=Sheet.total_tasks + total)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def task_bits(scope, id_):
+    """Bit indexes of every task in one box or section."""
+    stmt = select(Task.bit_index).join(Box, Task.box_id == Box.id)
+    if scope == 'box':
+        stmt = stmt.where(Box.id == id_)
+    elif scope == 'section':
+        stmt = stmt.where(Box.section_id == id_)
+    else:
+        raise ValueError(f'Unknown scope {scope!r}')
+    return db.session.execute(stmt).scalars().all()
+
+
+def task_locations(task_ids):
+    """Return (task_id, section_id, sheet_id) rows for many tasks in one query."""
+    return db.session.execute(
+        select(Task.id, Box.section_id, Section.sheet_id)
+        .join(Box, Task.box_id == Box.id)
+        .join(Section, Box.section_id == Section.id)
+        .where(Task.id.in_(list(task_ids)))
+    ).all()
+
+
+def boxes_counts(box_ids):
+    """Map box id -> (section_id, sheet_id, total) for many boxes in one query."""
+    rows = db.session.execute(
+        select(Box.id, Box.section_id, Section.sheet_id, func.count(Task.id))
+        .join(Section, Box.section_id == Section.id)
+        .outerjoin(Task, Task.box_id == Box.id)
+        .where(Box.id.in_(list(box_ids)))
+        .group_by(Box.id)
+    )
+    return {id_: (section_id, sheet_id, total) for id_, section_id, sheet_id, total in rows}
+
+
+# ---- reading and writing a learner's progress ----
+
+def sheet_progress(learner_id, sheet, sections):
+    """Progress of a loaded sheet tree for sheet.html.
+
+    Returns (section progress dicts, sheet progress dict, ids of completed
+    tasks). Masks come from the tasks already loaded, so the only extra
+    query reads the learner's bitset.
+    """
+    bits = load_bits(learner_id, [sheet.id])[sheet.id]
+    section_progress, completed_ids = {}, set()
+    for section in sections:
+        done = 0
+        for box in section.boxes:
+            for task in box.tasks:
+                if task.bit_index is not None and bits >> task.bit_index & 1:
+                    completed_ids.add(task.id)
+                    done += 1
+        section_progress[section.id] = progress_dict(done, section.total_tasks)
+    return section_progress, progress_dict(bits.bit_count(), sheet.total_tasks), completed_ids
+
+
+def completed_task_ids(learner_id, sheet_id, tasks):
+    """Ids of the given tasks (all from one sheet) that the learner has completed."""
+    bits = load_bits(learner_id, [sheet_id])[sheet_id]
+    return {task.id for task in tasks if task.bit_index is not None and bits >> task.bit_index & 1}
+
+
+def toggle(learner_id, location):
+    """Flip one task for a learner; `location` comes from task_location. Returns the new state.
+
+    The task must have a bit_index (see assign_missing_bits).
+    """
+    bits = load_bits(learner_id, [location.sheet_id])[location.sheet_id]
+    bits ^= 1 << location.bit_index
+    save_bits(learner_id, location.sheet_id, bits)
+    return bool(bits >> location.bit_index & 1)
+
+
+def set_completed(learner_id, task_ids, completed):
+    """Set the completed state of many tasks at once for a learner.
+
+    Returns (missing_ids, section_deltas, sheet_deltas) where the delta maps
+    go from id to the change in completed tasks. Nothing is written when any
+    id is unknown. Runs two reads plus one upsert per affected sheet. The
+    tasks must have bit indexes (see assign_missing_bits).
+    """
+    task_ids = set(task_ids)
+    rows = db.session.execute(
+        select(Task.id, Box.section_id, Section.sheet_id, Task.bit_index)
+        .join(Box, Task.box_id == Box.id)
+        .join(Section, Box.section_id == Section.id)
+        .where(Task.id.in_(task_ids))
+    ).all()
+    missing = task_ids - {row[0] for row in rows}
+    if missing:
+        return sorted(missing), {}, {}
+
+    bits = load_bits(learner_id, {row.sheet_id for row in rows})
+    section_deltas, sheet_deltas = {}, {}
+    step = 1 if completed else -1
+    for task_id, section_id, sheet_id, bit in rows:
+        if bool(bits[sheet_id] >> bit & 1) == completed:
+            continue
+        bits[sheet_id] ^= 1 << bit
+        section_deltas[section_id] = section_deltas.get(section_id, 0) + step
+        sheet_deltas[sheet_id] = sheet_deltas.get(sheet_id, 0) + step
+    for sheet_id in sheet_deltas:
+        save_bits(learner_id, sheet_id, bits[sheet_id])
+    return [], section_deltas, sheet_deltas
+
+
+def read_progress(learner_id, section_ids=(), sheet_ids=()):
+    """Progress dicts of the given sections and sheets for a learner."""
+    sections, sheets = {}, {}
+    if section_ids:
+        rows = db.session.execute(
+            select(Section.id, Section.sheet_id, Section.total_tasks, Task.bit_index)
+            .outerjoin(Box, Box.section_id == Section.id)
+            .outerjoin(Task, Task.box_id == Box.id)
+            .where(Section.id.in_(list(section_ids)))
+        ).all()
+        bits = load_bits(learner_id, {row.sheet_id for row in rows})
+        done, totals = {}, {}
+        for section_id, sheet_id, total, bit in rows:
+            totals[section_id] = total
+            hit = bit is not None and bits[sheet_id] >> bit & 1
+            done[section_id] = done.get(section_id, 0) + hit
+        sections = {id_: progress_dict(done[id_], total) for id_, total in totals.items()}
+    if sheet_ids:
+        rows = db.session.execute(
+            select(Sheet.id, func.coalesce(SheetProgress.completed, 0), Sheet.total_tasks)
+            .outerjoin(SheetProgress, (SheetProgress.sheet_id == Sheet.id)
+                       & (SheetProgress.learner_id == learner_id))
+            .where(Sheet.id.in_(list(sheet_ids)))
+        )
+        sheets = {id_: progress_dict(completed, total) for id_, completed, total in rows}
+    return sections, sheets
+
+
+# ---- maintenance ----
+
+def _computed_section_totals():
+    return (select(func.count(Task.id))
+            .join(Box, Task.box_id == Box.id)
+            .where(Box.section_id == Section.id)
+            .correlate(Section)
+            .scalar_subquery())
+
+
+def _computed_sheet_totals():
+    return (select(func.coalesce(func.sum(Section.total_tasks), 0))
+            .where(Section.sheet_id == Sheet.id)
+            .correlate(Sheet)
+            .scalar_subquery())
+
+
+def _live_masks(sheet_id=None):
+    """Map sheet id -> mask of the bit indexes of its existing tasks."""
+    stmt = (select(Section.sheet_id, Task.bit_index)
+            .join(Box, Box.section_id == Section.id)
+            .join(Task, Task.box_id == Box.id)
+            .where(Task.bit_index.is_not(None)))
+    if sheet_id is not None:
+        stmt = stmt.where(Section.sheet_id == sheet_id)
+    masks = {}
+    for sheet_id_, bit in db.session.execute(stmt):
+        masks[sheet_id_] = masks.get(sheet_id_, 0) | 1 << bit
+    return masks
+
+
+def _progress_rows(sheet_id=None):
+    stmt = select(SheetProgress.learner_id, SheetProgress.sheet_id, SheetProgress.bits, SheetProgress.completed)
+    if sheet_id is not None:
+        stmt = stmt.where(SheetProgress.sheet_id == sheet_id)
+    return db.session.execute(stmt)
+
+
+def rebuild(sheet_id=None):
+    """Recompute task totals and popcounts, dropping bits of deleted tasks; one sheet or all."""
+    stmt = update(Section).values(total_tasks=_computed_section_totals())
+    if sheet_id is not None:
+        stmt = stmt.where(Section.sheet_id == sheet_id)
+    db.session.execute(stmt.execution_options(synchronize_session=False))
+
+    stmt = update(Sheet).values(total_tasks=_computed_sheet_totals())
+    if sheet_id is not None:
+        stmt = stmt.where(Sheet.id == sheet_id)
+    db.session.execute(stmt.execution_options(synchronize_session=False))
+
+    masks = _live_masks(sheet_id)
+    changed = []
+    for learner_id, sheet_id_, bits, completed in _progress_rows(sheet_id):
+        value = to_int(bits) & masks.get(sheet_id_, 0)
+        if to_bytes(value) != bits or value.bit_count() != completed:
+            changed.append({'learner_id': learner_id, 'sheet_id': sheet_id_,
+                            'bits': to_bytes(value), 'completed': value.bit_count()})
+    if changed:
+        db.session.execute(update(SheetProgress), changed)
+
+
+def drifted_sheets():
+    """Ids of the sheets whose stored section or sheet task totals differ from the real counts."""
+    mismatches = find_mismatches()
+    sheet_ids = {id_ for kind, id_, _, _ in mismatches if kind == 'sheet'}
+    section_ids = [id_ for kind, id_, _, _ in mismatches if kind == 'section']
+    if section_ids:
+        sheet_ids.update(db.session.execute(
+            select(Section.sheet_id).where(Section.id.in_(section_ids))
+        ).scalars())
+    return sheet_ids
+
+
+def find_mismatches():
+    """Return a list of (kind, id, stored, computed) tuples for drifted counters.
+
+    Sections and sheets are checked for their task totals, and every learner's
+    bitset for its stored popcount and for bits of tasks that no longer exist.
+    """
+    mismatches = []
+    rows = db.session.execute(select(Section.id, Section.total_tasks, _computed_section_totals()))
+    mismatches += [('section', id_, stored, real) for id_, stored, real in rows if stored != real]
+
+    # Sheets are checked against the real task counts, not the section
+    # counters, so a drifted section does not mask a drifted sheet.
+    sheet_total = (select(func.count(Task.id))
+                   .join(Box, Task.box_id == Box.id)
+                   .join(Section, Box.section_id == Section.id)
+                   .where(Section.sheet_id == Sheet.id)
+                   .correlate(Sheet)
+                   .scalar_subquery())
+    rows = db.session.execute(select(Sheet.id, Sheet.total_tasks, sheet_total))
+    mismatches += [('sheet', id_, stored, real) for id_, stored, real in rows if stored != real]
+
+    masks = _live_masks()
+    for learner_id, sheet_id, bits, completed in _progress_rows():
+        real = to_int(bits) & masks.get(sheet_id, 0)
+        if to_bytes(real) != bits or real.bit_count() != completed:
+            mismatches.append(('progress', (learner_id, sheet_id), completed, real.bit_count()))
+    return mismatches
@@ -0,0 +1,151 @@
+"""Read-side query helpers that load object graphs in a bounded number of queries."""
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, Book, Chapter, Sheet, Section, Box, SheetProgress
+import pagination
+import progress
+
+
+def load_sheet_tree(sheet_id):
+    """Load a sheet with its breadcrumb, sections, boxes, tasks and notes.
+
+    Runs a fixed number of SELECTs no matter how many sections, boxes or
+    tasks the sheet has: one for the sheet and its chapter/book, then one
+    per level of the tree. Boxes, tasks and notes come back in display
+    order through the relationship order_by. Returns (sheet, sections),
+    or (None, []) when the sheet does not exist.
+    """
+    sheet = db.session.execute(
+        db.select(Sheet)
+        .options(joinedload(Sheet.chapter).joinedload(Chapter.book))
+        .where(Sheet.id == sheet_id)
+    ).scalar_one_or_none()
+    if sheet is None:
+        return None, []
+    sections = db.session.execute(
+        db.select(Section)
+        .where(Section.sheet_id == sheet_id)
+        .order_by(Section.section_order)
+        .options(
+            selectinload(Section.boxes).selectinload(Box.tasks),
+            selectinload(Section.notes),
+        )
+    ).scalars().all()
+    return sheet, sections
+
+
+def load_section(section_id):
+    """Load one section with its boxes, tasks and notes, as in load_sheet_tree."""
+    return db.session.execute(
+        db.select(Section)
+        .where(Section.id == section_id)
+        .options(
+            selectinload(Section.boxes).selectinload(Box.tasks),
+            selectinload(Section.notes),
+        )
+    ).scalar_one_or_none()
+
+
+def load_box(box_id):
+    """Load one box with its section and tasks in two SELECTs."""
+    return db.session.execute(
+        db.select(Box)
+        .where(Box.id == box_id)
+        .options(joinedload(Box.section), selectinload(Box.tasks))
+    ).scalar_one_or_none()
+
+
+def _with_progress(statement, learner_id):
+    """Outer-join a statement over sheets to the learner's progress rows."""
+    return statement.outerjoin(SheetProgress, (SheetProgress.sheet_id == Sheet.id)
+                               & (SheetProgress.learner_id == learner_id))
+
+
+def book_progress(learner_id, book_ids):
+    """Map each book id -> the learner's progress dict, summed over its sheets in one GROUP BY."""
+    book_progress = {id_: progress.progress_dict(0, 0) for id_ in book_ids}
+    if not book_ids:
+        return book_progress
+    rows = db.session.execute(
+        _with_progress(select(Chapter.book_id, func.sum(Sheet.total_tasks), func.sum(SheetProgress.completed))
+                       .join(Sheet, Sheet.chapter_id == Chapter.id), learner_id)
+        .where(Chapter.book_id.in_(book_ids))
+        .group_by(Chapter.book_id)
+    )
+    for id_, total, completed in rows:
+        book_progress[id_] = progress.progress_dict(completed or 0, total or 0)
+    return book_progress
+
+
+def chapter_stats(learner_id, chapter_ids):
+    """Map chapter id -> the learner's progress dict plus its sheet count, for the given chapters."""
+    stats = {id_: dict(progress.progress_dict(0, 0), sheets=0) for id_ in chapter_ids}
+    if not chapter_ids:
+        return stats
+    rows = db.session.execute(
+        _with_progress(select(Sheet.chapter_id, func.count(Sheet.id),
+                              func.sum(Sheet.total_tasks), func.sum(SheetProgress.completed)), learner_id)
+        .where(Sheet.chapter_id.in_(chapter_ids))
+        .group_by(Sheet.chapter_id)
+    )
+    for id_, sheets, total, completed in rows:
+        stats[id_] = progress.progress_dict(completed or 0, total or 0)
+        stats[id_]['sheets'] = sheets
+    return stats
+
+
+def chapter_progress(learner_id, chapter_id):
+    """The learner's progress dict for one chapter, summed over its sheets."""
+    total, completed = db.session.execute(
+        _with_progress(select(func.sum(Sheet.total_tasks), func.sum(SheetProgress.completed)), learner_id)
+        .where(Sheet.chapter_id == chapter_id)
+    ).one()
+    return progress.progress_dict(completed or 0, total or 0)
+
+
+def section_counts(sheet_ids):
+    """Map sheet id -> number of sections, for the given sheets."""
+    if not sheet_ids:
+        return {}
+    rows = db.session.execute(
+        select(Section.sheet_id, func.count(Section.id))
+        .where(Section.sheet_id.in_(sheet_ids))
+        .group_by(Section.sheet_id)
+    )
+    return dict(rows.all())
+
+
+def book_counts(category_ids):
+    """Map category id -> number of books, for the given categories."""
+    if not category_ids:
+        return {}
+    rows = db.session.execute(
+        select(Book.category_id, func.count(Book.id))
+        .where(Book.category_id.in_(category_ids))
+        .group_by(Book.category_id)
+    )
+    return dict(rows.all())
+
+
+def first_books(category_ids, size=pagination.PAGE_SIZE):
+    """Map category id -> (its first `size` books by name, next cursor), in one query.
+
+    Every category gets its own LIMITed seek on ix_books_category_name, glued
+    together with UNION ALL, so a category with thousands of books costs the
+    same as one with a handful.
+    """
+    if not category_ids:
+        return {}
+    columns = [Book.name, Book.id]
+    firsts = union_all(*(
+        select(Book.id).where(Book.category_id == id_).order_by(*columns).limit(size + 1).subquery().select()
+        for id_ in category_ids
+    ))
+    books = {id_: [] for id_ in category_ids}
+    rows = db.session.execute(
+        select(Book).where(Book.id.in_(firsts)).order_by(Book.category_id, *columns)
+    ).scalars()
+    for book in rows:
+        books[book.category_id].append(book)
+    return {id_: (items[:size], pagination.next_cursor(items, columns, size)) for id_, items in books.items()}
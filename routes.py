@@ -0,0 +1,981 @@
+"""Request handlers, registered on the app by create_app() in app.py."""
+from flask import (Blueprint, Response, current_app, render_template, request, redirect, url_for, flash,
+                   jsonify, abort, get_template_attribute, stream_with_context)
+from werkzeug.utils import secure_filename
+from models import db, Category, Book, Chapter, Sheet, Section, Box, Task, Note, Learner, ImportJob
+import compression
+import deletes
+import events
+import exporter
+import importer
+import import_plans
+import instrumentation
+import jobs
+import learners
+import markdown_cache
+import ordering
+import page_cache
+import pagination
+import progress
+import queries
+import search
+import snapshots
+import serializers
+
+bp = Blueprint('main', __name__)
+
+# ==================== DASHBOARD ====================
+def listing_page(template, macro, macro_args, next_cursor, **context):
+    """Render one keyset page of a listing.
+
+    "Cargar más" asks for JSON and gets only the next cards (`macro` from
+    _macros.html) plus the following page's URL; a plain GET gets the whole
+    page with those cards.
+    """
+    next_url = url_for(request.endpoint, **request.view_args, after=next_cursor) if next_cursor else None
+    if 'after' in request.args and wants_partial():
+        return jsonify({'html': render_partial(macro, *macro_args), 'next': next_url})
+    context.setdefault('next_url', next_url)
+    return render_template(template, **context)
+
+@bp.route('/')
+@page_cache.cached_page('root', stats='book')
+def index():
+    categories, next_cursor = pagination.page(
+        db.select(Category).where(Category.books.any()), [Category.name, Category.id], request.args.get('after'))
+    books = queries.first_books([category.id for category in categories])
+    book_progress = queries.book_progress(learners.current_id(),
+                                          [book.id for items, _ in books.values() for book in items])
+    return listing_page('index.html', 'category_groups', (categories, books, book_progress), next_cursor,
+                        categories=categories, books=books, book_progress=book_progress)
+
+@bp.route('/category/<int:id>/books')
+def category_books(id):
+    category = Category.query.get_or_404(id)
+    items, next_cursor = pagination.page(
+        db.select(Book).where(Book.category_id == id), [Book.name, Book.id], request.args.get('after'))
+    book_progress = queries.book_progress(learners.current_id(), [book.id for book in items])
+    # Without JavaScript the next books open as a dashboard holding just this category,
+    # whose own "Cargar más" link carries the cursor
+    return listing_page('index.html', 'book_cards', (items, book_progress), next_cursor,
+                        categories=[category], books={id: (items, next_cursor)},
+                        book_progress=book_progress, next_url=None)
+
+# ==================== CATEGORY CRUD ====================
+@bp.route('/categories')
+@page_cache.cached_page('root')
+def list_categories():
+    categories, next_cursor = pagination.page(
+        db.select(Category), [Category.name, Category.id], request.args.get('after'))
+    book_counts = queries.book_counts([category.id for category in categories])
+    return listing_page('categories.html', 'category_cards', (categories, book_counts), next_cursor,
+                        categories=categories, book_counts=book_counts)
+
+@bp.route('/category/new', methods=['GET', 'POST'])
+def new_category():
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        description = request.form.get('description', '').strip()
+        if name:
+            category = Category(name=name, description=description)
+            db.session.add(category)
+            page_cache.touch('root', 0)
+            db.session.commit()
+            flash('Categoría creada exitosamente', 'success')
+            return redirect(url_for('.list_categories'))
+        flash('El nombre es requerido', 'error')
+    return render_template('category_form.html', category=None)
+
+@bp.route('/category/<int:id>/edit', methods=['GET', 'POST'])
+def edit_category(id):
+    category = Category.query.get_or_404(id)
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        description = request.form.get('description', '').strip()
+        if name:
+            category.name = name
+            category.description = description
+            page_cache.touch('root', 0)
+            db.session.commit()
+            flash('Categoría actualizada', 'success')
+            return redirect(url_for('.list_categories'))
+        flash('El nombre es requerido', 'error')
+    return render_template('category_form.html', category=category)
+
+@bp.route('/category/<int:id>/delete', methods=['POST'])
+def delete_category(id):
+    Category.query.get_or_404(id)
+    page_cache.touch('root', 0)
+    search.unindex_sheets(search.sheet_ids_under('category', id))
+    deletes.delete_subtree('category', id)
+    db.session.commit()
+    flash('Categoría eliminada', 'success')
+    return redirect(url_for('.list_categories'))
+
+# ==================== BOOK CRUD ====================
+@bp.route('/book/new', methods=['GET', 'POST'])
+def new_book():
+    categories = Category.query.order_by(Category.name).all()
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        description = request.form.get('description', '').strip()
+        category_id = request.form.get('category_id')
+        if name and category_id:
+            book = Book(name=name, description=description, category_id=int(category_id))
+            db.session.add(book)
+            db.session.flush()
+            page_cache.touch('book', book.id, listing=True)
+            db.session.commit()
+            flash('Libro creado exitosamente', 'success')
+            return redirect(url_for('.index'))
+        flash('Nombre y categoría son requeridos', 'error')
+    return render_template('book_form.html', book=None, categories=categories)
+
+@bp.route('/book/<int:id>')
+@page_cache.cached_page('book')
+def view_book(id):
+    book = Book.query.get_or_404(id)
+    chapters, next_cursor = pagination.page(
+        db.select(Chapter).where(Chapter.book_id == id), [Chapter.order, Chapter.id], request.args.get('after'))
+    learner_id = learners.current_id()
+    chapter_stats = queries.chapter_stats(learner_id, [chapter.id for chapter in chapters])
+    return listing_page('book.html', 'chapter_cards', (chapters, chapter_stats), next_cursor,
+                        book=book, chapters=chapters, chapter_stats=chapter_stats,
+                        book_progress=queries.book_progress(learner_id, [id])[id])
+
+@bp.route('/book/<int:id>/edit', methods=['GET', 'POST'])
+def edit_book(id):
+    book = Book.query.get_or_404(id)
+    categories = Category.query.order_by(Category.name).all()
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        description = request.form.get('description', '').strip()
+        category_id = request.form.get('category_id')
+        if name and category_id:
+            book.name = name
+            book.description = description
+            book.category_id = int(category_id)
+            page_cache.touch('book', id, listing=True)
+            snapshots.mark(snapshots.sheets_under('book', id))
+            db.session.commit()
+            flash('Libro actualizado', 'success')
+            return redirect(url_for('.view_book', id=id))
+        flash('Nombre y categoría son requeridos', 'error')
+    return render_template('book_form.html', book=book, categories=categories)
+
+@bp.route('/book/<int:id>/delete', methods=['POST'])
+def delete_book(id):
+    Book.query.get_or_404(id)
+    page_cache.touch('book', id, listing=True)
+    search.unindex_sheets(search.sheet_ids_under('book', id))
+    deletes.delete_subtree('book', id)
+    db.session.commit()
+    flash('Libro eliminado', 'success')
+    return redirect(url_for('.index'))
+
+# ==================== CHAPTER CRUD ====================
+@bp.route('/book/<int:book_id>/chapter/new', methods=['GET', 'POST'])
+def new_chapter(book_id):
+    book = Book.query.get_or_404(book_id)
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        description = request.form.get('description', '').strip()
+        order = request.form.get('order', 1, type=int)
+        if name:
+            chapter = Chapter(name=name, description=description, book_id=book_id, order=order)
+            db.session.add(chapter)
+            db.session.flush()
+            page_cache.touch('chapter', chapter.id, listing=True)
+            db.session.commit()
+            flash('Capítulo creado exitosamente', 'success')
+            return redirect(url_for('.view_book', id=book_id))
+        flash('El nombre es requerido', 'error')
+    max_order = db.session.query(db.func.max(Chapter.order)).filter_by(book_id=book_id).scalar() or 0
+    return render_template('chapter_form.html', chapter=None, book=book, next_order=max_order + 1)
+
+@bp.route('/chapter/<int:id>')
+@page_cache.cached_page('chapter')
+def view_chapter(id):
+    chapter = Chapter.query.get_or_404(id)
+    sheets, next_cursor = pagination.page(
+        db.select(Sheet).where(Sheet.chapter_id == id), [Sheet.order, Sheet.id], request.args.get('after'))
+    learner_id = learners.current_id()
+    sheet_progress = progress.read_progress(learner_id, sheet_ids=[sheet.id for sheet in sheets])[1]
+    section_counts = queries.section_counts([sheet.id for sheet in sheets])
+    return listing_page('chapter.html', 'sheet_cards', (sheets, sheet_progress, section_counts), next_cursor,
+                        chapter=chapter, sheets=sheets, sheet_progress=sheet_progress,
+                        chapter_progress=queries.chapter_progress(learner_id, id), section_counts=section_counts)
+
+@bp.route('/chapter/<int:id>/edit', methods=['GET', 'POST'])
+def edit_chapter(id):
+    chapter = Chapter.query.get_or_404(id)
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        description = request.form.get('description', '').strip()
+        order = request.form.get('order', chapter.order, type=int)
+        if name:
+            chapter.name = name
+            chapter.description = description
+            chapter.order = order
+            page_cache.touch('chapter', id, listing=True)
+            snapshots.mark(snapshots.sheets_under('chapter', id))
+            db.session.commit()
+            flash('Capítulo actualizado', 'success')
+            return redirect(url_for('.view_chapter', id=id))
+        flash('El nombre es requerido', 'error')
+    return render_template('chapter_form.html', chapter=chapter, book=chapter.book, next_order=chapter.order)
+
+@bp.route('/chapter/<int:id>/delete', methods=['POST'])
+def delete_chapter(id):
+    chapter = Chapter.query.get_or_404(id)
+    book_id = chapter.book_id
+    page_cache.touch('chapter', id, listing=True)
+    search.unindex_sheets(search.sheet_ids_under('chapter', id))
+    deletes.delete_subtree('chapter', id)
+    db.session.commit()
+    flash('Capítulo eliminado', 'success')
+    return redirect(url_for('.view_book', id=book_id))
+
+# ==================== SHEET CRUD ====================
+@bp.route('/chapter/<int:chapter_id>/sheet/new', methods=['GET', 'POST'])
+def new_sheet(chapter_id):
+    chapter = Chapter.query.get_or_404(chapter_id)
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        order = request.form.get('order', 1, type=int)
+        if name:
+            sheet = Sheet(name=name, chapter_id=chapter_id, order=order)
+            db.session.add(sheet)
+            db.session.flush()
+            page_cache.touch('sheet', sheet.id, listing=True)
+            snapshots.mark([sheet.id])
+            db.session.commit()
+            flash('Hoja de práctica creada exitosamente', 'success')
+            return redirect(url_for('.view_chapter', id=chapter_id))
+        flash('El nombre es requerido', 'error')
+    max_order = db.session.query(db.func.max(Sheet.order)).filter_by(chapter_id=chapter_id).scalar() or 0
+    return render_template('sheet_form.html', sheet=None, chapter=chapter, next_order=max_order + 1)
+
+@bp.route('/sheet/<int:id>')
+@page_cache.cached_page('sheet')
+def view_sheet(id):
+    snapshot = snapshots.load(id)
+    if snapshot is None:
+        abort(404)
+    bits = progress.load_bits(learners.current_id(), [id])[id]
+    section_progress, global_progress, completed = snapshots.learner_progress(snapshot, bits)
+    return render_template('sheet.html', sheet=snapshot.sheet, sections=snapshot.sections, 
+                         section_progress=section_progress, 
+                         global_progress=global_progress, completed=completed,
+                         last_event_id=events.last_id(id))
+
+@bp.route('/sheet/<int:id>/edit', methods=['GET', 'POST'])
+def edit_sheet(id):
+    sheet = Sheet.query.get_or_404(id)
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        order = request.form.get('order', sheet.order, type=int)
+        if name:
+            sheet.name = name
+            sheet.order = order
+            page_cache.touch('sheet', id, listing=True)
+            snapshots.mark([id])
+            db.session.commit()
+            flash('Hoja actualizada', 'success')
+            return redirect(url_for('.view_sheet', id=id))
+        flash('El nombre es requerido', 'error')
+    return render_template('sheet_form.html', sheet=sheet, chapter=sheet.chapter, next_order=sheet.order)
+
+@bp.route('/sheet/<int:id>/delete', methods=['POST'])
+def delete_sheet(id):
+    sheet = Sheet.query.get_or_404(id)
+    chapter_id = sheet.chapter_id
+    page_cache.touch('sheet', id, listing=True)
+    search.unindex_sheets([id])
+    deletes.delete_subtree('sheet', id)
+    db.session.commit()
+    flash('Hoja eliminada', 'success')
+    return redirect(url_for('.view_chapter', id=chapter_id))
+
+# ==================== INLINE EDIT RESPONSES ====================
+def wants_partial():
+    """True when sheet.html posted an inline form with fetch and expects JSON, not a redirect."""
+    return request.accept_mimetypes.best == 'application/json'
+
+def render_partial(macro, *args):
+    """Render one macro from _macros.html, the same markup sheet.html is built from."""
+    return get_template_attribute('_macros.html', macro)(*args)
+
+def inline_response(action, kind, id, parent_id=None, html=None, section_id=None, sheet_id=None):
+    """Tell sheet.html how to patch one item ('append', 'replace' or 'remove').
+
+    Fresh counters for `section_id` and `sheet_id` ride along when the change
+    moved them, so the progress bars update without a reload.
+    """
+    payload = {'success': True, 'action': action, 'kind': kind, 'id': id, 'parent_id': parent_id, 'html': html}
+    if section_id is not None or sheet_id is not None:
+        section_progress, sheet_progress = progress.read_progress(
+            learners.current_id(), [section_id] if section_id is not None else (), [sheet_id] if sheet_id is not None else ())
+        payload['section_progress'] = section_progress
+        if sheet_id is not None:
+            payload['global_progress'] = sheet_progress[sheet_id]
+    return jsonify(payload)
+
+def publish_patch(sheet_id, action, kind, id, parent_id=None, html=None):
+    """Queue an inline change for the sheet's live streams and return it as inline_response arguments.
+
+    Call before committing, so the event is stored and the sheet's snapshot
+    rebuilt in the same transaction.
+    """
+    patch = {'action': action, 'kind': kind, 'id': id, 'parent_id': parent_id, 'html': html}
+    events.publish(sheet_id, 'patch', patch)
+    snapshots.mark([sheet_id])
+    return patch
+
+def completed_in(sheet_id, boxes):
+    """Ids of the current learner's completed tasks among `boxes`, for the partial macros."""
+    return progress.completed_task_ids(learners.current_id(), sheet_id,
+                                       [task for box in boxes for task in box.tasks])
+
+def inline_error(message):
+    return jsonify({'success': False, 'error': message}), 400
+
+# ==================== SECTION CRUD (Inline) ====================
+@bp.route('/sheet/<int:sheet_id>/section/new', methods=['POST'])
+def new_section(sheet_id):
+    sheet = Sheet.query.get_or_404(sheet_id)
+    level_name = request.form.get('level_name', '').strip()
+    if level_name:
+        max_order = db.session.query(db.func.max(Section.section_order)).filter_by(sheet_id=sheet_id).scalar() or 0
+        section = Section(level_name=level_name, section_order=max_order + 1, sheet_id=sheet_id)
+        db.session.add(section)
+        db.session.flush()
+        search.index_item('section', section.id, level_name, sheet_id)
+        page_cache.touch('sheet', sheet_id)
+        html = render_partial('sheet_section', section, progress.progress_dict(0, 0), set())
+        patch = publish_patch(sheet_id, 'append', 'section', section.id, sheet_id, html)
+        db.session.commit()
+        if wants_partial():
+            return inline_response(**patch)
+        flash('Sección creada', 'success')
+    elif wants_partial():
+        return inline_error('El nombre del nivel es requerido')
+    return redirect(url_for('.view_sheet', id=sheet_id))
+
+@bp.route('/section/<int:id>/edit', methods=['POST'])
+def edit_section(id):
+    section = Section.query.get_or_404(id)
+    level_name = request.form.get('level_name', '').strip()
+    if level_name:
+        section.level_name = level_name
+        search.index_item('section', id, level_name, section.sheet_id)
+        page_cache.touch('sheet', section.sheet_id)
+        section = queries.load_section(id)
+        section_progress = progress.read_progress(learners.current_id(), [id])[0][id]
+        html = render_partial('sheet_section', section, section_progress,
+                              completed_in(section.sheet_id, section.boxes))
+        patch = publish_patch(section.sheet_id, 'replace', 'section', id, section.sheet_id, html)
+        db.session.commit()
+        if wants_partial():
+            return inline_response(**patch)
+        flash('Sección actualizada', 'success')
+    elif wants_partial():
+        return inline_error('El nombre del nivel es requerido')
+    return redirect(url_for('.view_sheet', id=section.sheet_id))
+
+@bp.route('/section/<int:id>/delete', methods=['POST'])
+def delete_section(id):
+    section = Section.query.get_or_404(id)
+    sheet_id = section.sheet_id
+    progress.adjust_sheet(sheet_id, -section.total_tasks)
+    progress.clear_bits(sheet_id, progress.task_bits('section', id))
+    page_cache.touch('sheet', sheet_id)
+    search.unindex_section(id)
+    deletes.delete_subtree('section', id)
+    patch = publish_patch(sheet_id, 'remove', 'section', id, sheet_id)
+    db.session.commit()
+    if wants_partial():
+        return inline_response(**patch, sheet_id=sheet_id)
+    flash('Sección eliminada', 'success')
+    return redirect(url_for('.view_sheet', id=sheet_id))
+
+# ==================== BOX CRUD (Inline) ====================
+@bp.route('/section/<int:section_id>/box/new', methods=['POST'])
+def new_box(section_id):
+    section = Section.query.get_or_404(section_id)
+    box_title = request.form.get('box_title', '').strip()
+    if box_title:
+        max_num = db.session.query(db.func.max(Box.box_number)).filter_by(section_id=section_id).scalar() or 0
+        if max_num < 25:  # Limit to 25 boxes per section
+            box = Box(box_number=max_num + 1, box_title=box_title, section_id=section_id)
+            db.session.add(box)
+            db.session.flush()
+            search.index_item('box', box.id, box_title, section.sheet_id)
+            page_cache.touch('sheet', section.sheet_id)
+            patch = publish_patch(section.sheet_id, 'append', 'box', box.id, section_id,
+                                  render_partial('box_card', box, set()))
+            db.session.commit()
+            if wants_partial():
+                return inline_response(**patch)
+            flash('Box creado', 'success')
+        elif wants_partial():
+            return inline_error('Límite de 25 boxes alcanzado')
+        else:
+            flash('Límite de 25 boxes alcanzado', 'error')
+    elif wants_partial():
+        return inline_error('El título del box es requerido')
+    return redirect(url_for('.view_sheet', id=section.sheet_id))
+
+@bp.route('/box/<int:id>/edit', methods=['POST'])
+def edit_box(id):
+    box = Box.query.get_or_404(id)
+    box_title = request.form.get('box_title', '').strip()
+    if box_title:
+        box.box_title = box_title
+        search.index_item('box', id, box_title, box.section.sheet_id)
+        page_cache.touch('sheet', box.section.sheet_id)
+        box = queries.load_box(id)
+        html = render_partial('box_card', box, completed_in(box.section.sheet_id, [box]))
+        patch = publish_patch(box.section.sheet_id, 'replace', 'box', id, box.section_id, html)
+        db.session.commit()
+        if wants_partial():
+            return inline_response(**patch)
+        flash('Box actualizado', 'success')
+    elif wants_partial():
+        return inline_error('El título del box es requerido')
+    return redirect(url_for('.view_sheet', id=box.section.sheet_id))
+
+@bp.route('/box/<int:id>/delete', methods=['POST'])
+def delete_box(id):
+    box = Box.query.get_or_404(id)
+    section_id, sheet_id = box.section_id, box.section.sheet_id
+    bits = progress.task_bits('box', id)
+    progress.adjust(section_id, sheet_id, -len(bits))
+    progress.clear_bits(sheet_id, bits)
+    page_cache.touch('sheet', sheet_id)
+    search.unindex_box(id)
+    deletes.delete_subtree('box', id)
+    patch = publish_patch(sheet_id, 'remove', 'box', id, section_id)
+    db.session.commit()
+    if wants_partial():
+        return inline_response(**patch, section_id=section_id, sheet_id=sheet_id)
+    flash('Box eliminado', 'success')
+    return redirect(url_for('.view_sheet', id=sheet_id))
+
+# ==================== TASK CRUD (Inline) ====================
+@bp.route('/box/<int:box_id>/task/new', methods=['POST'])
+def new_task(box_id):
+    box = Box.query.get_or_404(box_id)
+    task_text = request.form.get('task_text', '').strip()
+    if task_text:
+        max_order = db.session.query(db.func.max(Task.task_order)).filter_by(box_id=box_id).scalar() or 0
+        task = Task(task_order=max_order + 1, task_text=task_text, box_id=box_id,
+                    bit_index=progress.allocate_bits(box.section.sheet_id, 1))
+        db.session.add(task)
+        progress.adjust(box.section_id, box.section.sheet_id, 1)
+        db.session.flush()
+        search.index_item('task', task.id, task_text, box.section.sheet_id)
+        page_cache.touch('sheet', box.section.sheet_id)
+        patch = publish_patch(box.section.sheet_id, 'append', 'task', task.id, box_id,
+                              render_partial('task_item', task, set()))
+        db.session.commit()
+        if wants_partial():
+            return inline_response(**patch, section_id=box.section_id, sheet_id=box.section.sheet_id)
+        flash('Tarea creada', 'success')
+    elif wants_partial():
+        return inline_error('El texto de la tarea es requerido')
+    return redirect(url_for('.view_sheet', id=box.section.sheet_id))
+
+@bp.route('/task/<int:id>/edit', methods=['POST'])
+def edit_task(id):
+    task = Task.query.get_or_404(id)
+    task_text = request.form.get('task_text', '').strip()
+    if task_text:
+        sheet_id = task.box.section.sheet_id
+        task.task_text = task_text
+        search.index_item('task', id, task_text, sheet_id)
+        page_cache.touch('sheet', sheet_id)
+        completed = progress.completed_task_ids(learners.current_id(), sheet_id, [task])
+        patch = publish_patch(sheet_id, 'replace', 'task', id, task.box_id,
+                              render_partial('task_item', task, completed))
+        db.session.commit()
+        if wants_partial():
+            return inline_response(**patch)
+        flash('Tarea actualizada', 'success')
+    elif wants_partial():
+        return inline_error('El texto de la tarea es requerido')
+    return redirect(url_for('.view_sheet', id=task.box.section.sheet_id))
+
+@bp.route('/task/<int:id>/delete', methods=['POST'])
+def delete_task(id):
+    task = Task.query.get_or_404(id)
+    location = progress.task_location(id)
+    sheet_id = location.sheet_id
+    box_id = task.box_id
+    progress.adjust(location.section_id, sheet_id, -1)
+    progress.clear_bits(sheet_id, [location.bit_index])
+    page_cache.touch('sheet', sheet_id)
+    search.unindex_item('task', id)
+    db.session.delete(task)
+    patch = publish_patch(sheet_id, 'remove', 'task', id, box_id)
+    db.session.commit()
+    if wants_partial():
+        return inline_response(**patch, section_id=location.section_id, sheet_id=sheet_id)
+    flash('Tarea eliminada', 'success')
+    return redirect(url_for('.view_sheet', id=sheet_id))
+
+# ==================== LEARNERS ====================
+@bp.route('/learners', methods=['GET', 'POST'])
+def list_learners():
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        if not name:
+            flash('El nombre es requerido', 'error')
+        elif Learner.query.filter_by(name=name).first():
+            flash('Ya existe un estudiante con ese nombre', 'error')
+        else:
+            learner = Learner(name=name)
+            db.session.add(learner)
+            db.session.commit()
+            learners.switch(learner.id)
+            flash(f'Estudiante "{name}" creado y seleccionado', 'success')
+        return redirect(url_for('.list_learners'))
+    return render_template('learners.html', learners=Learner.query.order_by(Learner.name).all(),
+                           current_id=learners.current_id())
+
+def local_path(target):
+    """`target` if it is a path on this site, else None; '//host' and '/\\host' point elsewhere."""
+    if target and target.startswith('/') and not target.startswith(('//', '/\\')):
+        return target
+    return None
+
+@bp.route('/learner/<int:id>/select', methods=['POST'])
+def select_learner(id):
+    learner = Learner.query.get_or_404(id)
+    learners.switch(id)
+    flash(f'Ahora registras el progreso de "{learner.name}"', 'success')
+    return redirect(local_path(request.form.get('next')) or url_for('.index'))
+
+# ==================== TASK PROGRESS ====================
+@bp.route('/api/task/<int:task_id>/toggle', methods=['POST'])
+def toggle_task(task_id):
+    location = progress.task_location(task_id)
+    if location is None:
+        abort(404)
+    if location.bit_index is None:
+        snapshots.mark(progress.assign_missing_bits([task_id]))
+        location = progress.task_location(task_id)
+    learner_id = learners.current_id()
+    completed = progress.toggle(learner_id, location)
+    section_progress, sheet_progress = progress.read_progress(
+        learner_id, [location.section_id], [location.sheet_id])
+    page_cache.touch('sheet', location.sheet_id)
+    events.publish(location.sheet_id, 'progress', {
+        'task_ids': [task_id], 'completed': completed,
+        'section_progress': section_progress, 'global_progress': sheet_progress[location.sheet_id],
+    }, learner_id)
+    db.session.commit()
+    
+    # Only the toggled task's section changed
+    return jsonify({
+        'success': True,
+        'completed': completed,
+        'section_id': location.section_id,
+        'section_progress': section_progress,
+        'global_progress': sheet_progress[location.sheet_id]
+    })
+
+MAX_BATCH_TASKS = 1000
+
+@bp.route('/api/tasks/progress', methods=['POST'])
+def set_tasks_progress():
+    data = request.get_json(silent=True) or {}
+    task_ids = int_list(data.get('task_ids'))
+    completed = data.get('completed')
+    if task_ids is None or not isinstance(completed, bool):
+        return jsonify({'success': False, 'error': 'Se requiere task_ids (lista de enteros) y completed (booleano)'}), 400
+    if len(task_ids) > MAX_BATCH_TASKS:
+        return jsonify({'success': False, 'error': f'Máximo {MAX_BATCH_TASKS} tareas por lote'}), 400
+    
+    learner_id = learners.current_id()
+    snapshots.mark(progress.assign_missing_bits(task_ids))
+    missing, section_deltas, sheet_deltas = progress.set_completed(learner_id, task_ids, completed)
+    if missing:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Tareas no encontradas', 'missing': missing}), 404
+    section_progress, sheet_progress = progress.read_progress(learner_id, section_deltas, sheet_deltas)
+    for sheet_id in sheet_deltas:
+        page_cache.touch('sheet', sheet_id)
+        events.publish(sheet_id, 'progress', {
+            'task_ids': task_ids, 'completed': completed,
+            'section_progress': section_progress, 'global_progress': sheet_progress[sheet_id],
+        }, learner_id)
+    db.session.commit()
+    
+    for section_id, delta in section_deltas.items():
+        section_progress[section_id]['delta'] = delta
+    for sheet_id, delta in sheet_deltas.items():
+        sheet_progress[sheet_id]['delta'] = delta
+    return jsonify({
+        'success': True,
+        'completed': completed,
+        'updated': sum(abs(delta) for delta in sheet_deltas.values()),
+        'section_progress': section_progress,
+        'sheet_progress': sheet_progress
+    })
+
+# ==================== LIVE UPDATES ====================
+@bp.route('/sheet/<int:id>/events')
+def sheet_events(id):
+    """Server-Sent Events stream of changes to one sheet; see events.py."""
+    Sheet.query.get_or_404(id)
+    # A page that fell back after a 503 passes the last id it saw as ?after=
+    after_id = request.headers.get('Last-Event-ID', type=int)
+    if after_id is None:
+        after_id = request.args.get('after', type=int)
+    if not events.open_slot():
+        return Response('', status=503, headers={'Retry-After': str(events.RETRY_BUSY_SECONDS)})
+    stream = events.stream(id, learners.current_id(), after_id)
+    response = Response(stream_with_context(stream), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, also if the client left before the first chunk
+    response.call_on_close(events.close_slot)
+    return response
+
+# ==================== REORDERING ====================
+def is_int(value):
+    # json.loads turns true into a bool, which is also an int
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def int_list(value):
+    """`value` if it is a non-empty list of ints, else None."""
+    if isinstance(value, list) and value and all(is_int(item) for item in value):
+        return value
+    return None
+
+def ordering_error(message):
+    db.session.rollback()
+    return jsonify({'success': False, 'error': message}), 400
+
+@bp.route('/api/<container>/<int:id>/reorder', methods=['POST'])
+def reorder_children(container, id):
+    if container not in ordering.CONTAINERS:
+        abort(404)
+    parent = ordering.PARENT_MODELS[container].query.get_or_404(id)
+    ids = int_list((request.get_json(silent=True) or {}).get('ids'))
+    if ids is None:
+        return ordering_error('Se requiere ids (lista de enteros)')
+    try:
+        ordering.reorder(container, id, ids)
+    except ordering.OrderingError as e:
+        return ordering_error(str(e))
+    if container in ('section', 'box'):
+        sheet_id = parent.sheet_id if container == 'section' else parent.section.sheet_id
+        page_cache.touch('sheet', sheet_id)
+        events.publish(sheet_id, 'layout', {'container': container, 'layout': {id: ids}})
+        snapshots.mark([sheet_id])
+    else:
+        page_cache.touch(container, id)
+        if container == 'sheet':
+            snapshots.mark([id])
+    db.session.commit()
+    return jsonify({'success': True, 'ids': ids})
+
+def move_progress(sheet_id, moves, target_section_id):
+    """Shift section totals for children leaving their section; return fresh progress.
+
+    `moves` holds (section_id, total) per moved box or task. The sheet totals
+    and the learners' bitsets do not change because moves stay within one
+    sheet, and section progress is read through the moved tasks' bits.
+    """
+    deltas = {}
+    for section_id, total in moves:
+        if section_id != target_section_id:
+            deltas[section_id] = deltas.get(section_id, 0) - total
+            deltas[target_section_id] = deltas.get(target_section_id, 0) + total
+    for section_id, total in deltas.items():
+        progress.adjust_section(section_id, total)
+    page_cache.touch('sheet', sheet_id)
+    return progress.read_progress(learners.current_id(), deltas)[0]
+
+@bp.route('/api/tasks/move', methods=['POST'])
+def move_tasks():
+    data = request.get_json(silent=True) or {}
+    task_ids = int_list(data.get('task_ids'))
+    box_id, position = data.get('box_id'), data.get('position')
+    if task_ids is None or not is_int(box_id) or not (position is None or is_int(position)):
+        return ordering_error('Se requiere task_ids (lista de enteros), box_id y opcionalmente position')
+    if len(task_ids) > MAX_BATCH_TASKS:
+        return ordering_error(f'Máximo {MAX_BATCH_TASKS} tareas por lote')
+    box = Box.query.get_or_404(box_id)
+    sheet_id = box.section.sheet_id
+    locations = progress.task_locations(task_ids)
+    if any(location.sheet_id != sheet_id for location in locations):
+        return ordering_error('Solo se pueden mover tareas dentro de la misma hoja')
+    try:
+        sources = ordering.move('box', task_ids, box_id, position)
+    except ordering.OrderingError as e:
+        return ordering_error(str(e))
+    section_progress = move_progress(
+        sheet_id, [(location.section_id, 1) for location in locations],
+        box.section_id)
+    layout = ordering.children('box', set(sources.values()) | {box_id})
+    events.publish(sheet_id, 'layout', {'container': 'box', 'layout': layout})
+    snapshots.mark([sheet_id])
+    db.session.commit()
+    return jsonify({'success': True, 'boxes': layout, 'section_progress': section_progress})
+
+@bp.route('/api/boxes/move', methods=['POST'])
+def move_boxes():
+    data = request.get_json(silent=True) or {}
+    box_ids = int_list(data.get('box_ids'))
+    section_id, position = data.get('section_id'), data.get('position')
+    if box_ids is None or not is_int(section_id) or not (position is None or is_int(position)):
+        return ordering_error('Se requiere box_ids (lista de enteros), section_id y opcionalmente position')
+    section = Section.query.get_or_404(section_id)
+    counts = progress.boxes_counts(box_ids)
+    if any(sheet_id != section.sheet_id for _, sheet_id, _ in counts.values()):
+        return ordering_error('Solo se pueden mover boxes dentro de la misma hoja')
+    try:
+        sources = ordering.move('section', box_ids, section_id, position)
+    except ordering.OrderingError as e:
+        return ordering_error(str(e))
+    section_progress = move_progress(
+        section.sheet_id, [(source, total) for source, _, total in counts.values()],
+        section_id)
+    layout = ordering.children('section', set(sources.values()) | {section_id})
+    events.publish(section.sheet_id, 'layout', {'container': 'section', 'layout': layout})
+    snapshots.mark([section.sheet_id])
+    db.session.commit()
+    return jsonify({'success': True, 'sections': layout, 'section_progress': section_progress})
+
+# ==================== READ-ONLY JSON API ====================
+def conditional_json(payload):
+    """JSON response with a content-hash ETag; answers 304 when the client's copy matches."""
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+@bp.route('/api/categories')
+def api_categories():
+    categories = Category.query.options(db.selectinload(Category.books)).order_by(Category.name).all()
+    return conditional_json({'categories': [
+        serializers.category_dict(category, sorted(category.books, key=lambda book: book.name))
+        for category in categories
+    ]})
+
+@bp.route('/api/book/<int:id>')
+def api_book(id):
+    book = Book.query.get_or_404(id)
+    chapters = Chapter.query.filter_by(book_id=id).order_by(Chapter.order, Chapter.id).all()
+    return conditional_json(serializers.book_dict(book, chapters))
+
+@bp.route('/api/chapter/<int:id>')
+def api_chapter(id):
+    chapter = Chapter.query.get_or_404(id)
+    sheets = Sheet.query.filter_by(chapter_id=id).order_by(Sheet.order, Sheet.id).all()
+    sheet_progress = progress.read_progress(learners.current_id(), sheet_ids=[sheet.id for sheet in sheets])[1]
+    return conditional_json(serializers.chapter_dict(chapter, sheets, sheet_progress))
+
+@bp.route('/api/sheet/<int:id>')
+def api_sheet(id):
+    sheet, sections = queries.load_sheet_tree(id)
+    if sheet is None:
+        abort(404)
+    section_progress, sheet_progress, completed = progress.sheet_progress(learners.current_id(), sheet, sections)
+    return conditional_json(serializers.sheet_dict(sheet, sections, sheet_progress, section_progress, completed))
+
+# ==================== SEARCH ====================
+SEARCH_PAGE_SIZE = 20
+
+@bp.route('/search')
+def search_page():
+    q = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    results = search.query(q, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE) if q else []
+    return render_template('search.html', q=q, page=page, results=results[:SEARCH_PAGE_SIZE],
+                           has_more=len(results) > SEARCH_PAGE_SIZE, enabled=search.available())
+
+@bp.route('/api/search')
+def api_search():
+    q = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    results = search.query(q, limit=limit, offset=offset)
+    for result in results:
+        result['url'] = url_for('.view_sheet', id=result['sheet_id'])
+    return jsonify({'q': q, 'limit': limit, 'offset': offset, 'results': results})
+
+# ==================== NOTES CRUD ====================
+@bp.route('/section/<int:section_id>/note/new', methods=['POST'])
+def new_note(section_id):
+    section = Section.query.get_or_404(section_id)
+    content = request.form.get('content_markdown', '').strip()
+    note = Note(content_markdown=content, section_id=section_id)
+    markdown_cache.refresh(note)
+    db.session.add(note)
+    db.session.flush()
+    search.index_item('note', note.id, content, section.sheet_id)
+    page_cache.touch('sheet', section.sheet_id)
+    patch = publish_patch(section.sheet_id, 'append', 'note', note.id, section_id, render_partial('note_item', note))
+    db.session.commit()
+    if wants_partial():
+        return inline_response(**patch)
+    flash('Nota creada', 'success')
+    return redirect(url_for('.view_sheet', id=section.sheet_id))
+
+@bp.route('/note/<int:id>/edit', methods=['POST'])
+def edit_note(id):
+    note = Note.query.get_or_404(id)
+    content = request.form.get('content_markdown', '').strip()
+    note.content_markdown = content
+    markdown_cache.refresh(note)
+    search.index_item('note', id, content, note.section.sheet_id)
+    page_cache.touch('sheet', note.section.sheet_id)
+    patch = publish_patch(note.section.sheet_id, 'replace', 'note', id, note.section_id,
+                          render_partial('note_item', note))
+    db.session.commit()
+    if wants_partial():
+        return inline_response(**patch)
+    flash('Nota actualizada', 'success')
+    return redirect(url_for('.view_sheet', id=note.section.sheet_id))
+
+@bp.route('/note/<int:id>/delete', methods=['POST'])
+def delete_note(id):
+    note = Note.query.get_or_404(id)
+    section_id, sheet_id = note.section_id, note.section.sheet_id
+    page_cache.touch('sheet', sheet_id)
+    search.unindex_item('note', id)
+    db.session.delete(note)
+    patch = publish_patch(sheet_id, 'remove', 'note', id, section_id)
+    db.session.commit()
+    if wants_partial():
+        return inline_response(**patch)
+    flash('Nota eliminada', 'success')
+    return redirect(url_for('.view_sheet', id=sheet_id))
+
+# ==================== CSV IMPORT ====================
+@bp.route('/sheet/<int:sheet_id>/import', methods=['GET', 'POST'])
+def import_csv(sheet_id):
+    sheet = Sheet.query.get_or_404(sheet_id)
+    if request.method == 'POST' and request.form.get('background'):
+        job = jobs.submit(sheet_id, request.files.get('csv_file'), request.form.get('csv_text', ''))
+        if job is None:
+            flash('Por favor proporcione un archivo CSV o texto CSV', 'error')
+            return redirect(url_for('.import_csv', sheet_id=sheet_id))
+        if request.accept_mimetypes.best == 'application/json':
+            response = jsonify(serializers.import_job_dict(job))
+            response.status_code = 202
+            response.headers['Location'] = url_for('.job_status', id=job.id)
+            return response
+        return redirect(url_for('.import_csv', sheet_id=sheet_id, job=job.id))
+    if request.method == 'POST' and request.form.get('dry_run'):
+        return preview_import(sheet)
+    if request.method == 'POST':
+        reader = importer.open_reader(request.files.get('csv_file'), request.form.get('csv_text', ''))
+        if reader is None:
+            flash('Por favor proporcione un archivo CSV o texto CSV', 'error')
+            return redirect(url_for('.import_csv', sheet_id=sheet_id))
+        
+        try:
+            stats = importer.CsvImporter(sheet_id).run(reader)
+            search.reindex_sheet(sheet_id)
+            page_cache.touch('sheet', sheet_id)
+            snapshots.mark([sheet_id])
+            db.session.commit()
+            current_app.logger.info('CSV import into sheet %s: %s', sheet_id, stats.summary())
+            flash(f'CSV importado exitosamente ({stats.rows} filas, {stats.rows_per_sec:.0f} filas/s)', 'success')
+            return redirect(url_for('.view_sheet', id=sheet_id))
+            
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al importar CSV: {str(e)}', 'error')
+    
+    job = None
+    if request.args.get('job', type=int):
+        job = ImportJob.query.filter_by(id=request.args.get('job', type=int), sheet_id=sheet_id).first()
+    return render_template('import_csv.html', sheet=sheet, job=job)
+
+def preview_import(sheet):
+    """Diff the upload against the sheet, store the plan and show it; nothing is written."""
+    reader = importer.open_reader(request.files.get('csv_file'), request.form.get('csv_text', ''))
+    if reader is None:
+        flash('Por favor proporcione un archivo CSV o texto CSV', 'error')
+        return redirect(url_for('.import_csv', sheet_id=sheet.id))
+    errors = []
+    try:
+        csv_importer = importer.CsvImporter(sheet.id, errors=errors)
+        csv_importer.feed(reader)
+        plan = csv_importer.plan()
+    except Exception as e:
+        flash(f'Error al leer CSV: {str(e)}', 'error')
+        return redirect(url_for('.import_csv', sheet_id=sheet.id))
+    token = import_plans.save(plan)
+    current_app.logger.info('CSV preview for sheet %s: %s', sheet.id, csv_importer.stats.summary())
+    apply_url = url_for('.apply_import', sheet_id=sheet.id, token=token)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(dict(plan.as_dict(), errors=errors[:jobs.MAX_ERRORS], apply_url=apply_url))
+    return render_template('import_preview.html', sheet=sheet, plan=plan, preview=plan.as_dict(),
+                           errors=errors[:jobs.MAX_ERRORS], apply_url=apply_url)
+
+@bp.route('/sheet/<int:sheet_id>/import/<token>/apply', methods=['POST'])
+def apply_import(sheet_id, token):
+    Sheet.query.get_or_404(sheet_id)
+    plan = import_plans.load(token)
+    if plan is None or plan.sheet_id != sheet_id:
+        flash('La vista previa ha caducado; vuelva a subir el CSV', 'error')
+        return redirect(url_for('.import_csv', sheet_id=sheet_id))
+    try:
+        stats = importer.CsvImporter(sheet_id).apply_plan(plan)
+    except importer.StalePlanError:
+        db.session.rollback()
+        import_plans.discard(token)
+        flash('La hoja cambió después de la vista previa; vuelva a generarla', 'error')
+        return redirect(url_for('.import_csv', sheet_id=sheet_id))
+    search.reindex_sheet(sheet_id)
+    page_cache.touch('sheet', sheet_id)
+    snapshots.mark([sheet_id])
+    db.session.commit()
+    import_plans.discard(token)
+    current_app.logger.info('CSV import into sheet %s from preview: %s', sheet_id, stats.summary())
+    flash(f'CSV importado exitosamente ({stats.tasks_created} tareas nuevas, '
+          f'{stats.tasks_updated} actualizadas)', 'success')
+    return redirect(url_for('.view_sheet', id=sheet_id))
+
+@bp.route('/jobs/<int:id>')
+def job_status(id):
+    job = ImportJob.query.get_or_404(id)
+    return jsonify(serializers.import_job_dict(job))
+
+# ==================== CSV EXPORT ====================
+def csv_export(scope, id_, name):
+    """Stream a scope as CSV; ?progress=1 adds completion state, ?notes=1 the section notes."""
+    include_progress = request.args.get('progress', type=int) == 1
+    include_notes = request.args.get('notes', type=int) == 1
+    rows = exporter.stream_csv(scope, id_, include_progress, include_notes, learners.current_id())
+    filename = secure_filename(f'{scope}-{id_}-{name}.csv') or f'{scope}-{id_}.csv'
+    return Response(stream_with_context(rows), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@bp.route('/sheet/<int:id>/export')
+def export_sheet(id):
+    sheet = Sheet.query.get_or_404(id)
+    return csv_export('sheet', id, sheet.name)
+
+@bp.route('/chapter/<int:id>/export')
+def export_chapter(id):
+    chapter = Chapter.query.get_or_404(id)
+    return csv_export('chapter', id, chapter.name)
+
+@bp.route('/book/<int:id>/export')
+def export_book(id):
+    book = Book.query.get_or_404(id)
+    return csv_export('book', id, book.name)
+
+# ==================== METRICS ====================
+@bp.route('/metrics')
+def metrics():
+    if not instrumentation.enabled(current_app):
+        abort(404)
+    caches = {'page_html': page_cache.cache, 'note_html': markdown_cache.cache, 'compressed': compression.cache}
+    return Response(instrumentation.render(caches), mimetype='text/plain; version=0.0.4')
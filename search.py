@@ -0,0 +1,249 @@
+"""Full-text search over task text, box titles, section names and notes.
+
+Backed by an SQLite FTS5 table, `search_index`, kept in step by the CRUD
+routes and the CSV importer. Each row's rowid encodes the source item
+(id * 8 + kind code), so single items are replaced or removed with rowid
+lookups instead of scans; `sheet_id` is stored alongside to build
+breadcrumbs. `rebuild` repopulates the table from scratch.
+
+When the SQLite build lacks FTS5, every function is a no-op and `available`
+returns False.
+"""
+import html
+import logging
+import re
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, Book, Chapter, Sheet
+
+logger = logging.getLogger(__name__)
+
+KINDS = {'task': 1, 'box': 2, 'section': 3, 'note': 4}
+ROWID_FACTOR = 8
+
+# Private-use markers; replaced by <mark> after the snippet is HTML-escaped
+_OPEN, _CLOSE = '\ue000', '\ue001'
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "body, kind UNINDEXED, ref_id UNINDEXED, sheet_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+# Source rows (id, body, sheet_id) for every kind
+_SOURCES = {
+    'task': ('SELECT tasks.id AS id, tasks.task_text AS body, sections.sheet_id AS sheet_id FROM tasks '
+             'JOIN boxes ON tasks.box_id = boxes.id JOIN sections ON boxes.section_id = sections.id'),
+    'box': ('SELECT boxes.id AS id, boxes.box_title AS body, sections.sheet_id AS sheet_id FROM boxes '
+            'JOIN sections ON boxes.section_id = sections.id'),
+    'section': ('SELECT sections.id AS id, sections.level_name AS body, sections.sheet_id AS sheet_id '
+                'FROM sections'),
+    'note': ('SELECT notes.id AS id, notes.content_markdown AS body, sections.sheet_id AS sheet_id FROM notes '
+             'JOIN sections ON notes.section_id = sections.id'),
+}
+
+_available = None
+
+
+def rowid(kind, id_):
+    return id_ * ROWID_FACTOR + KINDS[kind]
+
+
+def ensure_schema():
+    """Create the FTS5 table if needed. Returns True when it was just created.
+
+    Runs in the session's transaction; the caller commits.
+    """
+    global _available
+    existed = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+    )).first() is not None
+    try:
+        with db.session.begin_nested():
+            db.session.execute(text(CREATE_SQL))
+    except OperationalError as exc:
+        logger.warning('Full-text search disabled: %s', exc)
+        _available = False
+        return False
+    _available = True
+    return not existed
+
+
+def available():
+    global _available
+    if _available is None:
+        _available = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )).first() is not None
+    return _available
+
+
+def index_item(kind, id_, body, sheet_id):
+    """Add or replace one item in the index."""
+    if not available():
+        return
+    key = rowid(kind, id_)
+    db.session.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': key})
+    db.session.execute(
+        text('INSERT INTO search_index (rowid, body, kind, ref_id, sheet_id) '
+             'VALUES (:rowid, :body, :kind, :ref_id, :sheet_id)'),
+        {'rowid': key, 'body': body or '', 'kind': kind, 'ref_id': id_, 'sheet_id': sheet_id},
+    )
+
+
+def unindex_rowids(rowids):
+    if rowids and available():
+        db.session.execute(text('DELETE FROM search_index WHERE rowid = :rowid'),
+                           [{'rowid': key} for key in rowids])
+
+
+def unindex_item(kind, id_):
+    unindex_rowids([rowid(kind, id_)])
+
+
+# kind -> (id column, FROM clause reaching sections)
+_ID_SOURCES = {
+    'task': ('tasks.id', 'tasks JOIN boxes ON tasks.box_id = boxes.id '
+                         'JOIN sections ON boxes.section_id = sections.id'),
+    'box': ('boxes.id', 'boxes JOIN sections ON boxes.section_id = sections.id'),
+    'section': ('sections.id', 'sections'),
+    'note': ('notes.id', 'notes JOIN sections ON notes.section_id = sections.id'),
+}
+
+
+def _unindex_where(where, params):
+    """Delete the entries of every item matching a filter on sections/boxes/tasks/notes.
+
+    Rowids are computed inside SQLite, so large subtrees never pass through Python.
+    """
+    for kind, condition in where.items():
+        id_column, from_clause = _ID_SOURCES[kind]
+        db.session.execute(text(
+            f'DELETE FROM search_index WHERE rowid IN '
+            f'(SELECT {id_column} * {ROWID_FACTOR} + {KINDS[kind]} FROM {from_clause} WHERE {condition})'
+        ), params)
+
+
+def unindex_box(box_id):
+    """Remove a box and its tasks. Call before deleting them."""
+    if available():
+        _unindex_where({'task': 'boxes.id = :id', 'box': 'boxes.id = :id'}, {'id': box_id})
+
+
+def unindex_section(section_id):
+    """Remove a section with its boxes, tasks and notes. Call before deleting them."""
+    if available():
+        _unindex_where({kind: 'sections.id = :id' for kind in KINDS}, {'id': section_id})
+
+
+def unindex_sheets(sheet_ids):
+    """Remove everything under the given sheets. Call before deleting them."""
+    if not sheet_ids or not available():
+        return
+    where = {kind: 'sections.sheet_id IN (SELECT value FROM json_each(:ids))' for kind in KINDS}
+    _unindex_where(where, {'ids': _json_ids(sheet_ids)})
+
+
+def _json_ids(ids):
+    return '[' + ','.join(str(int(id_)) for id_ in ids) + ']'
+
+
+def sheet_ids_under(scope, id_):
+    """Ids of the sheets below a category, book or chapter."""
+    stmt = select(Sheet.id)
+    if scope == 'chapter':
+        stmt = stmt.where(Sheet.chapter_id == id_)
+    elif scope == 'book':
+        stmt = stmt.join(Chapter, Sheet.chapter_id == Chapter.id).where(Chapter.book_id == id_)
+    elif scope == 'category':
+        stmt = (stmt.join(Chapter, Sheet.chapter_id == Chapter.id)
+                .join(Book, Chapter.book_id == Book.id)
+                .where(Book.category_id == id_))
+    else:
+        raise ValueError(f'Unknown scope {scope!r}')
+    return db.session.execute(stmt).scalars().all()
+
+
+def _insert_from_sources(where=None, params=None):
+    for kind, sql in _SOURCES.items():
+        if where:
+            sql = f'{sql} WHERE {where}'
+        db.session.execute(text(
+            f'INSERT INTO search_index (rowid, body, kind, ref_id, sheet_id) '
+            f'SELECT src.id * {ROWID_FACTOR} + {KINDS[kind]}, src.body, :kind, src.id, src.sheet_id '
+            f'FROM ({sql}) AS src'
+        ), dict(params or {}, kind=kind))
+
+
+def reindex_sheet(sheet_id):
+    """Re-index everything in one sheet with set-based INSERT ... SELECT statements."""
+    if not available():
+        return
+    unindex_sheets([sheet_id])
+    _insert_from_sources('sections.sheet_id = :sheet_id', {'sheet_id': sheet_id})
+
+
+def rebuild():
+    """Drop and repopulate the whole index, then merge its segments."""
+    ensure_schema()
+    if not available():
+        return
+    db.session.execute(text('DELETE FROM search_index'))
+    _insert_from_sources()
+    db.session.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+
+
+def _match_expression(query):
+    """Turn free text into a safe FTS5 expression: every word must match, last one as a prefix."""
+    words = re.findall(r'\w+', query, flags=re.UNICODE)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _highlight(snippet):
+    escaped = html.escape(snippet)
+    return escaped.replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def query(q, limit=20, offset=0):
+    """Return ranked results for `q` as dicts with highlighted snippets and breadcrumbs."""
+    expression = _match_expression(q or '')
+    if expression is None or not available():
+        return []
+    rows = db.session.execute(text(
+        "SELECT kind, ref_id, sheet_id, "
+        "snippet(search_index, 0, :open, :close, '…', 24) AS snippet, "
+        "bm25(search_index) AS score "
+        "FROM search_index WHERE search_index MATCH :expression "
+        "ORDER BY rank LIMIT :limit OFFSET :offset"
+    ), {'expression': expression, 'limit': limit, 'offset': offset,
+        'open': _OPEN, 'close': _CLOSE}).all()
+
+    sheet_ids = {row.sheet_id for row in rows}
+    crumbs = {}
+    if sheet_ids:
+        for sheet_id, sheet_name, chapter_id, chapter_name, book_id, book_name in db.session.execute(
+            select(Sheet.id, Sheet.name, Chapter.id, Chapter.name, Book.id, Book.name)
+            .join(Chapter, Sheet.chapter_id == Chapter.id)
+            .join(Book, Chapter.book_id == Book.id)
+            .where(Sheet.id.in_(sheet_ids))
+        ):
+            crumbs[sheet_id] = {
+                'book': {'id': book_id, 'name': book_name},
+                'chapter': {'id': chapter_id, 'name': chapter_name},
+                'sheet': {'id': sheet_id, 'name': sheet_name},
+            }
+
+    return [{
+        'kind': row.kind,
+        'id': row.ref_id,
+        'sheet_id': row.sheet_id,
+        'snippet': _highlight(row.snippet),
+        'score': round(-row.score, 4),
+        'breadcrumb': crumbs.get(row.sheet_id),
+    } for row in rows if row.sheet_id in crumbs]
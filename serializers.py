@@ -0,0 +1,122 @@
+"""Plain-dict views of the models for the read-only JSON API.
+
+Progress belongs to a learner, not to the rows, so callers pass in the
+progress dicts and completed task ids they read with progress.py.
+"""
+import json
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def category_dict(category, books=None):
+    data = {
+        'id': category.id,
+        'name': category.name,
+        'description': category.description or '',
+        'created_at': _iso(category.created_at),
+    }
+    if books is not None:
+        data['books'] = [book_dict(book) for book in books]
+    return data
+
+
+def book_dict(book, chapters=None):
+    data = {
+        'id': book.id,
+        'name': book.name,
+        'description': book.description or '',
+        'category_id': book.category_id,
+        'created_at': _iso(book.created_at),
+    }
+    if chapters is not None:
+        data['chapters'] = [chapter_dict(chapter) for chapter in chapters]
+    return data
+
+
+def chapter_dict(chapter, sheets=None, sheet_progress=None):
+    data = {
+        'id': chapter.id,
+        'name': chapter.name,
+        'description': chapter.description or '',
+        'book_id': chapter.book_id,
+        'order': chapter.order,
+        'created_at': _iso(chapter.created_at),
+    }
+    if sheets is not None:
+        data['sheets'] = [sheet_dict(sheet, progress=sheet_progress[sheet.id]) for sheet in sheets]
+    return data
+
+
+def sheet_dict(sheet, sections=None, progress=None, section_progress=None, completed=frozenset()):
+    data = {
+        'id': sheet.id,
+        'name': sheet.name,
+        'chapter_id': sheet.chapter_id,
+        'order': sheet.order,
+        'created_at': _iso(sheet.created_at),
+        'progress': progress,
+    }
+    if sections is not None:
+        data['sections'] = [section_dict(section, section_progress[section.id], completed)
+                            for section in sections]
+    return data
+
+
+def section_dict(section, progress, completed):
+    return {
+        'id': section.id,
+        'level_name': section.level_name,
+        'section_order': section.section_order,
+        'progress': progress,
+        'boxes': [box_dict(box, completed) for box in section.boxes],
+        'notes': [note_dict(note) for note in section.notes],
+    }
+
+
+def box_dict(box, completed):
+    return {
+        'id': box.id,
+        'box_number': box.box_number,
+        'box_title': box.box_title,
+        'tasks': [task_dict(task, completed) for task in box.tasks],
+    }
+
+
+def task_dict(task, completed):
+    return {
+        'id': task.id,
+        'task_order': task.task_order,
+        'task_text': task.task_text,
+        'completed': task.id in completed,
+    }
+
+
+def note_dict(note):
+    return {
+        'id': note.id,
+        'content_markdown': note.content_markdown or '',
+        'updated_at': _iso(note.updated_at),
+    }
+
+
+def import_job_dict(job):
+    end = job.finished_at or job.heartbeat_at
+    elapsed = (end - job.started_at).total_seconds() if job.started_at and end else 0.0
+    return {
+        'id': job.id,
+        'sheet_id': job.sheet_id,
+        'status': job.status,
+        'filename': job.filename or '',
+        'rows_processed': job.rows_processed,
+        'rows_skipped': job.rows_skipped,
+        'errors': json.loads(job.errors or '[]'),
+        'error': job.error,
+        'attempts': job.attempts,
+        'elapsed': round(elapsed, 3),
+        'rows_per_sec': round(job.rows_processed / elapsed, 1) if elapsed > 0 else 0.0,
+        'created_at': _iso(job.created_at),
+        'started_at': _iso(job.started_at),
+        'finished_at': _iso(job.finished_at),
+    }
@@ -0,0 +1,237 @@
+"""Precomputed sheet read model.
+
+Building sheet.html from the normalized tables costs a query per level of the
+tree plus a Python walk over every task. Sheets are read far more often than
+they are edited, so that work moves to the write side. Each sheet has one
+sheet_snapshots row: the breadcrumb, the ordered sections, boxes, tasks and
+notes (with rendered HTML), and the task totals, serialized as
+zlib-compressed JSON. `view_sheet` renders from it after one primary-key
+read.
+
+Progress belongs to the learner and lives in sheet_progress (see
+progress.py), so the snapshot does not change when tasks are ticked. Every
+task keeps its bit_index and every section the mask of its tasks' bits, so
+overlaying a learner's bitset costs one more primary-key read and a popcount
+per section.
+
+Routes that change what a snapshot holds call `mark` before committing, and
+a before_commit hook rebuilds the marked sheets in that same transaction.
+This covers inline edits, reorders and moves, CSV imports, and renames of
+the sheet, its chapter or its book. A snapshot can therefore never be older
+than its data, unless something writes to the tables without marking. A
+snapshot in an older FORMAT counts as missing. On a GET a missing snapshot is
+built in memory, because storing it would need the write lock. `flask
+snapshots check` compares every stored snapshot with a fresh build, and
+`flask snapshots rebuild` rebuilds them all in batches.
+"""
+import json
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Book, Chapter, Sheet, Section, Box, Task, Note, SheetSnapshot
+import markdown_cache
+import progress
+
+# Bump when the snapshot layout changes; older rows are then rebuilt
+FORMAT = 2
+BATCH = 500
+
+
+def mark(sheet_ids):
+    """Rebuild these sheets' snapshots when the current transaction commits."""
+    db.session.info.setdefault('stale_snapshots', set()).update(sheet_ids)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _rebuild_marked(session):
+    sheet_ids = session.info.pop('stale_snapshots', None)
+    if sheet_ids:
+        store(sheet_ids)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget(session):
+    session.info.pop('stale_snapshots', None)
+
+
+def sheets_under(scope, id_):
+    """Ids of the sheets in one chapter or book, for renames that change their breadcrumb."""
+    stmt = select(Sheet.id)
+    if scope == 'chapter':
+        stmt = stmt.where(Sheet.chapter_id == id_)
+    elif scope == 'book':
+        stmt = stmt.join(Chapter, Sheet.chapter_id == Chapter.id).where(Chapter.book_id == id_)
+    else:
+        raise ValueError(f'Unknown scope {scope!r}')
+    return db.session.execute(stmt).scalars().all()
+
+
+def build(sheet_ids):
+    """Build the snapshot dicts of many sheets with one query per level. Missing sheets are left out."""
+    sheet_ids = list(sheet_ids)
+    snapshots = {}
+    rows = db.session.execute(
+        select(Sheet.id, Sheet.name, Sheet.total_tasks, Chapter.id, Chapter.name, Book.id, Book.name)
+        .join(Chapter, Sheet.chapter_id == Chapter.id)
+        .join(Book, Chapter.book_id == Book.id)
+        .where(Sheet.id.in_(sheet_ids))
+    )
+    for id_, name, total, chapter_id, chapter_name, book_id, book_name in rows:
+        snapshots[id_] = {
+            'format': FORMAT,
+            'sheet': {'id': id_, 'name': name, 'total_tasks': total,
+                      'chapter': {'id': chapter_id, 'name': chapter_name,
+                                  'book': {'id': book_id, 'name': book_name}}},
+            'sections': [],
+        }
+    if not snapshots:
+        return snapshots
+
+    sections = {}
+    rows = db.session.execute(
+        select(Section.id, Section.sheet_id, Section.level_name, Section.section_order, Section.total_tasks)
+        .where(Section.sheet_id.in_(list(snapshots)))
+        .order_by(Section.sheet_id, Section.section_order, Section.id)
+    )
+    for id_, sheet_id, level_name, order, total in rows:
+        sections[id_] = {'id': id_, 'level_name': level_name, 'section_order': order,
+                         'total_tasks': total, 'mask': 0, 'boxes': [], 'notes': []}
+        snapshots[sheet_id]['sections'].append(sections[id_])
+
+    boxes = {}
+    rows = db.session.execute(
+        select(Box.id, Box.section_id, Box.box_number, Box.box_title)
+        .join(Section, Box.section_id == Section.id)
+        .where(Section.sheet_id.in_(list(snapshots)))
+        .order_by(Box.section_id, Box.box_number, Box.id)
+    )
+    for id_, section_id, number, title in rows:
+        boxes[id_] = {'id': id_, 'box_number': number, 'box_title': title, 'section_id': section_id, 'tasks': []}
+        sections[section_id]['boxes'].append(boxes[id_])
+
+    rows = db.session.execute(
+        select(Task.id, Task.box_id, Task.task_order, Task.task_text, Task.bit_index)
+        .join(Box, Task.box_id == Box.id)
+        .join(Section, Box.section_id == Section.id)
+        .where(Section.sheet_id.in_(list(snapshots)))
+        .order_by(Task.box_id, Task.task_order, Task.id)
+    )
+    for id_, box_id, order, text, bit in rows:
+        box = boxes[box_id]
+        box['tasks'].append({'id': id_, 'task_order': order, 'task_text': text, 'bit_index': bit})
+        if bit is not None:
+            sections[box['section_id']]['mask'] |= 1 << bit
+    # As hex: json refuses to print ints of more than 4300 digits, which a sheet of ~14k tasks reaches
+    for section in sections.values():
+        section['mask'] = format(section['mask'], 'x')
+
+    rows = db.session.execute(
+        select(Note.id, Note.section_id, Note.content_markdown, Note.content_html, Note.updated_at)
+        .join(Section, Note.section_id == Section.id)
+        .where(Section.sheet_id.in_(list(snapshots)))
+        .order_by(Note.section_id, Note.id)
+    )
+    for id_, section_id, content, html, updated_at in rows:
+        sections[section_id]['notes'].append({
+            'id': id_, 'content_markdown': content or '',
+            'content_html': html if html is not None else markdown_cache.render(content),
+            'updated_at': updated_at.isoformat() if updated_at else None,
+        })
+    return snapshots
+
+
+def encode(snapshot):
+    return zlib.compress(json.dumps(snapshot, separators=(',', ':')).encode())
+
+
+def decode(data):
+    """Snapshot blob -> nested objects with attribute access, as the templates expect."""
+    return json.loads(zlib.decompress(data), object_hook=lambda fields: SimpleNamespace(**fields))
+
+
+def store(sheet_ids):
+    """Build and upsert the snapshots of these sheets, BATCH sheets per round."""
+    sheet_ids = sorted(set(sheet_ids))
+    stored = 0
+    for start in range(0, len(sheet_ids), BATCH):
+        built = build(sheet_ids[start:start + BATCH])
+        if not built:
+            continue
+        now = datetime.utcnow()
+        stmt = sqlite_insert(SheetSnapshot).values([
+            {'sheet_id': sheet_id, 'format': FORMAT, 'data': encode(snapshot), 'built_at': now}
+            for sheet_id, snapshot in built.items()
+        ])
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[SheetSnapshot.sheet_id],
+            set_={key: stmt.excluded[key] for key in ('format', 'data', 'built_at')},
+        ))
+        stored += len(built)
+    return stored
+
+
+def store_missing():
+    """Store snapshots for sheets that have none or an outdated one. Returns how many were built."""
+    sheet_ids = db.session.execute(
+        select(Sheet.id)
+        .outerjoin(SheetSnapshot, SheetSnapshot.sheet_id == Sheet.id)
+        .where(SheetSnapshot.sheet_id.is_(None) | (SheetSnapshot.format != FORMAT))
+    ).scalars().all()
+    return store(sheet_ids)
+
+
+def load(sheet_id):
+    """The sheet's snapshot as objects, or None when the sheet does not exist.
+
+    Reads the stored row by primary key. A missing or outdated row is built
+    in memory instead.
+    """
+    data = db.session.execute(
+        select(SheetSnapshot.data)
+        .where(SheetSnapshot.sheet_id == sheet_id, SheetSnapshot.format == FORMAT)
+    ).scalar()
+    if data is None:
+        snapshot = build([sheet_id]).get(sheet_id)
+        if snapshot is None:
+            return None
+        data = encode(snapshot)
+    return decode(data)
+
+
+def learner_progress(snapshot, bits):
+    """Overlay a learner's bitset (an int) on a snapshot.
+
+    Returns (section progress dicts, sheet progress dict, ids of completed
+    tasks), like progress.sheet_progress.
+    """
+    section_progress, completed_ids = {}, set()
+    for section in snapshot.sections:
+        done = bits & int(section.mask, 16)
+        section_progress[section.id] = progress.progress_dict(done.bit_count(), section.total_tasks)
+        if done:
+            completed_ids.update(task.id for box in section.boxes for task in box.tasks
+                                 if task.bit_index is not None and done >> task.bit_index & 1)
+    return section_progress, progress.progress_dict(bits.bit_count(), snapshot.sheet.total_tasks), completed_ids
+
+
+def find_stale():
+    """Return (sheet_id, reason) for every missing, outdated or differing snapshot."""
+    stale = []
+    sheet_ids = db.session.execute(select(Sheet.id).order_by(Sheet.id)).scalars().all()
+    for start in range(0, len(sheet_ids), BATCH):
+        chunk = sheet_ids[start:start + BATCH]
+        stored = dict(db.session.execute(
+            select(SheetSnapshot.sheet_id, SheetSnapshot.data).where(SheetSnapshot.sheet_id.in_(chunk))
+        ).all())
+        built = build(chunk)
+        for sheet_id in chunk:
+            data = stored.get(sheet_id)
+            if data is None:
+                stale.append((sheet_id, 'missing'))
+            elif json.loads(zlib.decompress(data)) != built[sheet_id]:
+                stale.append((sheet_id, 'outdated'))
+    return stale
@@ -0,0 +1,19 @@
+// "Cargar más" on keyset-paginated listings: fetch the next page's cards as
+// JSON and append them. Without JavaScript the link opens that page instead.
+document.addEventListener('click', async function(e) {
+  const link = e.target.closest('a.load-more');
+  if (!link) return;
+  e.preventDefault();
+  try {
+    const response = await fetch(link.href, { headers: { 'Accept': 'application/json' } });
+    const data = await response.json();
+    document.querySelector(link.dataset.target).insertAdjacentHTML('beforeend', data.html);
+    if (data.next) {
+      link.href = data.next;
+    } else {
+      link.parentElement.remove();
+    }
+  } catch (err) {
+    window.location.href = link.href;
+  }
+});
@@ -0,0 +1,22 @@
+const jobCard = document.getElementById('jobCard');
+const labels = {queued: 'en cola', running: 'importando', done: 'terminado', failed: 'falló'};
+
+async function pollJob() {
+  const response = await fetch(jobCard.dataset.jobUrl);
+  const job = await response.json();
+  let text = `Estado: ${labels[job.status] || job.status} · ${job.rows_processed} filas procesadas`;
+  if (job.rows_skipped) text += `, ${job.rows_skipped} omitidas`;
+  if (job.rows_per_sec) text += ` · ${Math.round(job.rows_per_sec)} filas/s`;
+  if (job.error) text += ` · ${job.error}`;
+  document.getElementById('jobStatus').textContent = text;
+  document.getElementById('jobErrors').innerHTML = '';
+  job.errors.forEach(e => {
+    const li = document.createElement('li');
+    li.textContent = `Fila ${e.row}: ${e.error}`;
+    document.getElementById('jobErrors').appendChild(li);
+  });
+  if (job.status === 'queued' || job.status === 'running') {
+    setTimeout(pollJob, 1000);
+  }
+}
+pollJob();
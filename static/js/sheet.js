@@ -0,0 +1,389 @@
+// Sheet page (templates/sheet.html): progress toggles, inline edits, live
+// updates from other tabs and drag-and-drop reordering.
+let editMode = false;
+
+function toggleEditMode() {
+  editMode = !editMode;
+  const btn = document.getElementById('editModeBtn');
+  const addSection = document.getElementById('addSectionForm');
+  document.body.classList.toggle('edit-mode', editMode);
+  
+  if (editMode) {
+    btn.textContent = '✅ Modo Normal';
+    btn.classList.remove('btn-secondary');
+    btn.classList.add('btn-primary');
+    addSection.style.display = 'block';
+    setDraggable(true);
+  } else {
+    btn.textContent = '✏️ Modo Edición';
+    btn.classList.remove('btn-primary');
+    btn.classList.add('btn-secondary');
+    addSection.style.display = 'none';
+    setDraggable(false);
+  }
+}
+
+function updateSectionProgress(sectionProgress) {
+  for (const [sectionId, progress] of Object.entries(sectionProgress)) {
+    const sectionBar = document.querySelector(`.section-progress[data-section="${sectionId}"]`);
+    const sectionLabel = document.querySelector(`.section-progress-label[data-section="${sectionId}"]`);
+    if (sectionBar) sectionBar.style.width = progress.percent + '%';
+    if (sectionLabel) sectionLabel.textContent = `${progress.completed}/${progress.total} completadas`;
+    
+    // Update section completed class
+    const section = document.querySelector(`section[data-section="${sectionId}"]`);
+    if (section) {
+      if (progress.percent === 100) {
+        section.classList.add('completed');
+      } else {
+        section.classList.remove('completed');
+      }
+    }
+  }
+}
+
+function updateGlobalProgress(progress) {
+  const globalBar = document.getElementById('global-bar');
+  const globalLabel = document.getElementById('global-label');
+  if (globalBar) globalBar.style.width = progress.percent + '%';
+  if (globalLabel) globalLabel.textContent = `Progreso total: ${progress.completed}/${progress.total} (${progress.percent}%)`;
+}
+
+// Checkbox toggle with AJAX (delegated, so patched-in tasks work too)
+document.addEventListener('change', async function(e) {
+  const cb = e.target;
+  if (!cb.matches('input[type="checkbox"][data-task-id]')) return;
+  const taskId = cb.dataset.taskId;
+  try {
+    const response = await fetch(`/api/task/${taskId}/toggle`, { method: 'POST' });
+    const data = await response.json();
+    
+    if (data.success) {
+      updateSectionProgress(data.section_progress);
+      updateGlobalProgress(data.global_progress);
+    }
+  } catch (err) {
+    console.error('Error toggling task:', err);
+  }
+});
+
+// Inline edits. Forms marked data-inline are posted with fetch and the server
+// answers with the changed partial (see inline_response in routes.py), which is
+// patched into the page instead of reloading the whole sheet. Without
+// JavaScript the same forms still post and redirect as before.
+const INLINE_SELECTORS = {
+  section: id => `section[data-section="${id}"]`,
+  box: id => `.box[data-box="${id}"]`,
+  task: id => `li[data-task="${id}"]`,
+  note: id => `.note-content[data-note="${id}"]`
+};
+const INLINE_CONTAINERS = {
+  section: () => document.getElementById('sections'),
+  box: parentId => document.querySelector(`section[data-section="${parentId}"] .grid`),
+  task: parentId => document.querySelector(`.box[data-box="${parentId}"] .cmd-list`),
+  note: parentId => document.querySelector(`section[data-section="${parentId}"] .notes-list`)
+};
+
+function applyInline(data) {
+  const current = document.querySelector(INLINE_SELECTORS[data.kind](data.id));
+  if (data.action === 'remove') {
+    if (current) current.remove();
+  } else if (current) {
+    // An item that is already here is replaced, so a patch applied twice
+    // (the form response and its live event) leaves the same page
+    current.outerHTML = data.html;
+  } else {
+    INLINE_CONTAINERS[data.kind](data.parent_id).insertAdjacentHTML('beforeend', data.html);
+    const empty = document.querySelector('.empty-state');
+    if (data.kind === 'section' && empty) empty.remove();
+  }
+  if (data.section_progress) updateSectionProgress(data.section_progress);
+  if (data.global_progress) updateGlobalProgress(data.global_progress);
+  setDraggable(editMode);
+}
+
+async function sendInline(url, body) {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: { 'Accept': 'application/json' },
+    body
+  });
+  const data = await response.json();
+  if (!data.success) {
+    alert(data.error);
+    return false;
+  }
+  applyInline(data);
+  return true;
+}
+
+document.addEventListener('submit', async function(e) {
+  const form = e.target;
+  if (!form.matches('form[data-inline]')) return;
+  e.preventDefault();
+  try {
+    if (!await sendInline(form.action, new FormData(form))) return;
+    form.reset();
+    const modal = form.closest('.modal');
+    if (modal) closeModal(modal.id);
+  } catch (err) {
+    console.error('Error saving inline edit:', err);
+    form.submit();
+  }
+});
+
+// Edit and delete buttons carry only their kind (item_controls in
+// _macros.html); the item's id and current text are read from the page.
+const ITEM_SELECTORS = {
+  section: 'section[data-section]',
+  box: '.box[data-box]',
+  task: 'li[data-task]',
+  note: '.note-content[data-note]'
+};
+const DELETE_CONFIRMS = {
+  section: '¿Eliminar esta sección?',
+  box: '¿Eliminar este box?',
+  task: '¿Eliminar esta tarea?',
+  note: '¿Eliminar esta nota?'
+};
+const ITEM_EDITORS = {
+  section: (id, item) => openModal('sectionModal', `/section/${id}/edit`,
+    { sectionLevelName: item.querySelector('h2').textContent }),
+  box: (id, item) => openModal('boxModal', `/box/${id}/edit`,
+    { boxTitle: item.querySelector('.box-title').textContent }),
+  task: (id, item) => openModal('taskModal', `/task/${id}/edit`,
+    { taskText: item.querySelector('label span').textContent }),
+  note: (id, item) => {
+    document.getElementById('noteModalTitle').textContent = 'Editar Nota';
+    openModal('noteModal', `/note/${id}/edit`, { noteContent: item.dataset.markdown });
+  }
+};
+
+document.addEventListener('click', async function(e) {
+  const button = e.target.closest('[data-edit], [data-delete], [data-new-note]');
+  if (!button) return;
+  if (button.matches('[data-new-note]')) {
+    showNoteForm(button.closest('section[data-section]').dataset.section);
+    return;
+  }
+  const kind = button.dataset.edit || button.dataset.delete;
+  const item = button.closest(ITEM_SELECTORS[kind]);
+  const id = item.dataset[kind];
+  if (button.dataset.edit) {
+    ITEM_EDITORS[kind](id, item);
+  } else if (confirm(DELETE_CONFIRMS[kind])) {
+    try {
+      await sendInline(`/${kind}/${id}/delete`, new FormData());
+    } catch (err) {
+      console.error('Error deleting item:', err);
+    }
+  }
+});
+
+// Live updates from other tabs and browsers (see events.py). Every event is
+// safe to apply twice, so this tab's own changes coming back are harmless.
+function recountProgress() {
+  const sectionProgress = {};
+  let completed = 0, total = 0;
+  document.querySelectorAll('section[data-section]').forEach(section => {
+    const boxes = section.querySelectorAll('input[data-task-id]');
+    const done = section.querySelectorAll('input[data-task-id]:checked').length;
+    sectionProgress[section.dataset.section] = {
+      completed: done, total: boxes.length,
+      percent: boxes.length ? Math.round(done / boxes.length * 100) : 0
+    };
+    completed += done;
+    total += boxes.length;
+  });
+  updateSectionProgress(sectionProgress);
+  updateGlobalProgress({ completed, total, percent: total ? Math.round(completed / total * 100) : 0 });
+}
+
+function checkedTaskIds(el) {
+  return new Set([...el.querySelectorAll('input[data-task-id]:checked')].map(cb => cb.dataset.taskId));
+}
+
+const LIVE_HANDLERS = {
+  progress: e => {
+    const data = JSON.parse(e.data);
+    data.task_ids.forEach(id => {
+      const cb = document.querySelector(`input[data-task-id="${id}"]`);
+      if (cb) cb.checked = data.completed;
+    });
+    updateSectionProgress(data.section_progress);
+    updateGlobalProgress(data.global_progress);
+  },
+
+  patch: e => {
+    const data = JSON.parse(e.data);
+    // The markup was rendered for whoever made the edit; keep this tab's ticks
+    const current = data.kind === 'note' ? null : document.querySelector(INLINE_SELECTORS[data.kind](data.id));
+    const checked = current && checkedTaskIds(current);
+    applyInline(data);
+    if (checked) {
+      document.querySelectorAll(`${INLINE_SELECTORS[data.kind](data.id)} input[data-task-id]`)
+        .forEach(cb => cb.checked = checked.has(cb.dataset.taskId));
+    }
+    recountProgress();
+  },
+
+  layout: e => {
+    const data = JSON.parse(e.data);
+    const isTask = data.container === 'box';
+    for (const [parentId, ids] of Object.entries(data.layout)) {
+      const list = isTask
+        ? document.querySelector(`.box[data-box="${parentId}"] .cmd-list`)
+        : document.querySelector(`section[data-section="${parentId}"] .grid`);
+      if (!list) continue;
+      ids.forEach(id => {
+        const item = document.querySelector(isTask ? `li[data-task="${id}"]` : `.box[data-box="${id}"]`);
+        if (item && item !== dragged) list.appendChild(item);
+      });
+    }
+    recountProgress();
+  },
+
+  reload: () => location.reload(),
+};
+
+// Each server process caps its open streams. When the stream is refused (503),
+// EventSource gives up, so ask again a little later from the last event seen.
+let lastEventId = null;
+
+function listen() {
+  const url = new URL(document.getElementById('sections').dataset.events, location.href);
+  if (lastEventId) url.searchParams.set('after', lastEventId);
+  const source = new EventSource(url);
+  for (const [kind, handler] of Object.entries(LIVE_HANDLERS)) {
+    source.addEventListener(kind, e => {
+      if (e.lastEventId) lastEventId = e.lastEventId;
+      handler(e);
+    });
+  }
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED) setTimeout(listen, 15000 + Math.random() * 10000);
+  };
+}
+
+listen();
+
+// Drag and drop reordering (edit mode only). Tasks move within and between
+// boxes, boxes within and between sections. Dropping in the same container
+// saves the new order; dropping in another one moves the item there.
+let dragged = null;
+let dragOrigin = null;
+
+function setDraggable(enabled) {
+  document.querySelectorAll('li[data-task], .box[data-box]').forEach(el => el.draggable = enabled);
+}
+
+function dragContainer(item) {
+  return item.matches('li[data-task]') ? item.closest('.box') : item.closest('section[data-section]');
+}
+
+document.addEventListener('dragstart', e => {
+  const item = e.target.closest && e.target.closest('li[data-task], .box[data-box]');
+  if (!editMode || !item) return;
+  dragged = item;
+  dragOrigin = dragContainer(item);
+  item.classList.add('dragging');
+  e.dataTransfer.effectAllowed = 'move';
+  e.dataTransfer.setData('text/plain', '');
+});
+
+document.addEventListener('dragover', e => {
+  if (!dragged) return;
+  const isTask = dragged.matches('li[data-task]');
+  const container = isTask ? e.target.closest('.box') : e.target.closest('section[data-section]');
+  if (!container) return;
+  e.preventDefault();
+  const list = container.querySelector(isTask ? '.cmd-list' : '.grid');
+  const over = e.target.closest(isTask ? 'li[data-task]' : '.box[data-box]');
+  if (over && over !== dragged && list.contains(over)) {
+    const rect = over.getBoundingClientRect();
+    const before = isTask ? e.clientY < rect.top + rect.height / 2 : e.clientX < rect.left + rect.width / 2;
+    list.insertBefore(dragged, before ? over : over.nextSibling);
+  } else if (!over && dragged.parentElement !== list) {
+    list.appendChild(dragged);
+  }
+});
+
+document.addEventListener('drop', e => {
+  if (dragged) e.preventDefault();
+});
+
+document.addEventListener('dragend', async () => {
+  if (!dragged) return;
+  const item = dragged, origin = dragOrigin;
+  dragged = dragOrigin = null;
+  item.classList.remove('dragging');
+
+  const isTask = item.matches('li[data-task]');
+  const container = dragContainer(item);
+  const ids = [...container.querySelectorAll(isTask ? 'li[data-task]' : '.box[data-box]')]
+    .map(el => Number(isTask ? el.dataset.task : el.dataset.box));
+  const id = Number(isTask ? item.dataset.task : item.dataset.box);
+  const parentId = Number(isTask ? container.dataset.box : container.dataset.section);
+  let url, body;
+  if (container === origin) {
+    url = `/api/${isTask ? 'box' : 'section'}/${parentId}/reorder`;
+    body = { ids };
+  } else if (isTask) {
+    url = '/api/tasks/move';
+    body = { task_ids: [id], box_id: parentId, position: ids.indexOf(id) + 1 };
+  } else {
+    url = '/api/boxes/move';
+    body = { box_ids: [id], section_id: parentId, position: ids.indexOf(id) + 1 };
+  }
+
+  try {
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body)
+    });
+    const data = await response.json();
+    if (!data.success) {
+      alert(data.error);
+      location.reload();
+    } else if (data.section_progress) {
+      updateSectionProgress(data.section_progress);
+    }
+  } catch (err) {
+    console.error('Error saving order:', err);
+    location.reload();
+  }
+});
+
+// Modal functions
+function closeModal(id) {
+  document.getElementById(id).classList.remove('active');
+}
+
+function openModal(id, action, values) {
+  const modal = document.getElementById(id);
+  modal.querySelector('form').action = action;
+  for (const [field, value] of Object.entries(values)) {
+    document.getElementById(field).value = value;
+  }
+  modal.classList.add('active');
+}
+
+function showNoteForm(sectionId) {
+  document.getElementById('noteModalTitle').textContent = 'Nueva Nota';
+  openModal('noteModal', `/section/${sectionId}/note/new`, { noteContent: '' });
+}
+
+// Close modals on outside click
+document.querySelectorAll('.modal').forEach(modal => {
+  modal.addEventListener('click', function(e) {
+    if (e.target === this) closeModal(this.id);
+  });
+});
+
+// Close modals on escape
+document.addEventListener('keydown', function(e) {
+  if (e.key === 'Escape') {
+    document.querySelectorAll('.modal.active').forEach(m => m.classList.remove('active'));
+  }
+});
@@ -0,0 +1,92 @@
+"""Shared fixtures: a fresh app per test, built through create_app on its own SQLite file.
+
+    python -m pytest -q
+"""
+import contextlib
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from app import create_app, init_db  # noqa: E402
+from models import db, Category, Book, Chapter, Sheet, Note  # noqa: E402
+import compression  # noqa: E402
+import importer  # noqa: E402
+import markdown_cache  # noqa: E402
+import page_cache  # noqa: E402
+import search  # noqa: E402
+import snapshots  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "learnboard.db"}',
+        'IMPORT_JOBS_DIR': str(tmp_path / 'imports'),
+    })
+    with app.app_context():
+        init_db()
+    # The in-process caches are module globals and would leak pages between tests
+    for cache in (page_cache.cache, compression.cache, markdown_cache.cache):
+        cache.clear()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def csv_rows(sections, boxes, tasks, level='Nivel'):
+    """DictReader-style rows for a sheet of sections x boxes x tasks."""
+    return [
+        {'level': f'{level} {s}', 'section_order': str(s), 'box_number': str(b), 'box_title': f'Box {b}',
+         'task_order': str(t), 'task_text': f'Tarea {s}.{b}.{t}'}
+        for s in range(1, sections + 1) for b in range(1, boxes + 1) for t in range(1, tasks + 1)
+    ]
+
+
+@pytest.fixture
+def make_sheet(app):
+    """Create a sheet of sections x boxes x tasks (plus `notes` per section) and return its id."""
+    def make(sections=1, boxes=1, tasks=1, notes=0):
+        with app.app_context():
+            category = Category(name='Categoría')
+            book = Book(name='Libro', category=category)
+            chapter = Chapter(name='Capítulo', book=book, order=1)
+            sheet = Sheet(name='Hoja', chapter=chapter, order=1)
+            db.session.add(sheet)
+            db.session.flush()
+            importer.CsvImporter(sheet.id).run(csv_rows(sections, boxes, tasks))
+            for section in sheet.sections:
+                for n in range(notes):
+                    note = Note(content_markdown=f'Nota **{n}**', section_id=section.id)
+                    markdown_cache.refresh(note)
+                    db.session.add(note)
+            search.reindex_sheet(sheet.id)
+            snapshots.mark([sheet.id])
+            db.session.commit()
+            return sheet.id
+    return make
+
+
+@contextlib.contextmanager
+def count_statements():
+    """Collect the SQL statements run inside the block (requires an app context)."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
@@ -0,0 +1,76 @@
+"""Batch task progress and the read-only JSON tree API."""
+import pytest
+
+from models import db, Section, Task
+import progress
+
+
+def task_ids(app, sheet_id):
+    with app.app_context():
+        return db.session.execute(
+            db.select(Task.id).join(Task.box).join(Section).where(Section.sheet_id == sheet_id).order_by(Task.id)
+        ).scalars().all()
+
+
+def set_progress(client, ids, completed):
+    return client.post('/api/tasks/progress', json={'task_ids': ids, 'completed': completed})
+
+
+def test_batch_progress_updates_counters(app, client, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=2, tasks=3)
+    ids = task_ids(app, sheet_id)
+
+    data = set_progress(client, ids[:8], True).get_json()
+    assert data['success'] and data['updated'] == 8
+    assert data['sheet_progress'][str(sheet_id)]['completed'] == 8
+    assert data['sheet_progress'][str(sheet_id)]['delta'] == 8
+    assert sorted(p['delta'] for p in data['section_progress'].values()) == [2, 6]
+
+    # Tasks already in the requested state are left alone
+    data = set_progress(client, ids[:10], True).get_json()
+    assert data['updated'] == 2 and data['sheet_progress'][str(sheet_id)]['completed'] == 10
+    sheet = set_progress(client, ids[:3], False).get_json()['sheet_progress'][str(sheet_id)]
+    assert (sheet['completed'], sheet['delta']) == (7, -3)
+    with app.app_context():
+        assert progress.find_mismatches() == []
+
+
+def test_batch_with_unknown_ids_writes_nothing(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    ids = task_ids(app, sheet_id)
+    response = set_progress(client, ids + [9999], True)
+    assert response.status_code == 404
+    assert response.get_json()['missing'] == [9999]
+    assert client.get(f'/api/sheet/{sheet_id}').get_json()['progress']['completed'] == 0
+
+
+@pytest.mark.parametrize('payload', [
+    {},
+    {'task_ids': [], 'completed': True},
+    {'task_ids': 1, 'completed': True},
+    {'task_ids': ['1'], 'completed': True},
+    {'task_ids': [1.5], 'completed': True},
+    # JSON true is a Python bool, which is also an int
+    {'task_ids': [True], 'completed': True},
+    {'task_ids': [1, False], 'completed': False},
+    {'task_ids': [1], 'completed': 1},
+    {'task_ids': list(range(1, 1002)), 'completed': True},
+])
+def test_batch_rejects_malformed_payloads(client, payload):
+    response = client.post('/api/tasks/progress', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_json_api_answers_304_until_the_data_changes(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    for url in ('/api/categories', f'/api/sheet/{sheet_id}'):
+        response = client.get(url)
+        etag = response.headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    set_progress(client, task_ids(app, sheet_id)[:1], True)
+    changed = client.get(f'/api/sheet/{sheet_id}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['progress']['completed'] == 1
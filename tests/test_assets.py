@@ -0,0 +1,21 @@
+"""Fingerprinted static files."""
+import re
+
+import assets
+
+
+def test_fingerprinted_assets_are_immutable(client):
+    page = client.get('/').get_data(as_text=True)
+    url = re.search(r'href="(/static/css/app\.css\?v=[0-9a-f]+)"', page).group(1)
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == assets.IMMUTABLE
+    response.close()
+
+
+def test_unversioned_or_stale_assets_revalidate(client):
+    for url in ('/static/css/app.css', '/static/css/app.css?v=000000000000'):
+        response = client.get(url)
+        assert response.headers['Cache-Control'] == 'no-cache'
+        response.close()
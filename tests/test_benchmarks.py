@@ -0,0 +1,65 @@
+"""The synthetic library generator and the benchmark suite."""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import datagen  # noqa: E402
+import suite  # noqa: E402
+
+SHAPE = {'categories': 1, 'books': 2, 'chapters': 2, 'sheets': 2,
+         'sections': 2, 'boxes': 3, 'tasks': 4, 'notes': 1}
+
+
+def flask(path, *args):
+    env = dict(os.environ, LEARNBOARD_DATABASE_URI=f'sqlite:///{path}')
+    return subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', *args],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+
+
+def test_generated_library_matches_its_shape(tmp_path):
+    path = tmp_path / 'library.db'
+    written = datagen.generate(str(path), SHAPE, completed=0.5)
+    for level in datagen.LEVELS:
+        assert written[level] == datagen.shape_total(SHAPE, level), level
+    assert written['sheet_progress'] == datagen.shape_total(SHAPE, 'sheets')
+
+    # init-db stores the snapshots; then precomputed totals, bit indexes,
+    # popcounts and snapshots agree with the generated rows
+    assert flask(path, 'init-db').returncode == 0
+    result = flask(path, 'progress', 'check')
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'Progress counters are consistent' in result.stdout
+    result = flask(path, 'snapshots', 'check')
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_compare_flags_slower_medians_and_extra_queries():
+    baseline = {'index': {'p50_ms': 10.0, 'queries_max': 6},
+                'view_sheet': {'p50_ms': 10.0, 'queries_max': 5},
+                'toggle_task': {'p50_ms': 10.0, 'queries_max': 12}}
+    results = {'index': {'p50_ms': 20.0, 'queries_max': 6},
+               'view_sheet': {'p50_ms': 10.5, 'queries_max': 6},
+               'toggle_task': {'p50_ms': 10.5, 'queries_max': 12},
+               'new_scenario': {'p50_ms': 1.0, 'queries_max': 1}}
+    assert suite.compare(results, baseline, tolerance=0.25) == ['index', 'view_sheet']
+
+
+def test_suite_saves_a_baseline_it_can_compare_against(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    args = [sys.executable, os.path.join(ROOT, 'benchmarks', 'suite.py'), '--size', 'small',
+            '--repeat', '2', '--repeat-heavy', '1', '--import-rows', '50']
+    subprocess.run(args + ['--save', str(baseline)], cwd=tmp_path, capture_output=True, check=True)
+    report = json.loads(baseline.read_text())
+    assert set(report['results']) >= {'index', 'view_sheet', 'toggle_task', 'import_csv', 'delete_book'}
+    for result in report['results'].values():
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+        assert result['queries_max'] > 0
+
+    # Query counts are deterministic, so only the timing tolerance needs slack
+    rerun = subprocess.run(args + ['--compare', str(baseline), '--tolerance', '100'],
+                           cwd=tmp_path, capture_output=True, text=True)
+    assert rerun.returncode == 0, rerun.stdout
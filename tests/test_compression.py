@@ -0,0 +1,37 @@
+"""Response compression."""
+import gzip
+
+import compression
+import events
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def test_large_pages_are_gzipped_with_a_weak_etag(client, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=3, tasks=3)
+    url = f'/sheet/{sheet_id}'
+    plain = client.get(url)
+    response = client.get(url, headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+
+    etag = response.headers['ETag']
+    assert etag.startswith('W/') and etag[2:] == plain.headers['ETag']
+    assert client.get(url, headers={**GZIP, 'If-None-Match': etag}).status_code == 304
+
+
+def test_small_bodies_are_sent_as_they_are(app, client):
+    app.add_url_rule('/tiny', 'tiny', lambda: 'x' * (compression.MIN_BYTES - 1))
+    response = client.get('/tiny', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data(as_text=True) == 'x' * (compression.MIN_BYTES - 1)
+
+
+def test_event_streams_are_not_compressed(client, make_sheet, monkeypatch):
+    monkeypatch.setattr(events, 'STREAM_SECONDS', 0.05)
+    sheet_id = make_sheet()
+    response = client.get(f'/sheet/{sheet_id}/events', headers=GZIP)
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data().startswith(b'retry:')
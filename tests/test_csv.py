@@ -0,0 +1,136 @@
+"""CSV export and import round-trip."""
+import csv
+import io
+
+from models import db, Sheet, Task
+import importer
+
+
+def rows(data):
+    return list(csv.DictReader(io.StringIO(data.decode('utf-8'))))
+
+
+def task_texts(app):
+    with app.app_context():
+        return db.session.execute(db.select(Task.task_text).order_by(Task.id)).scalars().all()
+
+
+def empty_sheet(app, next_to):
+    with app.app_context():
+        sheet = Sheet(name='Copia', chapter_id=db.session.get(Sheet, next_to).chapter_id, order=2)
+        db.session.add(sheet)
+        db.session.commit()
+        return sheet.id
+
+
+def test_sheet_export_imports_back_identically(app, client, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=3, tasks=4)
+    exported = client.get(f'/sheet/{sheet_id}/export')
+    assert exported.mimetype == 'text/csv'
+    assert len(rows(exported.data)) == 2 * 3 * 4
+
+    copy_id = empty_sheet(app, sheet_id)
+    response = client.post(f'/sheet/{copy_id}/import',
+                           data={'csv_file': (io.BytesIO(exported.data), 'hoja.csv')},
+                           content_type='multipart/form-data')
+    assert response.location.endswith(f'/sheet/{copy_id}')
+    assert client.get(f'/sheet/{copy_id}/export').data == exported.data
+
+
+def test_export_columns(app, client, make_sheet):
+    sheet_id = make_sheet(sections=1, boxes=1, tasks=2, notes=1)
+    with app.app_context():
+        sheet = db.session.get(Sheet, sheet_id)
+        chapter_id, book_id = sheet.chapter_id, sheet.chapter.book_id
+        task_id = db.session.execute(db.select(Task.id).order_by(Task.id)).scalar()
+    client.post(f'/api/task/{task_id}/toggle')
+
+    sheet_rows = rows(client.get(f'/sheet/{sheet_id}/export?progress=1&notes=1').data)
+    assert [row['completed'] for row in sheet_rows if row['task_text']] == ['1', '0']
+    assert [row['note'] for row in sheet_rows if row['note']] == ['Nota **0**']
+
+    [chapter_row, _] = rows(client.get(f'/chapter/{chapter_id}/export').data)
+    assert (chapter_row['sheet_order'], chapter_row['sheet']) == ('1', 'Hoja')
+    [book_row, _] = rows(client.get(f'/book/{book_id}/export').data)
+    assert (book_row['chapter'], book_row['sheet'], book_row['task_text']) == ('Capítulo', 'Hoja', 'Tarea 1.1.1')
+
+
+def test_sheet_export_with_notes_and_progress_imports_back(app, client, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=3, tasks=4, notes=2)
+    before = task_texts(app)
+    # The sheet page's "Exportar CSV" button
+    exported = client.get(f'/sheet/{sheet_id}/export?progress=1&notes=1').data
+    assert b'Nota' in exported
+
+    response = client.post(f'/sheet/{sheet_id}/import',
+                           data={'csv_file': (io.BytesIO(exported), 'hoja.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert response.location.endswith(f'/sheet/{sheet_id}')
+    assert task_texts(app) == before
+
+    preview = client.post(f'/sheet/{sheet_id}/import',
+                          data={'csv_file': (io.BytesIO(exported), 'hoja.csv'), 'dry_run': '1'},
+                          content_type='multipart/form-data', headers={'Accept': 'application/json'}).json
+    assert preview['tasks'] == {'new': 0, 'changed': 0, 'unchanged': len(before)}
+    assert preview['skipped'] == 2 * 2
+
+
+def test_parse_row_ignores_note_rows_before_parsing_numbers():
+    note = {'level': 'Nivel 1', 'section_order': '1', 'box_number': '', 'box_title': '',
+            'task_order': '', 'task_text': '', 'note': 'texto'}
+    assert importer.parse_row(note) is None
+
+
+def legacy_merge(rows):
+    """What the per-row importer built from `rows` on an empty sheet."""
+    sections = {}
+    for row in rows:
+        parsed = importer.parse_row(row)
+        if parsed is None:
+            continue
+        level, section_order, box_number, box_title, task_order, task_text = parsed
+        boxes = sections.setdefault((level, section_order), {})
+        if box_number > importer.MAX_BOXES:
+            continue
+        title, tasks = boxes.setdefault(box_number, (box_title, {}))
+        tasks[task_order] = task_text
+    return sections
+
+
+def sheet_tree(app, sheet_id):
+    with app.app_context():
+        sections = {}
+        for section in db.session.get(Sheet, sheet_id).sections:
+            boxes = sections.setdefault((section.level_name, section.section_order), {})
+            for box in section.boxes:
+                boxes[box.box_number] = (box.box_title, {t.task_order: t.task_text for t in box.tasks})
+        return sections
+
+
+def test_import_matches_the_per_row_merge(app, make_sheet):
+    sheet_id = make_sheet()
+    over = importer.MAX_BOXES + 1
+    data = [
+        {'level': 'Nivel 1', 'section_order': '1', 'box_number': '2', 'box_title': 'Primero',
+         'task_order': '1', 'task_text': 'Vieja'},
+        {'level': 'Nivel 1', 'section_order': '1', 'box_number': '2', 'box_title': 'Segundo',
+         'task_order': '1', 'task_text': 'Nueva'},
+        {'level': 'Nivel 1', 'section_order': '1', 'box_number': str(over), 'box_title': 'Fuera',
+         'task_order': '1', 'task_text': 'Ignorada'},
+        # Every row of this section is over the limit: the section is still created
+        {'level': 'Nivel 9', 'section_order': '9', 'box_number': str(over), 'box_title': 'Fuera',
+         'task_order': '1', 'task_text': 'Ignorada'},
+    ]
+    with app.app_context():
+        sheet = db.session.get(Sheet, sheet_id)
+        copy = Sheet(name='Copia', chapter_id=sheet.chapter_id, order=2)
+        db.session.add(copy)
+        db.session.flush()
+        stats = importer.CsvImporter(copy.id).run(data)
+        db.session.commit()
+        copy_id = copy.id
+    assert stats.over_limit == 2
+    assert stats.sections_created == 2
+    assert sheet_tree(app, copy_id) == legacy_merge(data)
+    assert sheet_tree(app, copy_id)[('Nivel 9', 9)] == {}
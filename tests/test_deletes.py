@@ -0,0 +1,66 @@
+"""Set-based subtree deletes."""
+import pytest
+
+from models import db, Category, Book, Chapter, Sheet, Section, Box, Task, Note, SheetProgress
+import progress
+
+from conftest import count_statements
+
+MODELS = [Category, Book, Chapter, Sheet, Section, Box, Task, Note, SheetProgress]
+
+
+def counts(app):
+    with app.app_context():
+        return {model.__tablename__: db.session.execute(db.select(db.func.count()).select_from(model)).scalar()
+                for model in MODELS}
+
+
+def parents(app, sheet_id):
+    with app.app_context():
+        sheet = db.session.get(Sheet, sheet_id)
+        section = sheet.sections[0]
+        return {'category': sheet.chapter.book.category_id, 'book': sheet.chapter.book_id,
+                'chapter': sheet.chapter_id, 'sheet': sheet_id, 'section': section.id,
+                'box': section.boxes[0].id, 'task': section.boxes[0].tasks[0].id}
+
+
+@pytest.mark.parametrize('scope', ['category', 'book', 'chapter', 'sheet'])
+def test_delete_leaves_no_orphans(app, client, make_sheet, scope):
+    kept = make_sheet(sections=1, boxes=2, tasks=2, notes=1)
+    before = counts(app)
+    doomed = parents(app, make_sheet(sections=2, boxes=3, tasks=4, notes=2))
+    client.post(f'/api/task/{doomed["task"]}/toggle')
+
+    assert client.post(f'/{scope}/{doomed[scope]}/delete').status_code == 302
+    after = counts(app)
+    # Containers above the deleted one survive
+    above = ['categories', 'books', 'chapters'][:['category', 'book', 'chapter', 'sheet'].index(scope)]
+    assert {table: after[table] - before[table] for table in above} == {table: 1 for table in above}
+    assert {table: count for table, count in after.items() if table not in above} == \
+           {table: count for table, count in before.items() if table not in above}
+    assert client.get('/api/search?q=Tarea').get_json()['results'][0]['sheet_id'] == kept
+    with app.app_context():
+        assert progress.find_mismatches() == []
+
+
+def test_section_and_box_deletes_adjust_counters(app, client, make_sheet):
+    ids = parents(app, make_sheet(sections=2, boxes=2, tasks=3))
+    client.post(f'/api/task/{ids["task"]}/toggle')
+    client.post(f'/box/{ids["box"]}/delete')
+    assert client.get(f'/api/sheet/{ids["sheet"]}').get_json()['progress']['total'] == 9
+    client.post(f'/section/{ids["section"]}/delete')
+    assert client.get(f'/api/sheet/{ids["sheet"]}').get_json()['progress'] == \
+        {'completed': 0, 'total': 6, 'percent': 0}
+    with app.app_context():
+        assert progress.find_mismatches() == []
+
+
+def test_book_delete_statements_do_not_grow_with_the_book(app, client, make_sheet):
+    statements = []
+    # The first delete also resumes background jobs and creates the root's cache version
+    for size in (1, 1, 6):
+        book_id = parents(app, make_sheet(sections=size, boxes=size, tasks=size, notes=size))['book']
+        with app.app_context(), count_statements() as seen:
+            client.post(f'/book/{book_id}/delete')
+        statements.append(len(seen))
+    assert statements[1] == statements[2]
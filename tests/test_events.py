@@ -0,0 +1,156 @@
+"""Live sheet updates over Server-Sent Events."""
+import re
+import threading
+
+import pytest
+from sqlalchemy import delete
+
+import events
+from models import db, Sheet, Learner, SheetEvent
+
+JSON = {'Accept': 'application/json'}
+
+
+@pytest.fixture(autouse=True)
+def short_streams(monkeypatch):
+    monkeypatch.setattr(events, 'STREAM_SECONDS', 0.05)
+    monkeypatch.setattr(events, 'POLL_SECONDS', 0.01)
+
+
+def task_ids(app, sheet_id):
+    with app.app_context():
+        return [task.id for task in db.session.get(Sheet, sheet_id).sections[0].boxes[0].tasks]
+
+
+def read(client, sheet_id, last_event_id=None):
+    headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+    response = client.get(f'/sheet/{sheet_id}/events', headers=headers)
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    # Frees the stream's slot
+    response.close()
+    return body
+
+
+def test_stream_resumes_after_last_event_id(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    first, second = task_ids(app, sheet_id)
+    client.post(f'/api/task/{first}/toggle')
+    with app.app_context():
+        seen = events.last_id(sheet_id)
+    client.post(f'/api/task/{second}/toggle')
+
+    body = read(client, sheet_id, seen)
+    assert body.startswith(f'retry: {events.RETRY_MS}\nid: {seen}\n\n')
+    assert f'"task_ids": [{second}]' in body and f'"task_ids": [{first}]' not in body
+    # A fresh stream starts from now
+    assert 'event: progress' not in read(client, sheet_id)
+
+
+def test_publish_between_two_streams_is_not_lost(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    first, second = task_ids(app, sheet_id)
+    client.post(f'/api/task/{first}/toggle')
+
+    # A stream that saw no events still tells the browser where it started
+    body = read(client, sheet_id)
+    [start] = re.findall(r'^id: (\d+)$', body, re.M)
+    assert 'event: progress' not in body
+    client.post(f'/api/task/{second}/toggle')
+
+    # The browser reconnects with the last id it was given
+    body = read(client, sheet_id, int(start))
+    assert f'"task_ids": [{second}]' in body and f'"task_ids": [{first}]' not in body
+
+
+def test_page_resumes_from_its_render(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    first, second = task_ids(app, sheet_id)
+    client.post(f'/api/task/{first}/toggle')
+    page = client.get(f'/sheet/{sheet_id}').get_data(as_text=True)
+    url = re.search(r'data-events="([^"]+)"', page).group(1).replace('&amp;', '&')
+    with app.app_context():
+        assert url.endswith(f'?after={events.last_id(sheet_id)}')
+
+    # Published after the render, before the page's first connect
+    client.post(f'/api/task/{second}/toggle')
+    response = client.get(url)
+    body = response.get_data(as_text=True)
+    response.close()
+    assert f'"task_ids": [{second}]' in body and f'"task_ids": [{first}]' not in body
+
+
+def test_progress_only_reaches_its_learner(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    first, second = task_ids(app, sheet_id)
+    with app.app_context():
+        learner = Learner(name='Ana')
+        db.session.add(learner)
+        db.session.commit()
+        other_id = learner.id
+    other = app.test_client()
+    other.post(f'/learner/{other_id}/select')
+
+    other.post(f'/api/task/{first}/toggle')
+    client.post(f'/task/{second}/edit', data={'task_text': 'Editada <b>'}, headers=JSON)
+    body = read(client, sheet_id, 0)
+    assert 'event: progress' not in body
+    assert 'event: patch' in body and 'Editada &lt;b&gt;' in body
+    assert 'event: progress' in read(other, sheet_id, 0)
+
+
+def test_pruned_gap_asks_for_reload(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=3)
+    for task_id in task_ids(app, sheet_id):
+        client.post(f'/api/task/{task_id}/toggle')
+    with app.app_context():
+        latest = events.last_id(sheet_id)
+        db.session.execute(delete(SheetEvent).where(SheetEvent.id < latest))
+        db.session.commit()
+
+    body = read(client, sheet_id, latest - 3)
+    assert f'id: {latest}\nevent: reload\n' in body
+    assert 'event: progress' not in body
+    # A page rendered at the newest event missed nothing, even once that event
+    # is pruned while other sheets' events remain
+    other = make_sheet(tasks=3)
+    for task_id in task_ids(app, other):
+        client.post(f'/api/task/{task_id}/toggle')
+    with app.app_context():
+        db.session.execute(delete(SheetEvent).where(SheetEvent.id <= latest + 1))
+        db.session.commit()
+    assert 'event: reload' not in read(client, sheet_id, latest)
+
+
+def test_streams_are_capped_per_process(app, client, make_sheet, monkeypatch):
+    monkeypatch.setattr(events, '_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(events, 'STREAM_SECONDS', 0.2)
+    sheet_id = make_sheet()
+    url = f'/sheet/{sheet_id}/events'
+
+    first = client.get(url, buffered=False)
+    assert first.status_code == 200
+    assert next(first.response).startswith(b'retry:')
+    busy = client.get(url)
+    assert busy.status_code == 503
+    assert busy.headers['Retry-After'] == str(events.RETRY_BUSY_SECONDS)
+
+    first.close()
+    again = client.get(url, buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+
+def test_stream_resumes_from_the_after_parameter(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    first, second = task_ids(app, sheet_id)
+    client.post(f'/api/task/{first}/toggle')
+    with app.app_context():
+        seen = events.last_id(sheet_id)
+    client.post(f'/api/task/{second}/toggle')
+
+    # A page that fell back after a 503 reconnects with ?after=
+    response = client.get(f'/sheet/{sheet_id}/events?after={seen}')
+    body = response.get_data(as_text=True)
+    response.close()
+    assert f'"task_ids": [{second}]' in body and f'"task_ids": [{first}]' not in body
@@ -0,0 +1,93 @@
+"""Dry-run CSV imports: preview, then apply exactly the stored plan."""
+import csv
+import io
+import os
+
+from conftest import csv_rows
+from models import db, Task
+
+JSON = {'Accept': 'application/json'}
+
+
+def csv_text(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+def upload(sheet_id):
+    """The sheet's rows with one task renamed, one task added and one box over the limit."""
+    rows = csv_rows(1, 2, 2)
+    rows[0]['task_text'] = 'Renombrada'
+    rows.append(dict(rows[1], task_order='3', task_text='Nueva'))
+    rows.append(dict(rows[1], box_number='26', task_text='Fuera del límite'))
+    return csv_text(rows)
+
+
+def task_texts(app):
+    with app.app_context():
+        return db.session.execute(db.select(Task.task_text).order_by(Task.id)).scalars().all()
+
+
+def preview(client, sheet_id, text):
+    return client.post(f'/sheet/{sheet_id}/import', data={'csv_text': text, 'dry_run': '1'}, headers=JSON).json
+
+
+def test_preview_counts_changes_without_writing(app, client, make_sheet):
+    sheet_id = make_sheet(1, 2, 2)
+    before = task_texts(app)
+    plan = preview(client, sheet_id, upload(sheet_id))
+    assert plan['tasks'] == {'new': 1, 'changed': 1, 'unchanged': 3}
+    assert plan['boxes'] == {'new': 0, 'changed': 0, 'unchanged': 2}
+    assert plan['over_limit'] == 1 and plan['over_limit_rows'] == [6]
+    assert task_texts(app) == before
+
+    page = client.post(f'/sheet/{sheet_id}/import', data={'csv_text': upload(sheet_id), 'dry_run': '1'})
+    assert 'Aplicar cambios' in page.get_data(as_text=True)
+
+
+def test_apply_writes_the_plan_once(app, client, make_sheet):
+    sheet_id = make_sheet(1, 2, 2)
+    apply_url = preview(client, sheet_id, upload(sheet_id))['apply_url']
+    response = client.post(apply_url)
+    assert response.status_code == 302
+    assert response.location.endswith(f'/sheet/{sheet_id}')
+    texts = task_texts(app)
+    assert texts[0] == 'Renombrada' and 'Nueva' in texts and 'Fuera del límite' not in texts
+    assert not [name for name in os.listdir(app.config['IMPORT_JOBS_DIR']) if name.endswith('.plan')]
+
+    # The token is spent
+    again = client.post(apply_url)
+    assert again.location.endswith(f'/sheet/{sheet_id}/import')
+    assert task_texts(app) == texts
+
+
+def test_stale_plan_is_rejected(app, client, make_sheet):
+    sheet_id = make_sheet(1, 2, 2)
+    apply_url = preview(client, sheet_id, upload(sheet_id))['apply_url']
+    with app.app_context():
+        task_id = db.session.execute(db.select(Task.id).order_by(Task.id)).scalar()
+    client.post(f'/task/{task_id}/edit', data={'task_text': 'Editada después'})
+    before = task_texts(app)
+
+    response = client.post(apply_url)
+    assert response.location.endswith(f'/sheet/{sheet_id}/import')
+    assert task_texts(app) == before
+
+
+def test_unknown_tokens_and_other_sheets_are_rejected(app, client, make_sheet):
+    sheet_id, other_id = make_sheet(1, 2, 2), make_sheet(1, 2, 2)
+    apply_url = preview(client, sheet_id, upload(sheet_id))['apply_url']
+    token = apply_url.rsplit('/', 2)[-2]
+    before = task_texts(app)
+
+    for url in (f'/sheet/{other_id}/import/{token}/apply', f'/sheet/{sheet_id}/import/{"0" * 32}/apply',
+                f'/sheet/{sheet_id}/import/..%2Fsecret/apply'):
+        response = client.post(url)
+        assert response.status_code in (302, 404)
+        if response.status_code == 302:
+            assert response.location.endswith('/import')
+    assert client.post(f'/sheet/999/import/{token}/apply').status_code == 404
+    assert task_texts(app) == before
@@ -0,0 +1,84 @@
+"""Inline sheet edits answered with JSON patches instead of redirects."""
+import pytest
+
+from models import db, Section, Box, Task
+import ordering
+from routes import wants_partial
+
+JSON = {'Accept': 'application/json'}
+
+
+def first(app, model, **filters):
+    with app.app_context():
+        return db.session.execute(db.select(model.id).filter_by(**filters).order_by(model.id)).scalars().first()
+
+
+@pytest.mark.parametrize('accept, expected', [
+    ('application/json', True),
+    ('text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8', False),
+    (None, False),
+])
+def test_wants_partial(app, accept, expected):
+    headers = {'Accept': accept} if accept else {}
+    with app.test_request_context(headers=headers):
+        assert wants_partial() is expected
+
+
+def test_form_posts_still_redirect(app, client, make_sheet):
+    sheet_id = make_sheet()
+    box_id = first(app, Box)
+    response = client.post(f'/box/{box_id}/task/new', data={'task_text': 'Nueva'})
+    assert response.status_code == 302 and response.location.endswith(f'/sheet/{sheet_id}')
+
+
+def test_new_task_appends_escaped_html_with_counters(app, client, make_sheet):
+    sheet_id = make_sheet(boxes=1, tasks=2)
+    box_id, section_id = first(app, Box), first(app, Section)
+    data = client.post(f'/box/{box_id}/task/new', data={'task_text': '<b>x</b> & y'}, headers=JSON).get_json()
+
+    assert (data['action'], data['kind'], data['parent_id']) == ('append', 'task', box_id)
+    assert '&lt;b&gt;x&lt;/b&gt; &amp; y' in data['html'] and '<b>' not in data['html']
+    assert f'data-task="{data["id"]}"' in data['html']
+    assert data['section_progress'][str(section_id)]['total'] == 3
+    assert data['global_progress']['total'] == 3
+    assert client.get(f'/sheet/{sheet_id}').status_code == 200
+
+
+def test_edits_replace_and_deletes_remove(app, client, make_sheet):
+    make_sheet(sections=1, boxes=2, tasks=2)
+    section_id, box_id = first(app, Section), first(app, Box)
+
+    data = client.post(f'/section/{section_id}/edit', data={'level_name': 'Nivel <A>'}, headers=JSON).get_json()
+    assert (data['action'], data['kind'], data['id']) == ('replace', 'section', section_id)
+    assert 'Nivel &lt;A&gt;' in data['html']
+
+    data = client.post(f'/box/{box_id}/delete', headers=JSON).get_json()
+    assert (data['action'], data['kind'], data['id'], data['parent_id']) == ('remove', 'box', box_id, section_id)
+    assert data['html'] is None
+    assert data['section_progress'][str(section_id)]['total'] == 2
+    assert data['global_progress']['total'] == 2
+
+
+@pytest.mark.parametrize('url, form', [
+    ('/box/{box}/task/new', {'task_text': '  '}),
+    ('/task/{task}/edit', {}),
+    ('/section/{section}/edit', {'level_name': ''}),
+    ('/section/{section}/box/new', {'box_title': ''}),
+])
+def test_invalid_inline_posts_answer_400(app, client, make_sheet, url, form):
+    make_sheet(tasks=1)
+    ids = {'box': first(app, Box), 'task': first(app, Task), 'section': first(app, Section)}
+    response = client.post(url.format(**ids), data=form, headers=JSON)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False and response.get_json()['error']
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Task.id))) == 1
+        assert db.session.scalar(db.select(db.func.count(Box.id))) == 1
+
+
+def test_box_limit_answers_400(app, client, make_sheet):
+    make_sheet(boxes=ordering.MAX_BOXES)
+    section_id = first(app, Section)
+    response = client.post(f'/section/{section_id}/box/new', data={'box_title': 'Otro'}, headers=JSON)
+    assert response.status_code == 400
+    assert str(ordering.MAX_BOXES) in response.get_json()['error']
@@ -0,0 +1,81 @@
+"""Request instrumentation."""
+import logging
+import time
+
+import pytest
+from flask import Flask, g, render_template_string
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import instrumentation
+from lru import LRUCache
+
+
+@pytest.fixture
+def engine():
+    return create_engine('sqlite://')
+
+
+@pytest.fixture
+def metrics_app(engine):
+    """A bare app with metrics on, so the counts only include what its views run."""
+    app = Flask('metrics_test')
+    app.config.update(METRICS_ENABLED=True, SLOW_REQUEST_MS=50)
+    instrumentation.init_app(app, engine)
+
+    @app.route('/queries/<int:count>')
+    def run_queries(count):
+        with engine.connect() as conn:
+            for _ in range(count):
+                conn.execute(text('SELECT 1'))
+        return render_template_string('{{ count }} queries', count=count)
+
+    @app.route('/slow')
+    def slow_view():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 42'))
+        time.sleep(0.06)
+        return 'ok'
+
+    return app
+
+
+def test_requests_report_queries_and_server_timing(metrics_app):
+    response = metrics_app.test_client().get('/queries/3')
+    assert response.headers['Server-Timing'].startswith('db;desc="3 queries";dur=')
+    assert 'render;dur=' in response.headers['Server-Timing']
+
+    exposition = instrumentation.render({'notes': LRUCache(4)})
+    labels = '{endpoint="run_queries",method="GET"}'
+    assert f'learnboard_http_request_queries_count{labels} 1' in exposition
+    assert f'learnboard_http_request_queries_sum{labels} 3' in exposition
+    assert 'learnboard_http_requests_total{endpoint="run_queries",method="GET",status="200"} 1' in exposition
+    assert 'learnboard_cache_entries{cache="notes"} 0' in exposition
+
+
+def test_slow_requests_are_logged_with_their_statements(metrics_app, caplog):
+    with caplog.at_level(logging.WARNING, logger='instrumentation'):
+        metrics_app.test_client().get('/slow')
+    [record] = caplog.records
+    assert 'Slow request GET /slow' in record.getMessage()
+    assert 'SELECT 42' in record.getMessage()
+    assert 'learnboard_slow_requests_total{endpoint="slow_view",method="GET"} 1' in instrumentation.render()
+
+
+def test_failed_statement_leaves_no_timing_behind(metrics_app, engine):
+    with metrics_app.test_request_context(), engine.connect() as conn:
+        g.request_stats = stats = instrumentation.RequestStats()
+        with pytest.raises(OperationalError):
+            conn.execute(text('SELECT * FROM no_such_table'))
+        conn.rollback()
+        conn.execute(text('SELECT 1'))
+
+        timed = [statement for _, statement in stats.statements]
+        assert timed[-1] == 'SELECT 1'
+        assert 'SELECT * FROM no_such_table' not in timed
+        assert all(0 <= seconds < 1 for seconds, _ in stats.statements)
+        assert 'query_started' not in conn.info
+
+
+def test_metrics_endpoint_is_off_by_default(client):
+    assert client.get('/metrics').status_code == 404
@@ -0,0 +1,156 @@
+"""Background CSV imports."""
+import csv
+import io
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import deletes
+import jobs
+from models import db, ImportJob, Sheet, Task
+
+from conftest import csv_rows
+
+
+class QueueOnly:
+    """Stands in for the thread pool: records submitted jobs instead of running them."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, job_id):
+        self.submitted.append(job_id)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    queue = QueueOnly()
+    monkeypatch.setattr(jobs, '_pool', lambda: queue)
+    return queue
+
+
+def csv_text(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+def task_texts(app):
+    with app.app_context():
+        return db.session.execute(db.select(Task.task_text).order_by(Task.id)).scalars().all()
+
+
+def test_submit_answers_202_and_progress_shows_per_chunk(app, client, make_sheet, pool, monkeypatch):
+    sheet_id = make_sheet()
+    response = client.post(f'/sheet/{sheet_id}/import', headers={'Accept': 'application/json'},
+                           data={'csv_text': csv_text(csv_rows(1, 3, 4, level='Otro')), 'background': '1'})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert response.headers['Location'] == f'/jobs/{job_id}'
+    assert response.get_json()['status'] == 'queued'
+    assert pool.submitted == [job_id]
+
+    # Each chunk is committed before the next starts, so /jobs/<id> shows it. The poll runs
+    # in its own thread, like a browser request would, outside the job's app context.
+    seen = []
+    touch = jobs.page_cache.touch
+    def poll(scope, id_):
+        thread = threading.Thread(
+            target=lambda: seen.append(client.get(f'/jobs/{job_id}').get_json()['rows_processed']))
+        thread.start()
+        thread.join()
+        touch(scope, id_)
+    monkeypatch.setattr(jobs.page_cache, 'touch', poll)
+    monkeypatch.setattr(jobs, 'CHUNK_ROWS', 4)
+    jobs._run(job_id)
+
+    assert seen == [0, 4, 8, 12]
+    status = client.get(f'/jobs/{job_id}').get_json()
+    assert (status['status'], status['rows_processed'], status['attempts']) == ('done', 12, 1)
+    assert len(task_texts(app)) == 1 + 12
+    assert os.listdir(app.config['IMPORT_JOBS_DIR']) == []
+
+
+def test_html_forms_are_redirected_to_the_polling_page(client, make_sheet, pool):
+    sheet_id = make_sheet()
+    response = client.post(f'/sheet/{sheet_id}/import', data={'csv_text': 'x', 'background': '1'})
+    assert response.location == f'/sheet/{sheet_id}/import?job={pool.submitted[0]}'
+    assert f'/jobs/{pool.submitted[0]}'.encode() in client.get(response.location).data
+
+
+def add_job(app, sheet_id, path, **values):
+    with app.app_context():
+        job = ImportJob(sheet_id=sheet_id, path=path, **values)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def test_resume_picks_up_queued_and_stale_jobs_once(app, make_sheet, pool, tmp_path):
+    sheet_id = make_sheet()
+    path = tmp_path / 'upload.csv'
+    path.write_text(csv_text(csv_rows(1, 3, 4, level='Otro')), encoding='utf-8')
+    now = datetime.utcnow()
+    queued = add_job(app, sheet_id, str(path))
+    # Died after committing its first four rows
+    stale = add_job(app, sheet_id, str(path), status='running', rows_processed=4,
+                    heartbeat_at=now - jobs.STALE_AFTER - timedelta(seconds=1))
+    alive = add_job(app, sheet_id, str(path), status='running', heartbeat_at=now)
+    add_job(app, sheet_id, str(path), status='done')
+
+    with app.app_context():
+        assert jobs.resume() == [queued, stale]
+        assert jobs._claim(queued) is True
+        # Claimed jobs are running with a fresh heartbeat, so nobody else takes them
+        assert jobs._claim(queued) is False
+        assert jobs._claim(alive) is False
+
+    jobs._run(stale)
+    jobs._run(stale)
+    with app.app_context():
+        job = db.session.get(ImportJob, stale)
+        assert (job.status, job.attempts, job.rows_processed) == ('done', 1, 12)
+    # The resumed job continued after the rows it had committed
+    texts = task_texts(app)
+    assert 'Tarea 1.1.4' not in texts[1:] and 'Tarea 1.2.1' in texts[1:]
+
+
+def test_deleting_the_sheet_stops_its_import(app, tmp_path, make_sheet, monkeypatch):
+    sheet_id = make_sheet()
+    path = str(tmp_path / 'upload.csv')
+    with open(path, 'w', encoding='utf-8', newline='') as handle:
+        handle.write(csv_text(csv_rows(sections=1, boxes=3, tasks=4, level='Otro')))
+    monkeypatch.setattr(jobs, 'CHUNK_ROWS', 4)
+
+    mark = jobs.snapshots.mark
+    def delete_after_first_chunk(sheet_ids):
+        # The sheet is deleted and committed between two chunks
+        monkeypatch.setattr(jobs.snapshots, 'mark', mark)
+        deletes.delete_subtree('sheet', sheet_id)
+    monkeypatch.setattr(jobs.snapshots, 'mark', delete_after_first_chunk)
+
+    with app.app_context():
+        job = ImportJob(sheet_id=sheet_id, path=path, status='running')
+        db.session.add(job)
+        db.session.commit()
+        jobs._import(job)
+
+        job = db.session.get(ImportJob, job.id)
+        assert (job.status, job.error) == ('failed', 'Sheet deleted')
+        assert job.rows_processed == 4
+        assert db.session.execute(db.select(db.func.count(Task.id))).scalar() == 0
+    assert not os.path.exists(path)
+
+
+def test_deleting_a_chapter_fails_its_queued_jobs(app, make_sheet):
+    sheet_id = make_sheet()
+    with app.app_context():
+        db.session.add(ImportJob(sheet_id=sheet_id, path='unused.csv'))
+        db.session.commit()
+        deletes.delete_subtree('chapter', db.session.get(Sheet, sheet_id).chapter_id)
+        db.session.commit()
+        assert db.session.get(ImportJob, 1).status == 'failed'
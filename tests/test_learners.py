@@ -0,0 +1,23 @@
+"""Learner switching."""
+import pytest
+
+from models import db, Learner
+
+
+@pytest.mark.parametrize('target, expected', [
+    ('/sheet/1', '/sheet/1'),
+    ('/learners?x=1', '/learners?x=1'),
+    ('https://evil.example/', '/'),
+    ('//evil.example/', '/'),
+    ('/\\evil.example/', '/'),
+    ('javascript:alert(1)', '/'),
+    ('', '/'),
+])
+def test_select_learner_only_redirects_within_the_site(app, client, target, expected):
+    with app.app_context():
+        db.session.add(Learner(name='Ana'))
+        db.session.commit()
+        learner_id = db.session.execute(db.select(Learner.id).where(Learner.name == 'Ana')).scalar()
+    response = client.post(f'/learner/{learner_id}/select', data={'next': target})
+    assert response.status_code == 302
+    assert response.location == expected
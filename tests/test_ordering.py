@@ -0,0 +1,152 @@
+"""Bulk reorder and move of children, through ordering.py and its API endpoints."""
+from sqlalchemy import select
+
+from conftest import count_statements
+from models import db, Section, Box, Task
+import ordering
+import progress
+
+
+def sections(app, sheet_id):
+    with app.app_context():
+        return db.session.execute(
+            select(Section.id).where(Section.sheet_id == sheet_id).order_by(Section.section_order)
+        ).scalars().all()
+
+
+def layout(app, container, parent_ids):
+    with app.app_context():
+        return ordering.children(container, parent_ids)
+
+
+def positions(app, model, attr, ids):
+    with app.app_context():
+        rows = db.session.execute(select(model.id, getattr(model, attr)).where(model.id.in_(ids)))
+        return dict(rows.all())
+
+
+def test_reorder_swaps_positions_under_unique_indexes(app, client, make_sheet):
+    sheet_id = make_sheet(sections=3, boxes=2, tasks=3)
+    ids = sections(app, sheet_id)
+    response = client.post(f'/api/sheet/{sheet_id}/reorder', json={'ids': ids[::-1]})
+    assert response.get_json() == {'success': True, 'ids': ids[::-1]}
+    assert positions(app, Section, 'section_order', ids) == {ids[2]: 1, ids[1]: 2, ids[0]: 3}
+
+    box_id = layout(app, 'section', [ids[0]])[ids[0]][0]
+    task_ids = layout(app, 'box', [box_id])[box_id]
+    order = [task_ids[1], task_ids[2], task_ids[0]]
+    assert client.post(f'/api/box/{box_id}/reorder', json={'ids': order}).status_code == 200
+    assert layout(app, 'box', [box_id])[box_id] == order
+    assert sorted(positions(app, Task, 'task_order', task_ids).values()) == [1, 2, 3]
+
+
+def test_write_positions_is_two_updates_whatever_the_size(app, make_sheet):
+    sheet_id = make_sheet(sections=1, boxes=20, tasks=1)
+    section_id = sections(app, sheet_id)[0]
+    with app.app_context():
+        box_ids = ordering.children('section', [section_id])[section_id]
+        with count_statements() as statements:
+            ordering.reorder('section', section_id, box_ids[::-1])
+        updates = [s for s in statements if s.lstrip().upper().startswith('UPDATE')]
+        # Negated positions by primary key (one executemany), then one sign flip
+        assert len(updates) == 2
+        assert 'box_number < ' in updates[1]
+        db.session.commit()
+    assert positions(app, Box, 'box_number', box_ids) == {id_: 20 - i for i, id_ in enumerate(box_ids)}
+
+
+def test_reorder_rejects_incomplete_or_repeated_lists(app, client, make_sheet):
+    sheet_id = make_sheet(sections=3)
+    ids = sections(app, sheet_id)
+    for bad in ([ids[0], ids[1]], [ids[0], ids[0], ids[1], ids[2]], ids + [999], [], ['1'], None,
+                [True, ids[1], ids[2]]):
+        response = client.post(f'/api/sheet/{sheet_id}/reorder', json={'ids': bad})
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+    assert sections(app, sheet_id) == ids
+    assert client.post(f'/api/shelf/{sheet_id}/reorder', json={'ids': ids}).status_code == 404
+    assert client.post('/api/sheet/999/reorder', json={'ids': ids}).status_code == 404
+
+
+def test_move_tasks_shifts_section_counters(app, client, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=1, tasks=3)
+    first, second = sections(app, sheet_id)
+    source_box = layout(app, 'section', [first])[first][0]
+    target_box = layout(app, 'section', [second])[second][0]
+    moving = layout(app, 'box', [source_box])[source_box][:2]
+    client.post(f'/api/task/{moving[0]}/toggle')
+
+    data = client.post('/api/tasks/move', json={'task_ids': moving, 'box_id': target_box, 'position': 2}).get_json()
+    assert data['success']
+    target_tasks = data['boxes'][str(target_box)]
+    assert target_tasks[1:3] == moving and len(target_tasks) == 5
+    assert len(data['boxes'][str(source_box)]) == 1
+    assert data['section_progress'][str(first)] == {'completed': 0, 'total': 1, 'percent': 0}
+    assert data['section_progress'][str(second)] == {'completed': 1, 'total': 5, 'percent': 20}
+    assert sorted(positions(app, Task, 'task_order', target_tasks).values()) == [1, 2, 3, 4, 5]
+    with app.app_context():
+        assert progress.find_mismatches() == []
+
+
+def test_move_boxes_between_sections(app, client, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=3, tasks=2)
+    first, second = sections(app, sheet_id)
+    box_ids = layout(app, 'section', [first])[first]
+
+    data = client.post('/api/boxes/move', json={'box_ids': box_ids[:1], 'section_id': second}).get_json()
+    assert data['sections'][str(first)] == box_ids[1:]
+    assert data['sections'][str(second)][-1] == box_ids[0]
+    assert data['section_progress'][str(first)]['total'] == 4
+    assert data['section_progress'][str(second)]['total'] == 8
+    assert sorted(positions(app, Box, 'box_number', box_ids[1:]).values()) == [1, 2]
+    with app.app_context():
+        assert progress.find_mismatches() == []
+
+
+def test_moves_stay_within_one_sheet(app, client, make_sheet):
+    one, other = make_sheet(boxes=1, tasks=2), make_sheet(boxes=1, tasks=2)
+    section_one, section_other = sections(app, one)[0], sections(app, other)[0]
+    box_one = layout(app, 'section', [section_one])[section_one][0]
+    box_other = layout(app, 'section', [section_other])[section_other][0]
+    task_ids = layout(app, 'box', [box_one])[box_one]
+
+    response = client.post('/api/tasks/move', json={'task_ids': task_ids, 'box_id': box_other})
+    assert response.status_code == 400
+    response = client.post('/api/boxes/move', json={'box_ids': [box_one], 'section_id': section_other})
+    assert response.status_code == 400
+    assert layout(app, 'box', [box_one])[box_one] == task_ids
+    assert layout(app, 'section', [section_one])[section_one] == [box_one]
+
+
+def test_moves_reject_booleans_for_ids(app, client, make_sheet):
+    sheet_id = make_sheet(sections=1, boxes=2, tasks=2)
+    section_id = sections(app, sheet_id)[0]
+    first_box, second_box = layout(app, 'section', [section_id])[section_id]
+    task_ids = layout(app, 'box', [second_box])[second_box]
+    # JSON true would otherwise pass as the id 1, which is the first box and section here
+    assert first_box == section_id == 1
+
+    for payload in ({'task_ids': task_ids, 'box_id': True},
+                    {'task_ids': task_ids, 'box_id': first_box, 'position': True},
+                    {'task_ids': [True], 'box_id': first_box}):
+        assert client.post('/api/tasks/move', json=payload).status_code == 400
+    response = client.post('/api/boxes/move', json={'box_ids': [second_box], 'section_id': True, 'position': 1})
+    assert response.status_code == 400
+    assert layout(app, 'box', [second_box])[second_box] == task_ids
+    assert layout(app, 'section', [section_id])[section_id] == [first_box, second_box]
+
+
+def test_box_moves_respect_the_section_limit(app, client, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=ordering.MAX_BOXES, tasks=1)
+    first, second = sections(app, sheet_id)
+    full = layout(app, 'section', [first])[first]
+    incoming = layout(app, 'section', [second])[second][0]
+
+    response = client.post('/api/boxes/move', json={'box_ids': [incoming], 'section_id': first})
+    assert response.status_code == 400
+    assert str(ordering.MAX_BOXES) in response.get_json()['error']
+    assert layout(app, 'section', [first])[first] == full
+
+    # Moving within a full section is only a reorder
+    response = client.post('/api/boxes/move', json={'box_ids': [full[-1]], 'section_id': first, 'position': 1})
+    assert response.get_json()['sections'][str(first)] == [full[-1]] + full[:-1]
@@ -0,0 +1,64 @@
+"""Read pages answer 304 until data they render changes, and only then."""
+from models import db, Sheet
+
+
+def etags(client, urls):
+    return {url: client.get(url).headers['ETag'] for url in urls}
+
+
+def pages(app, sheet_id):
+    with app.app_context():
+        sheet = db.session.get(Sheet, sheet_id)
+        urls = [f'/sheet/{sheet_id}', f'/chapter/{sheet.chapter_id}', f'/book/{sheet.chapter.book_id}']
+        return urls, sheet.chapter_id, sheet.sections[0].boxes[0].tasks[0].id
+
+
+def test_pages_answer_304_until_a_toggle(app, client, make_sheet):
+    urls, _, task_id = pages(app, make_sheet())
+    urls += ['/']
+    before = etags(client, urls)
+    for url in urls:
+        assert client.get(url, headers={'If-None-Match': before[url]}).status_code == 304
+
+    assert client.post(f'/api/task/{task_id}/toggle').status_code == 200
+    for url in urls:
+        response = client.get(url, headers={'If-None-Match': before[url]})
+        assert response.status_code == 200, url
+        assert response.headers['ETag'] != before[url]
+
+
+def test_toggle_keeps_other_sheets_cached(app, client, make_sheet):
+    first, second = make_sheet(), make_sheet()
+    first_pages, _, task_id = pages(app, first)
+    second_pages, _, _ = pages(app, second)
+    urls = first_pages + second_pages + ['/categories', '/']
+    before = etags(client, urls)
+
+    assert client.post(f'/api/task/{task_id}/toggle').status_code == 200
+    after = etags(client, urls)
+    changed = [url for url in urls if before[url] != after[url]]
+    # The dashboard shows every book's progress
+    assert changed == first_pages + ['/']
+
+    response = client.get(second_pages[0], headers={'If-None-Match': before[second_pages[0]]})
+    assert response.status_code == 304
+
+
+def test_rename_changes_descendant_breadcrumbs(app, client, make_sheet):
+    sheet_id = make_sheet()
+    urls, chapter_id, _ = pages(app, sheet_id)
+    before = etags(client, urls + ['/categories'])
+    client.post(f'/chapter/{chapter_id}/edit', data={'name': 'Renombrado', 'order': 1})
+    client.get('/')  # consume the flash, which bypasses the cache
+    after = etags(client, urls + ['/categories'])
+    assert [url for url in before if before[url] != after[url]] == urls
+    assert 'Renombrado' in client.get(urls[0]).text
+
+
+def test_edit_evicts_the_rendered_page(app, client, make_sheet):
+    sheet_id = make_sheet()
+    assert b'Hoja' in client.get(f'/sheet/{sheet_id}').data
+    client.post(f'/sheet/{sheet_id}/edit', data={'name': 'Renombrada', 'order': 1})
+    client.get('/')  # consume the flash, which bypasses the cache
+    body = client.get(f'/sheet/{sheet_id}').data
+    assert 'Renombrada'.encode() in body
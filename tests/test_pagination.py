@@ -0,0 +1,98 @@
+"""Keyset pagination of the listing pages."""
+import base64
+import json
+
+import pytest
+
+import pagination
+from models import db, Category, Book, Chapter
+
+JSON = {'Accept': 'application/json'}
+
+
+def cursor(values):
+    """Encode any JSON value the way encode_cursor would, valid or not."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+def categories(app):
+    with app.app_context():
+        db.session.add_all(Category(name=f'Categoría {n:02}') for n in range(pagination.PAGE_SIZE + 3))
+        db.session.commit()
+
+
+def test_pages_continue_after_the_cursor(app, client, categories):
+    with app.app_context():
+        first_page, next_cursor = pagination.page(db.select(Category), [Category.name, Category.id])
+        second_page, last_cursor = pagination.page(db.select(Category), [Category.name, Category.id], next_cursor)
+    assert len(first_page) == pagination.PAGE_SIZE and len(second_page) == 3
+    assert next_cursor == pagination.encode_cursor([first_page[-1].name, first_page[-1].id])
+    assert last_cursor is None
+
+    html = client.get('/categories', query_string={'after': next_cursor}).get_data(as_text=True)
+    assert 'Categoría 26' in html and 'Categoría 00' not in html
+
+
+def test_load_more_answers_json(app, client, categories):
+    html = client.get('/categories').get_data(as_text=True)
+    assert 'Categoría 23' in html and 'Categoría 24' not in html
+    with app.app_context():
+        last = db.session.execute(db.select(Category).filter_by(name='Categoría 23')).scalar_one()
+        after = pagination.encode_cursor([last.name, last.id])
+    data = client.get('/categories', query_string={'after': after}, headers=JSON).get_json()
+    assert 'Categoría 24' in data['html'] and 'Categoría 23' not in data['html']
+    assert data['next'] is None
+
+
+def test_chapters_page_by_order_then_id(app, client):
+    with app.app_context():
+        book = Book(name='Libro', category=Category(name='Categoría'))
+        db.session.add_all(Chapter(name=f'Capítulo {n}', book=book, order=n % 3)
+                           for n in range(pagination.PAGE_SIZE + 5))
+        db.session.commit()
+        book_id = book.id
+        seen, cursor = [], None
+        while True:
+            chapters, cursor = pagination.page(db.select(Chapter).where(Chapter.book_id == book_id),
+                                               [Chapter.order, Chapter.id], cursor)
+            seen += [(chapter.order, chapter.id) for chapter in chapters]
+            if cursor is None:
+                break
+    assert seen == sorted(seen) and len(seen) == len(set(seen)) == pagination.PAGE_SIZE + 5
+    assert client.get(f'/book/{book_id}').status_code == 200
+
+
+def test_chapters_without_an_order_sort_as_zero(app, client):
+    with app.app_context():
+        book = Book(name='Libro', category=Category(name='Categoría'))
+        db.session.add_all(Chapter(name=f'Capítulo {n}', book=book, order=None if n % 2 else 1)
+                           for n in range(pagination.PAGE_SIZE + 5))
+        db.session.commit()
+        book_id = book.id
+        seen, after = [], None
+        while True:
+            chapters, after = pagination.page(db.select(Chapter).where(Chapter.book_id == book_id),
+                                               [Chapter.order, Chapter.id], after)
+            seen += [(chapter.order or 0, chapter.id) for chapter in chapters]
+            if after is not None:
+                assert None not in json.loads(base64.urlsafe_b64decode(after + '=' * (-len(after) % 4)))
+            else:
+                break
+    assert seen == sorted(seen) and len(seen) == len(set(seen)) == pagination.PAGE_SIZE + 5
+    assert client.get(f'/book/{book_id}', query_string={'after': cursor([None, 1])}).status_code == 400
+
+
+@pytest.mark.parametrize('after', [
+    'not base64 !',
+    cursor({'name': 'x'}),
+    cursor(['x']),
+    cursor(['x', 1, 2]),
+    cursor([['x'], 1]),
+    cursor(['x', {'id': 1}]),
+    cursor([1, 'x']),
+    cursor(['x', True]),
+    cursor([None, 1]),
+])
+def test_malformed_cursors_are_rejected(client, after):
+    assert client.get('/categories', query_string={'after': after}).status_code == 400
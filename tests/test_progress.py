@@ -0,0 +1,95 @@
+"""Per-learner progress bitsets and the migration of legacy task_progress rows."""
+from sqlalchemy import select, text
+
+from models import db, Learner, Task
+import learners
+import migrations
+import progress
+import snapshots
+
+
+def _task_ids(app):
+    with app.app_context():
+        return db.session.execute(select(Task.id).order_by(Task.id)).scalars().all()
+
+
+def _add_learner(app, name):
+    with app.app_context():
+        learner = Learner(name=name)
+        db.session.add(learner)
+        db.session.commit()
+        return learner.id
+
+
+def test_learners_keep_separate_progress(app, client, make_sheet):
+    sheet_id = make_sheet(1, 2, 3)
+    first, second, third = _task_ids(app)[:3]
+    ana = _add_learner(app, 'Ana')
+
+    assert client.post(f'/api/task/{first}/toggle').get_json()['completed'] is True
+    client.post(f'/learner/{ana}/select')
+    assert client.post(f'/api/task/{first}/toggle').get_json()['completed'] is True
+    assert client.post(f'/api/task/{second}/toggle').get_json()['completed'] is True
+    assert client.post(f'/api/task/{first}/toggle').get_json()['completed'] is False
+
+    with app.app_context():
+        default = learners.default_id()
+        tasks = db.session.execute(select(Task).where(Task.id.in_([first, second, third]))).scalars().all()
+        assert progress.completed_task_ids(default, sheet_id, tasks) == {first}
+        assert progress.completed_task_ids(ana, sheet_id, tasks) == {second}
+        assert progress.find_mismatches() == []
+
+
+def test_upgrade_moves_legacy_progress_to_the_default_learner(app, make_sheet):
+    sheet_id = make_sheet(2, 2, 2)
+    task_ids = _task_ids(app)
+    done = task_ids[1::3]
+    with app.app_context():
+        # Recreate a database from before learners: no bit columns, a task_progress table
+        db.session.execute(text('DELETE FROM sheet_progress'))
+        db.session.execute(text('ALTER TABLE tasks DROP COLUMN bit_index'))
+        db.session.execute(text('ALTER TABLE sheets DROP COLUMN next_bit'))
+        db.session.execute(text(
+            'CREATE TABLE task_progress (task_id INTEGER PRIMARY KEY, completed BOOLEAN NOT NULL)'))
+        db.session.execute(text('INSERT INTO task_progress VALUES (:task_id, :completed)'),
+                           [{'task_id': id_, 'completed': id_ in done} for id_ in task_ids])
+        db.session.commit()
+
+    with app.app_context():
+        applied = migrations.upgrade()
+        assert ('tasks', 'bit_index') in applied
+
+        tasks = db.session.execute(select(Task).order_by(Task.id)).scalars().all()
+        assert [task.bit_index for task in tasks] == list(range(len(tasks)))
+        assert progress.completed_task_ids(learners.default_id(), sheet_id, tasks) == set(done)
+        assert progress.find_mismatches() == []
+
+    with app.app_context():
+        assert migrations.upgrade() == []
+
+
+def test_tasks_without_a_bit_get_one_when_ticked(app, client, make_sheet):
+    sheet_id = make_sheet(1, 1, 3)
+    first, second, third = _task_ids(app)
+    with app.app_context():
+        # Rows written around the app, e.g. by a script, have no bit_index
+        db.session.execute(text('UPDATE tasks SET bit_index = NULL WHERE id IN (:a, :b)'),
+                           {'a': first, 'b': second})
+        db.session.commit()
+
+    export = client.get(f'/sheet/{sheet_id}/export?progress=1').get_data(as_text=True)
+    assert [line.rsplit(',', 1)[1] for line in export.splitlines()[1:]] == ['0', '0', '0']
+
+    response = client.post(f'/api/task/{first}/toggle')
+    assert response.status_code == 200 and response.get_json()['completed'] is True
+    response = client.post('/api/tasks/progress', json={'task_ids': [second, third], 'completed': True})
+    assert response.status_code == 200
+    assert response.get_json()['sheet_progress'][str(sheet_id)]['completed'] == 3
+
+    with app.app_context():
+        tasks = db.session.execute(select(Task).order_by(Task.id)).scalars().all()
+        assert sorted(task.bit_index for task in tasks) == [2, 3, 4]
+        assert progress.completed_task_ids(learners.default_id(), sheet_id, tasks) == {first, second, third}
+        assert progress.find_mismatches() == []
+        assert snapshots.find_stale() == []
+    assert client.get(f'/sheet/{sheet_id}').get_data(as_text=True).count(' checked>') == 3
@@ -0,0 +1,64 @@
+"""The sheet tree loads in a fixed number of statements, however large the sheet."""
+from models import db
+import queries
+
+from conftest import count_statements
+
+
+def walk(sections):
+    """Touch every attribute sheet.html and the API serializers read."""
+    for section in sections:
+        for note in section.notes:
+            note.content_markdown
+        for box in section.boxes:
+            for task in box.tasks:
+                task.task_text
+
+
+def tree_statements(app, sheet_id):
+    with app.app_context():
+        with count_statements() as statements:
+            sheet, sections = queries.load_sheet_tree(sheet_id)
+            sheet.chapter.book.name
+            walk(sections)
+        db.session.remove()
+    return len(statements)
+
+
+def test_load_sheet_tree_is_bounded(app, make_sheet):
+    small = make_sheet(sections=1, boxes=1, tasks=1, notes=1)
+    large = make_sheet(sections=5, boxes=25, tasks=12, notes=3)
+    # BEGIN, then the sheet with its breadcrumb, sections, boxes, tasks and notes
+    assert tree_statements(app, small) == tree_statements(app, large) <= 6
+
+
+def test_load_section_and_box_are_bounded(app, make_sheet):
+    counts = []
+    for size in (1, 25):
+        sheet_id = make_sheet(sections=1, boxes=size, tasks=size, notes=size)
+        with app.app_context():
+            section_id = queries.load_sheet_tree(sheet_id)[1][0].id
+            db.session.remove()
+            with count_statements() as statements:
+                section = queries.load_section(section_id)
+                walk([section])
+                box = queries.load_box(section.boxes[0].id)
+                box.section.level_name
+                [task.task_text for task in box.tasks]
+            db.session.remove()
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_sheet_views_are_bounded(app, client, make_sheet):
+    small = make_sheet(sections=1, boxes=1, tasks=1, notes=1)
+    large = make_sheet(sections=5, boxes=25, tasks=12, notes=3)
+    # The first request of a process also resumes background imports
+    client.get('/')
+    for url in ('/sheet/{}', '/api/sheet/{}'):
+        counts = []
+        for sheet_id in (small, large):
+            with app.app_context(), count_statements() as statements:
+                assert client.get(url.format(sheet_id)).status_code == 200
+            counts.append(len(statements))
+        assert counts[0] == counts[1], url
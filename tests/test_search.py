@@ -0,0 +1,104 @@
+"""Full-text search: index maintenance, query escaping, highlighting and breadcrumbs."""
+import pytest
+
+from models import db, Sheet
+import search
+
+
+def hits(client, q):
+    results = client.get('/api/search', query_string={'q': q}).get_json()['results']
+    return {(result['kind'], result['id']) for result in results}
+
+
+def first_ids(app, sheet_id):
+    with app.app_context():
+        section = db.session.get(Sheet, sheet_id).sections[0]
+        box = section.boxes[0]
+        return section.id, box.id, box.tasks[0].id
+
+
+def test_index_follows_task_edits(app, client, make_sheet):
+    sheet_id = make_sheet()
+    _, box_id, task_id = first_ids(app, sheet_id)
+    assert ('task', task_id) in hits(client, 'Tarea')
+
+    client.post(f'/box/{box_id}/task/new', data={'task_text': 'Configure iptables'})
+    new_ids = {id_ for kind, id_ in hits(client, 'iptables') if kind == 'task'}
+    assert len(new_ids) == 1
+
+    client.post(f'/task/{task_id}/edit', data={'task_text': 'Revise journalctl'})
+    assert ('task', task_id) in hits(client, 'journalctl')
+    assert ('task', task_id) not in hits(client, 'Tarea')
+
+    client.post(f'/task/{task_id}/delete')
+    assert hits(client, 'journalctl') == set()
+
+
+def test_index_follows_boxes_sections_and_notes(app, client, make_sheet):
+    sheet_id = make_sheet()
+    section_id, box_id, _ = first_ids(app, sheet_id)
+    client.post(f'/box/{box_id}/edit', data={'box_title': 'Llaves rsync'})
+    client.post(f'/section/{section_id}/edit', data={'level_name': 'Nivel Experto'})
+    client.post(f'/section/{section_id}/note/new', data={'content_markdown': 'Usar **openssl** aquí'})
+    assert hits(client, 'rsync') == {('box', box_id)}
+    assert hits(client, 'experto') == {('section', section_id)}
+    assert [kind for kind, _ in hits(client, 'openssl')] == ['note']
+
+    client.post(f'/section/{section_id}/delete')
+    for q in ('rsync', 'experto', 'openssl', 'Tarea'):
+        assert hits(client, q) == set(), q
+
+
+def test_index_follows_imports_and_sheet_deletes(app, client, make_sheet):
+    sheet_id = make_sheet()
+    csv_text = 'level,section_order,box_number,box_title,task_order,task_text\nNivel 1,1,2,Red,1,Ejecute dig\n'
+    client.post(f'/sheet/{sheet_id}/import', data={'csv_text': csv_text})
+    assert {kind for kind, _ in hits(client, 'dig')} == {'task'}
+    assert {kind for kind, _ in hits(client, 'Red')} == {'box'}
+
+    client.post(f'/sheet/{sheet_id}/delete')
+    assert hits(client, 'dig') == hits(client, 'Tarea') == set()
+
+
+@pytest.mark.parametrize('q, expression', [
+    ('ssh', '"ssh"*'),
+    ('ssh -p 22', '"ssh" "p" "22"*'),
+    ('say "hi', '"say" "hi"*'),
+    ('chmod*', '"chmod"*'),
+    ('ssh NEAR scp', '"ssh" "NEAR" "scp"*'),
+    ('-', None),
+    ('"*"', None),
+])
+def test_match_expression_quotes_every_word(q, expression):
+    assert search._match_expression(q) == expression
+
+
+@pytest.mark.parametrize('q', ['-', '"', 'a"b', 'NEAR(', 'OR', 'ssh AND', '*', 'col:x'])
+def test_operator_characters_never_fail(client, make_sheet, q):
+    make_sheet()
+    assert client.get('/api/search', query_string={'q': q}).status_code == 200
+    assert client.get('/search', query_string={'q': q}).status_code == 200
+
+
+def test_snippets_are_escaped_and_highlighted(app, client, make_sheet):
+    sheet_id = make_sheet()
+    _, _, task_id = first_ids(app, sheet_id)
+    client.post(f'/task/{task_id}/edit', data={'task_text': 'Use <b>grep</b> & awk'})
+    [result] = client.get('/api/search?q=grep').get_json()['results']
+    assert result['snippet'] == 'Use &lt;b&gt;<mark>grep</mark>&lt;/b&gt; &amp; awk'
+
+
+def test_results_carry_breadcrumbs(app, client, make_sheet):
+    sheet_id = make_sheet()
+    with app.app_context():
+        sheet = db.session.get(Sheet, sheet_id)
+        chapter_id, book_id = sheet.chapter_id, sheet.chapter.book_id
+    [result] = client.get('/api/search?q=Tarea').get_json()['results']
+    assert result['breadcrumb'] == {
+        'book': {'id': book_id, 'name': 'Libro'},
+        'chapter': {'id': chapter_id, 'name': 'Capítulo'},
+        'sheet': {'id': sheet_id, 'name': 'Hoja'},
+    }
+    assert result['url'] == f'/sheet/{sheet_id}'
+    page = client.get('/search?q=Tarea').get_data(as_text=True)
+    assert 'Libro' in page and 'Capítulo' in page and '<mark>Tarea</mark>' in page
@@ -0,0 +1,111 @@
+"""Precomputed sheet snapshots stay in step with the tables they are built from."""
+from sqlalchemy import select
+
+from conftest import count_statements
+from models import db, Sheet, Section, Box, Task, SheetSnapshot
+import snapshots
+
+JSON = {'Accept': 'application/json'}
+
+
+def built_at(app, sheet_id):
+    with app.app_context():
+        return db.session.execute(
+            select(SheetSnapshot.built_at).where(SheetSnapshot.sheet_id == sheet_id)).scalar()
+
+
+def first(app, model):
+    with app.app_context():
+        return db.session.execute(select(model.id).order_by(model.id)).scalars().first()
+
+
+def test_writes_keep_snapshots_current(app, client, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=2, tasks=2, notes=1)
+    section_id, box_id, task_id = first(app, Section), first(app, Box), first(app, Task)
+    with app.app_context():
+        chapter_id = db.session.get(Sheet, sheet_id).chapter_id
+        assert snapshots.find_stale() == []
+
+    client.post(f'/task/{task_id}/edit', data={'task_text': 'Editada'}, headers=JSON)
+    client.post(f'/section/{section_id}/box/new', data={'box_title': 'Nuevo'}, headers=JSON)
+    client.post(f'/chapter/{chapter_id}/edit', data={'name': 'Renombrado', 'order': 1})
+    with app.app_context():
+        task_ids = [task.id for task in db.session.get(Box, box_id).tasks]
+    client.post(f'/api/box/{box_id}/reorder', json={'ids': task_ids[::-1]})
+    with app.app_context():
+        assert snapshots.find_stale() == []
+        snapshot = snapshots.load(sheet_id)
+    assert snapshot.sheet.chapter.name == 'Renombrado'
+    assert [task.id for task in snapshot.sections[0].boxes[0].tasks] == task_ids[::-1]
+    assert 'Editada' in client.get(f'/sheet/{sheet_id}').get_data(as_text=True)
+
+
+def test_ticking_does_not_rebuild(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    before = built_at(app, sheet_id)
+    client.post(f'/api/task/{first(app, Task)}/toggle')
+    assert built_at(app, sheet_id) == before
+    assert 'checked' in client.get(f'/sheet/{sheet_id}').get_data(as_text=True)
+
+
+def test_sheet_view_reads_two_rows(app, client, make_sheet):
+    sheet_id = make_sheet(sections=3, boxes=5, tasks=4, notes=2)
+    client.get('/')
+    with app.app_context(), count_statements() as statements:
+        assert client.get(f'/sheet/{sheet_id}').status_code == 200
+    reads = [s for s in statements if 'sheet_snapshots' in s or 'sheet_progress' in s]
+    assert len(reads) == 2
+
+
+def test_missing_snapshot_is_built_in_memory(app, client, make_sheet):
+    sheet_id = make_sheet(tasks=2)
+    with app.app_context():
+        db.session.query(SheetSnapshot).delete()
+        db.session.commit()
+        assert snapshots.find_stale() == [(sheet_id, 'missing')]
+    assert 'Tarea 1.1.2' in client.get(f'/sheet/{sheet_id}').get_data(as_text=True)
+    assert built_at(app, sheet_id) is None
+
+    result = app.test_cli_runner().invoke(args=['snapshots', 'rebuild'])
+    assert result.exit_code == 0
+    assert built_at(app, sheet_id) is not None
+
+
+def test_sheet_delete_removes_snapshot(app, client, make_sheet):
+    sheet_id = make_sheet()
+    client.post(f'/sheet/{sheet_id}/delete')
+    with app.app_context():
+        assert db.session.query(SheetSnapshot).count() == 0
+
+
+def test_large_sheet_snapshot(app, client, make_sheet):
+    # Bit indexes past ~14k make the section masks longer than json's 4300-digit limit for ints
+    sheet_id = make_sheet(sections=1, boxes=25, tasks=600)
+    with app.app_context():
+        assert snapshots.find_stale() == []
+        task_id = db.session.get(Sheet, sheet_id).sections[0].boxes[-1].tasks[-1].id
+    response = client.post(f'/api/task/{task_id}/toggle')
+    assert response.status_code == 200
+    assert response.json['global_progress'] == {'completed': 1, 'total': 15000, 'percent': 0}
+    assert client.get(f'/sheet/{sheet_id}').status_code == 200
+    client.post(f'/task/{task_id}/edit', data={'task_text': 'Editada'})
+    with app.app_context():
+        assert snapshots.find_stale() == []
+
+
+def test_progress_rebuild_refreshes_snapshots(app, make_sheet):
+    sheet_id = make_sheet(sections=2, boxes=2, tasks=3)
+    with app.app_context():
+        db.session.execute(db.update(Sheet).where(Sheet.id == sheet_id).values(total_tasks=99))
+        db.session.execute(db.update(Section).where(Section.sheet_id == sheet_id).values(total_tasks=50))
+        snapshots.store([sheet_id])
+        db.session.commit()
+        assert snapshots.load(sheet_id).sheet.total_tasks == 99
+
+    result = app.test_cli_runner().invoke(args=['progress', 'rebuild'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert snapshots.find_stale() == []
+        snapshot = snapshots.load(sheet_id)
+        assert snapshot.sheet.total_tasks == 12
+        assert [section.total_tasks for section in snapshot.sections] == [6, 6]
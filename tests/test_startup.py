@@ -0,0 +1,38 @@
+"""create_app builds an app without touching the database; init-db is explicit and idempotent."""
+import subprocess
+import sys
+
+from conftest import ROOT
+from app import create_app, init_db
+from models import db
+
+
+def test_create_app_has_no_side_effects(tmp_path):
+    path = tmp_path / 'learnboard.db'
+    create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    assert not path.exists()
+
+
+def test_create_app_defers_markdown_import():
+    code = 'import sys, app; app.create_app(); print("markdown" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+def test_in_memory_database():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    with app.app_context():
+        init_db()
+    assert app.test_client().get('/').status_code == 200
+
+
+def test_init_db_command_is_idempotent(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "learnboard.db"}'})
+    runner = app.test_cli_runner()
+    first = runner.invoke(args=['init-db'])
+    second = runner.invoke(args=['init-db'])
+    assert first.exit_code == 0 and second.exit_code == 0
+    assert second.output == 'Database is up to date\n'
+    with app.app_context():
+        assert db.inspect(db.engine).has_table('sheets')
+        db.engine.dispose()